@@ -0,0 +1,386 @@
+"""Benchmarks for reading boards, run with
+
+    python benchmarks/run.py
+    python benchmarks/run.py --output results.jsonl --compare baseline.jsonl
+    python benchmarks/run.py --filter detection
+
+Every benchmark reads synthetic boards drawn from a fixed seed, so results from different
+commits measure the same work. Each result has the median seconds per run, boards per
+second, and the peak memory allocated while reading one board. With --output, one JSON
+line per benchmark is appended along with the commit and library versions, and with
+--compare, each result is printed next to the matching one in an older results file.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import goban_irl.opencv_utilities as utils  # noqa: E402
+
+from goban_irl.board import Board  # noqa: E402
+from goban_irl.board_set import BoardSet  # noqa: E402
+from goban_irl.frame_buffer import FrameBuffer  # noqa: E402
+from goban_irl.frame_source import ScreenSource  # noqa: E402
+from goban_irl.timing import timings  # noqa: E402
+from goban_irl.ui import PairReader  # noqa: E402
+
+SIZE = 19
+STEP = 80
+MARGIN = 120
+SEED = 19
+
+
+def draw_board(rng, stones=60):
+    """A square virtual style board and the state it shows"""
+    width = STEP * (SIZE - 1)
+    image = np.full((width + 2 * MARGIN, width + 2 * MARGIN, 3), 40, np.uint8)
+    image[MARGIN : MARGIN + width, MARGIN : MARGIN + width] = (90, 170, 220)
+    for index in range(SIZE):
+        position = MARGIN + index * STEP
+        cv2.line(image, (MARGIN, position), (MARGIN + width, position), (30, 30, 30), 2)
+        cv2.line(image, (position, MARGIN), (position, MARGIN + width), (30, 30, 30), 2)
+
+    state = np.zeros((SIZE, SIZE), np.int8)
+    cells = rng.choice(SIZE * SIZE, stones, replace=False)
+    for number, cell in enumerate(cells):
+        i, j = divmod(int(cell), SIZE)
+        state[i, j] = 1 if number % 2 else -1
+        colour = (240, 240, 240) if state[i, j] == 1 else (20, 20, 20)
+        center = (MARGIN + j * STEP, MARGIN + i * STEP)
+        cv2.circle(image, center, STEP // 2 - 4, colour, -1)
+
+    noise = rng.normal(0, 4, image.shape)
+    image = np.clip(image + noise, 0, 255).astype(np.uint8)
+    corners = [(MARGIN, MARGIN), (MARGIN + width, MARGIN + width)]
+    return image, corners, state
+
+
+def play_stone(image, state):
+    """The image with a black stone drawn on the first empty point"""
+    i, j = np.argwhere(state == 0)[0].tolist()
+    center = (MARGIN + j * STEP, MARGIN + i * STEP)
+    return cv2.circle(image.copy(), center, STEP // 2 - 4, (20, 20, 20), -1)
+
+
+def tilt_board(image, corners):
+    """The board seen at an angle, like a webcam, and its four corners"""
+    (xmin, ymin), (xmax, ymax) = corners
+    height, width = image.shape[:2]
+    source = np.float32([(xmin, ymin), (xmax, ymin), (xmin, ymax), (xmax, ymax)])
+    tilted = np.float32(
+        [
+            (xmin + 200, ymin + 150),
+            (xmax - 200, ymin + 150),
+            (xmin, ymax),
+            (xmax, ymax),
+        ]
+    )
+    matrix = cv2.getPerspectiveTransform(source, tilted)
+    warped = cv2.warpPerspective(image, matrix, (width, height))
+    return warped, [tuple(int(value) for value in corner) for corner in tilted]
+
+
+class MockScreen:
+    """Stands in for mss, serving the latest synthetic frame"""
+
+    def __init__(self, image):
+        self.image = image
+        height, width, _ = image.shape
+        self.monitors = [None, {"left": 0, "top": 0, "width": width, "height": height}]
+
+    def grab(self, monitor):
+        left, top = monitor["left"], monitor["top"]
+        return self.image[top : top + monitor["height"], left : left + monitor["width"]]
+
+
+def make_inputs():
+    rng = np.random.default_rng(SEED)
+    image, corners, state = draw_board(rng)
+    other_image, _, other_state = draw_board(rng)
+    tilted, tilted_corners = tilt_board(image, corners)
+    played = play_stone(image, state)
+    return {
+        "image": image,
+        "corners": corners,
+        "state": state,
+        "other_image": other_image,
+        "other_state": other_state,
+        "tilted": tilted,
+        "tilted_corners": tilted_corners,
+        "played": played,
+        "played_tilted": tilt_board(played, corners)[0],
+    }
+
+
+def labelled_points(state, count=10):
+    points = []
+    for value in [-1, 1, 0]:
+        rows, columns = np.nonzero(state == value)
+        points.append(list(zip(rows.tolist(), columns.tolist()))[:count])
+    return points
+
+
+def benchmarks(inputs, stack):
+    """Each benchmark's name, function, and number of boards it reads per run"""
+    image, corners = inputs["image"], inputs["corners"]
+    tilted, tilted_corners = inputs["tilted"], inputs["tilted_corners"]
+    board = Board(image, corners)
+    other_board = Board(inputs["other_image"], corners)
+    black_stones, white_stones, empty_spaces = labelled_points(inputs["state"])
+
+    cases = [
+        ("board_2_corners", lambda: Board(image, corners), 1),
+        ("board_4_corners", lambda: Board(tilted, tilted_corners), 1),
+        (
+            "board_4_corners_sampled",
+            lambda: Board(tilted, tilted_corners, samples_per_cell=6),
+            1,
+        ),
+    ]
+    for function in utils.DETECTION_FUNCTIONS:
+        cases.append(
+            (
+                "detection_{}".format(function.__name__),
+                lambda function=function: Board(
+                    image, corners, detection_function=function
+                ),
+                1,
+            )
+        )
+    cases += [
+        (
+            "calibrate",
+            lambda: _quietly(board.calibrate, black_stones, white_stones, empty_spaces),
+            1,
+        ),
+        ("compare_to", lambda: board.compare_to(other_board), 1),
+        ("update_unchanged", lambda: board.update(image), 1),
+        (
+            "update_changed",
+            _alternate_update(Board(image, corners), [inputs["other_image"], image]),
+            1,
+        ),
+        (
+            "update_one_stone",
+            _alternate_update(Board(image, corners), [inputs["played"], image]),
+            1,
+        ),
+        (
+            "update_one_stone_4_corners",
+            _alternate_update(
+                Board(tilted, tilted_corners), [inputs["played_tilted"], tilted]
+            ),
+            1,
+        ),
+    ]
+
+    frame = np.concatenate([image, inputs["other_image"]], axis=1)
+    width = image.shape[1]
+    configs = [
+        {"corners": corners},
+        {"corners": [(x + width, y) for x, y in corners]},
+    ]
+    cases.append(("board_set_2_boards", _board_set(frame, configs), 2))
+    cases.append(("boards_2_separate", _separate_boards(frame, configs), 2))
+
+    # One board read for both players, so the second sees it turned around
+    configs = [{"corners": corners}, {"corners": corners, "flip": True}]
+    cases.append(("board_set_2_overlapping", _board_set(image, configs), 2))
+    cases.append(("boards_2_overlapping_separate", _separate_boards(image, configs), 2))
+
+    frame = np.concatenate([tilted, tilted], axis=1)
+    width = tilted.shape[1]
+    configs = [
+        {"corners": [(x + offset, y) for x, y in tilted_corners], "samples_per_cell": 6}
+        for offset in [0, width]
+    ]
+    cases.append(("board_set_2_sampled", _board_set(frame, configs), 2))
+    cases.append(("boards_2_sampled_separate", _separate_boards(frame, configs), 2))
+    cases.append(("watch_iteration", _watch_iteration(inputs, stack), 2))
+    return cases
+
+
+def _quietly(function, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args)
+
+
+def _board_set(image, configs):
+    board_set = BoardSet(configs)
+    return lambda: board_set.scan(image)
+
+
+def _separate_boards(image, configs):
+    """Read each board of a frame on its own, to compare with a BoardSet"""
+    return lambda: [Board(image, **config) for config in configs]
+
+
+def _alternate_update(board, images):
+    """Update a board with each image in turn, so every update re-detects stones"""
+    tick = [0]
+
+    def update():
+        tick[0] += 1
+        return board.update(images[tick[0] % 2])
+
+    return update
+
+
+def _watch_iteration(inputs, stack):
+    """One tick of the watch loop for two virtual boards with a mocked screen.
+
+    Each frame goes through a FrameBuffer and is read by ui.PairReader, as in
+    ui.watch_pair, so change detection, in place updates, the CutoffTrackers and the
+    TemporalFilters are all part of the tick. The second board alternates between two
+    positions so every tick does real work.
+    """
+    image, corners = inputs["image"], inputs["corners"]
+    frames = [
+        np.concatenate([image, image], axis=1),
+        np.concatenate([image, inputs["other_image"]], axis=1),
+    ]
+    width = image.shape[1]
+    screen = MockScreen(frames[0])
+    screen_source = ScreenSource(screen, margin=0)
+    metadata = []
+    for board_corners in [corners, [(x + width, y) for x, y in corners]]:
+        screen_source.add(board_corners)
+        metadata.append(
+            {
+                "loader_type": "virtual",
+                "corners": board_corners,
+                "detection_function": "check_bgr_blue",
+                "cutoffs": [70, 150],
+                "flip": False,
+                "adapt_cutoffs": True,
+            }
+        )
+    screen_buffer = stack.enter_context(FrameBuffer(screen_source.capture().shape))
+    reader = PairReader(*metadata, screen_source=screen_source)
+    tick = [0]
+
+    def iteration():
+        tick[0] += 1
+        screen.image = frames[tick[0] % 2]
+        screen_buffer.write(screen_source.capture())
+        _, frame = screen_buffer.latest()
+        return reader.read(frame)
+
+    return iteration
+
+
+def measure(function, boards, repeat, minimum_seconds):
+    function()
+    runs = []
+    start = time.perf_counter()
+    while len(runs) < repeat or time.perf_counter() - start < minimum_seconds:
+        run_start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - run_start)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(runs)
+    return {
+        "runs": len(runs),
+        "median_seconds": median,
+        "min_seconds": min(runs),
+        "boards_per_second": boards / median,
+        "peak_kb_per_board": peak / 1024 / boards,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+    }
+
+
+def load_results(path):
+    results = {}
+    with open(path) as f:
+        for line in f:
+            result = json.loads(line)
+            results[result["name"]] = result
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="Only run names containing this")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Fewest runs per benchmark"
+    )
+    parser.add_argument(
+        "--seconds", type=float, default=1, help="Least time spent per benchmark"
+    )
+    parser.add_argument("--output", help="Append results to this JSON lines file")
+    parser.add_argument("--compare", help="Print speedups against this results file")
+    args = parser.parse_args(argv)
+
+    timings.enabled = False
+    info = environment()
+    baseline = load_results(args.compare) if args.compare else {}
+    print(
+        "{:<42}{:>12}{:>14}{:>14}{:>10}".format(
+            "benchmark", "ms", "boards/s", "kB/board", "speedup"
+        )
+    )
+    with contextlib.ExitStack() as stack:
+        for name, function, boards in benchmarks(make_inputs(), stack):
+            if args.filter not in name:
+                continue
+            result = {"name": name}
+            result.update(measure(function, boards, args.repeat, args.seconds))
+            result.update(info)
+
+            speedup = ""
+            if name in baseline:
+                speedup = "{:.2f}x".format(
+                    baseline[name]["median_seconds"] / result["median_seconds"]
+                )
+            print(
+                "{:<42}{:>12.3f}{:>14.1f}{:>14.1f}{:>10}".format(
+                    name,
+                    result["median_seconds"] * 1000,
+                    result["boards_per_second"],
+                    result["peak_kb_per_board"],
+                    speedup,
+                )
+            )
+            if args.output:
+                with open(args.output, "a") as f:
+                    f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,34 @@
+import cv2
+import numpy as np
+
 import goban_irl.opencv_utilities as utils
 
+from goban_irl.calibration import (
+    baseline_correction,
+    find_best_detection,
+    measure_baseline,
+)
+from goban_irl.geometry import (
+    get_board_geometry,
+    get_intersections,
+    get_stone_subimage_boundaries,
+    sort_corners,
+)
+from goban_irl.integral_image import IntegralImage
+from goban_irl.state import (
+    BLACK,
+    EMPTY,
+    STONES,
+    WHITE,
+    StateView,
+    diff,
+    to_array,
+)
+from goban_irl.timing import timings
+
+# Samples along each side of a stone subimage that update compares between frames
+CHANGE_SAMPLES = 4
+
 
 class Board:
     def __init__(
@@ -10,6 +39,11 @@ class Board:
         cutoffs=None,
         flip=False,
         debug=False,
+        samples_per_cell=None,
+        offset=(0, 0),
+        size=19,
+        detection_inputs=None,
+        baseline=None,
     ):
         """Create a digital representation of a go board from an image
 
@@ -20,13 +54,28 @@ class Board:
             cutoffs (tuple[int, int]): Values to partition between black, empty, and white.
             flip (bool): Whether or not to flip the board. This is useful when the camera is opposite the person.
             debug (bool): Enables debug mode which shows detected corners, detected stones.
+            samples_per_cell (int): If given, detect stones from a samples_per_cell x samples_per_cell grid of samples per stone taken straight from the image instead of from the full board_subimage. Detection values are close to, but not exactly, the full image values, and get closer as samples_per_cell grows.
+            offset (tuple[int, int]): Where the top left of the image is in a larger screenshot, for images that are only part of the screen. Used to click on the board.
+            size (int): The number of lines on the board, usually 9, 13, or 19.
+            detection_inputs (tuple): An (image, boundaries, IntegralImage) to detect stones from instead of building them from image. BoardSet uses this to share one frame between boards.
+            baseline (dict[str, array]): Each detection function's size x size values on a photo of the empty board in image order, from measure_baseline. If given, positions are read relative to it so uneven light matters less.
 
         Attributes:
+            geometry (BoardGeometry): The cached intersections and boundaries for these corners and image size.
             corners (list[tuple[int, int]]): The sorted corners which define a board_subimage.
-            board_subimage (opencv image): An opencv image whose corners are the playable corners of the board.
-            intersections: A 19x19 array of intersections on the board_subimage.
-            stone_subimage_boundaries: A 19x19 array defining the x and y mins and maxes for a stone subimage.
-            state: A 19x19 array whose entries are white, black, or empty.
+            offset (tuple[int, int]): Where the top left of the image is in a larger screenshot.
+            size (int): The number of lines on the board.
+            board_subimage (opencv image): An opencv image whose corners are the playable corners of the board. Built the first time it is used.
+            integral_image (IntegralImage): Summed-area tables of the board_subimage shared by detection and calibration.
+            detection_function (function: opencv image -> int): The detection function used for state.
+            cutoffs (tuple[int, int]): The cutoffs used for state.
+            intersections: A size x size array of intersections on the board_subimage.
+            stone_subimage_boundaries: A size x size array defining the x and y mins and maxes for a stone subimage.
+            state_array (np.ndarray): A size x size int8 array of BLACK, EMPTY, or WHITE from goban_irl.state.
+            deciding_values (np.ndarray): A size x size float array of the detection function value that decided each entry of state_array.
+            baseline (dict[str, array]): The empty board values, or None.
+            correction (np.ndarray): A size x size array in image order subtracted from detection function values, from the baseline, or None.
+            state (StateView): A size x size array whose entries are white, black, or empty. Reads and writes go to state_array.
 
 
         Example:
@@ -43,28 +92,60 @@ class Board:
             )
 
         """
+        self._image = None
+        self._board_subimage = None
+        self._integral_image = None
+        self._detection = None
+        self._cell_features = None
+        self.offset = offset
+        self.size = size
+        self.state_array = None
+        self.deciding_values = None
+        self.baseline = baseline
+        self.correction = None
+
         if image is not None:
             if isinstance(image, str):
                 image = utils.import_image(image)
 
-            self.corners = self._sort_corners(corners)
-
-            self.board_subimage = self.transform_image(image, self.corners)
-
-            self.intersections = self.get_intersections(self.board_subimage)
-            self.stone_subimage_boundaries = self.get_stone_subimage_boundaries(
-                self.board_subimage, self.intersections
-            )
+            self._image = image
+            self.geometry = get_board_geometry(corners, image.shape, size)
+            self.corners = self.geometry.corners
+
+            self.intersections = self.geometry.intersections
+            self.stone_subimage_boundaries = self.geometry.stone_subimage_boundaries
+
+            if detection_function is None:
+                detection_function = utils.check_bgr_blue
+            if cutoffs is None:
+                cutoffs = (70, 150)
+            self.detection_function = detection_function
+            self.cutoffs = cutoffs
+            self.flip = flip
+            self.samples_per_cell = samples_per_cell
+            self._detection = detection_inputs
+            if baseline is not None:
+                self.correction = baseline_correction(baseline, detection_function)
+                if self.correction.shape != (size, size):
+                    raise ValueError(
+                        "A {} board needs a {} x {} baseline.".format(size, size, size)
+                    )
 
-            self.state = self.find_state(
-                self.board_subimage,
-                self.stone_subimage_boundaries,
-                detection_function=detection_function,
-                cutoffs=cutoffs,
-            )
+            detection_image, boundaries, integral_image = self._detection_inputs()
+            with timings.stage("find_state"):
+                self.deciding_values = self.find_deciding_values(
+                    detection_image,
+                    boundaries,
+                    detection_function=detection_function,
+                    integral_image=integral_image,
+                )
+                if self.correction is not None:
+                    self.deciding_values -= self.correction
+                self.state_array = self._find_regions(self.deciding_values, cutoffs)
 
             if flip:
-                self.state = [row[::-1] for row in self.state[::-1]]
+                self.deciding_values = self.deciding_values[::-1, ::-1]
+                self.state_array = self.state_array[::-1, ::-1]
 
             if debug:
                 utils.show_intersections(self.board_subimage, self.intersections)
@@ -72,6 +153,205 @@ class Board:
                     self.board_subimage, self.stone_subimage_boundaries, self.state
                 )
 
+    @timings.timed("update")
+    def update(self, image, threshold=10):
+        """Re-detect only the stones whose part of the image changed since they were last detected.
+
+        Every stone subimage is summarised by the average of a few samples, see
+        `measure_cells`, and only stones whose average moved by more than threshold are
+        detected again. Their part of the board is the only part of the image that is
+        transformed, and the changed stones are scored together with the grid version
+        of the detection function. The rest of `state` is kept.
+
+        The image a Board was made from may have been reused by the time it is updated,
+        so the first update detects every stone again and measures them for the next.
+
+        Args:
+            image (str): The path to a new image of the board, or an opencv image.
+            threshold (float): The largest change in a stone subimage average colour to ignore.
+
+        Returns:
+            dirty_cells (list[tuple[int, int]]): The positions in `state` that were re-detected.
+        """
+        if isinstance(image, str):
+            image = utils.import_image(image)
+
+        previous_features = self._cell_features
+        previous_shape = self._image.shape
+
+        self._image = image
+        self._board_subimage = None
+        self._integral_image = None
+        self.geometry = get_board_geometry(self.corners, image.shape, self.size)
+        self.intersections = self.geometry.intersections
+        self.stone_subimage_boundaries = self.geometry.stone_subimage_boundaries
+        self._detection = None
+
+        sample_image, features = self.measure_cells(image)
+        if previous_features is None or image.shape != previous_shape:
+            changes = np.ones(features.shape[:2], dtype=bool)
+        else:
+            changes = np.abs(features - previous_features).max(axis=-1) > threshold
+            features[~changes] = previous_features[~changes]
+        self._cell_features = features
+
+        rows, columns = np.nonzero(changes)
+        if len(rows) == 0:
+            return []
+
+        region, boundaries = self._detection_region(rows, columns, sample_image)
+        deciding_values = self.find_deciding_values(
+            region,
+            boundaries[:, None],
+            detection_function=self.detection_function,
+        )[:, 0]
+        if self.correction is not None:
+            deciding_values -= self.correction[rows, columns]
+
+        if self.flip:
+            rows, columns = self.size - 1 - rows, self.size - 1 - columns
+        self.state_array[rows, columns] = self._find_regions(
+            deciding_values, self.cutoffs
+        )
+        self.deciding_values[rows, columns] = deciding_values
+        return list(zip(rows.tolist(), columns.tolist()))
+
+    @property
+    def state(self):
+        if self.state_array is None:
+            return None
+        return StateView(self.state_array)
+
+    @state.setter
+    def state(self, state):
+        self.state_array = to_array(state)
+
+    @property
+    def confidence(self):
+        """How far each deciding value is from the nearest cutoff, a size x size array like state_array"""
+        if self.deciding_values is None:
+            return None
+        min_cutoff, max_cutoff = self.cutoffs
+        return np.minimum(
+            np.abs(self.deciding_values - min_cutoff),
+            np.abs(self.deciding_values - max_cutoff),
+        )
+
+    def state_key(self):
+        """The state as size x size bytes, for hashing, deduplicating or saving board states"""
+        return self.state_array.tobytes()
+
+    def measure_cells(self, image):
+        """The samples and average colour of every stone subimage that update compares.
+
+        Boards with samples_per_cell use the samples they detect stones from, so a stone
+        is only left alone when what it is detected from barely changed. Other boards use
+        CHANGE_SAMPLES x CHANGE_SAMPLES samples per stone, which is cheap enough for
+        every frame.
+
+        Returns:
+            sample_image (opencv image): The samples of each stone tiled in board order.
+            features (np.ndarray): A (size, size, channels) array of the average of each stone.
+        """
+        samples_per_cell = self.samples_per_cell or CHANGE_SAMPLES
+        sample_image, _ = self.geometry.sample(image, samples_per_cell)
+        blocks = sample_image.reshape(
+            self.size, samples_per_cell, self.size, samples_per_cell, -1
+        )
+        return sample_image, blocks.mean(axis=(1, 3))
+
+    def measure_baseline(self):
+        """Every detection function's value at every position, for a photo of the empty board.
+
+        Save the result as the `baseline` of later Boards with the same corners, so each
+        position is read relative to how it looks empty.
+
+        Returns:
+            baseline (dict[str, np.ndarray]): A size x size array in image order per function name.
+        """
+        _, boundaries, integral_image = self._detection_inputs()
+        return measure_baseline(integral_image, boundaries)
+
+    def _baseline_corrections(self, rows, columns):
+        if self.baseline is None:
+            return None
+        return np.stack(
+            [
+                baseline_correction(self.baseline, function)[rows, columns]
+                for function in utils.DETECTION_FUNCTIONS
+            ],
+            axis=1,
+        )
+
+    def _detection_region(self, rows, columns, sample_image):
+        """The smallest part of the detection image holding some stone subimages.
+
+        Only that part is cropped or transformed from the image, with the same pixels the
+        whole detection image would have there. Boards with samples_per_cell crop it from
+        sample_image, from measure_cells.
+
+        Returns:
+            region (opencv image): The part of the detection image.
+            boundaries (np.ndarray): An (n, 4) array of the stone subimages in region.
+        """
+        if self.samples_per_cell is None:
+            boundaries = self.geometry.boundaries
+            height, width = self.geometry.height, self.geometry.width
+        else:
+            _, boundaries = self.geometry.sampler(self.samples_per_cell)
+            height = width = self.size * self.samples_per_cell
+
+        boundaries = boundaries[rows, columns].copy()
+        boundaries[:, :2] = boundaries[:, :2].clip(0, width)
+        boundaries[:, 2:] = boundaries[:, 2:].clip(0, height)
+        xmin, ymin = boundaries[:, [0, 2]].min(axis=0)
+        xmax, ymax = boundaries[:, [1, 3]].max(axis=0)
+
+        if self.samples_per_cell is not None:
+            region = utils.crop(sample_image, (xmin, xmax, ymin, ymax))
+        elif len(self.corners) == 2:
+            (x, y), _ = self.corners
+            region = utils.crop(self._image, (x + xmin, x + xmax, y + ymin, y + ymax))
+        else:
+            map_1, map_2 = (
+                np.ascontiguousarray(part[ymin:ymax, xmin:xmax])
+                for part in utils.get_warp_plan(self.corners).maps
+            )
+            region = cv2.remap(self._image, map_1, map_2, cv2.INTER_LINEAR)
+        return region, boundaries - (xmin, xmin, ymin, ymin)
+
+    def _detection_inputs(self):
+        if self._detection is None:
+            if self.samples_per_cell is None:
+                self._detection = (
+                    self.board_subimage,
+                    self.geometry.boundaries,
+                    self.integral_image,
+                )
+            else:
+                sample_image, sample_boundaries = self.geometry.sample(
+                    self._image, self.samples_per_cell
+                )
+                self._detection = (
+                    sample_image,
+                    sample_boundaries,
+                    IntegralImage(sample_image),
+                )
+        return self._detection
+
+    @property
+    def board_subimage(self):
+        if self._board_subimage is None and self._image is not None:
+            self._board_subimage = self.transform_image(self._image, self.corners)
+        return self._board_subimage
+
+    @property
+    def integral_image(self):
+        if self._integral_image is None and self.board_subimage is not None:
+            self._integral_image = IntegralImage(self.board_subimage)
+        return self._integral_image
+
+    @timings.timed("transform_image")
     def transform_image(self, image, corners):
         """Create a rectangular board from an opencv image and corner locations.
         Given two corners crop the board to the rectangle defined by those corners.
@@ -95,22 +375,16 @@ class Board:
         return board_subimage
 
     def get_intersections(self, image):
-        """Create a 19x19 evenly spaced array of points according to an image.
+        """Create a size x size evenly spaced array of points according to an image.
 
         Args:
             image (opencv image): A rectangle to be divided into equal parts.
 
         Returns:
-            intersections: A 19x19 array of integer (x, y) coordinates for each intersection.
+            intersections: A size x size array of integer (x, y) coordinates for each intersection.
         """
-        _, _, xstep, ystep = self._get_board_params(image)
-
-        x_locs = [round((ind * xstep)) for ind in range(19)]
-        y_locs = [round((ind * ystep)) for ind in range(19)]
-
-        intersections = [[(x_loc, y_loc) for x_loc in x_locs] for y_loc in y_locs]
-
-        return intersections
+        _, _, xstep, ystep = self._get_board_params(image, self.size)
+        return get_intersections(xstep, ystep, self.size)
 
     def get_stone_subimage_boundaries(self, image, intersections):
         """Partition the board into stone regions.
@@ -119,55 +393,84 @@ class Board:
 
         Args:
             image (opencv image): A rectangle to be divided into equal parts.
-            intersections: An evenly spaced 19x19 array of integer (x, y) coordinates for each intersection.
+            intersections: An evenly spaced size x size array of integer (x, y) coordinates for each intersection.
 
         Returns
-            list[list[(xmin, xmax, ymin, ymax)]: A 19x19 array defining the edges of each stone subimage.
+            list[list[(xmin, xmax, ymin, ymax)]: A size x size array defining the edges of each stone subimage.
         """
-        width, height, xstep, ystep = self._get_board_params(image)
-        boundaries = [[0 for _ in range(19)] for _ in range(19)]
-        for (i, j), loc in self._iterate(intersections):
-            xmin, ymin = (
-                max(0, int(loc[0] - xstep / 2)),
-                max(0, int(loc[1] - ystep / 2)),
-            )
-            xmax, ymax = (
-                int(min(loc[0] + xstep / 2, width)),
-                int(min(loc[1] + ystep / 2, height)),
-            )
-            boundaries[i][j] = xmin, xmax, ymin, ymax
-        return boundaries
+        width, height, xstep, ystep = self._get_board_params(image, self.size)
+        return get_stone_subimage_boundaries(width, height, xstep, ystep, intersections)
 
+    @timings.timed("find_state")
     def find_state(
         self,
         board_subimage,
         stone_subimage_boundaries,
         detection_function=None,
         cutoffs=None,
+        integral_image=None,
     ):
-        """Create a 19x19 array `state` filled with `empty`, `black` and `white`
+        """Create a size x size array `state` filled with `empty`, `black` and `white`
 
         Args:
             board_subimage (opencv image): A rectangular image whose corners are the 1-1 and 19-19 points on the board.
-            board_subimage_boundaries: A 19x19 array that define the corners of the stone subimage
+            board_subimage_boundaries: A size x size array that define the corners of the stone subimage
             detection_function (function: opencv image -> int): A function to detect stones from an image
             cutoffs (tuple[int, int]): Boundaries to make decisions for the detection function
+            integral_image (IntegralImage): Summed-area tables of board_subimage. If None, build new ones.
 
         Returns:
-            state: A 19x19 array of `empty`, `black`, and `white` corresponding to the image and detection function
+            state (StateView): A size x size array of `empty`, `black`, and `white` corresponding to the image and detection function
         """
+        if cutoffs is None:
+            cutoffs = (70, 150)
+        deciding_values = self.find_deciding_values(
+            board_subimage,
+            stone_subimage_boundaries,
+            detection_function=detection_function,
+            integral_image=integral_image,
+        )
+        return StateView(self._find_regions(deciding_values, cutoffs))
+
+    def find_deciding_values(
+        self,
+        board_subimage,
+        stone_subimage_boundaries,
+        detection_function=None,
+        integral_image=None,
+    ):
+        """Evaluate the detection function on every stone subimage.
+
+        Detection functions from opencv_utilities are evaluated for the whole board at once
+        with their grid versions on an IntegralImage. Any other function is run on each stone
+        subimage in turn.
 
-        state = [["empty" for _ in range(19)] for _ in range(19)]
+        Args:
+            board_subimage (opencv image): A rectangular image whose corners are the 1-1 and 19-19 points on the board.
+            board_subimage_boundaries: A size x size array that define the corners of the stone subimage
+            detection_function (function: opencv image -> int): A function to detect stones from an image
+            integral_image (IntegralImage): Summed-area tables of board_subimage. If None, build new ones.
+
+        Returns:
+            deciding_values (np.ndarray): A size x size float array of detection function values.
+        """
+        if detection_function is None:
+            detection_function = utils.check_bgr_blue
+
+        grid_function = utils.get_grid_function(detection_function)
+        if grid_function is not None:
+            if integral_image is None:
+                integral_image = IntegralImage(board_subimage)
+            deciding_values = grid_function(integral_image, stone_subimage_boundaries)
+            return np.asarray(deciding_values, dtype=np.float64)
+
+        stone_subimage_boundaries = np.asarray(stone_subimage_boundaries)
+        deciding_values = np.zeros(stone_subimage_boundaries.shape[:2])
         for (i, j), boundary in self._iterate(stone_subimage_boundaries):
             stone_subimage = utils.crop(board_subimage, boundary)
-            position_state, deciding_value = self.detect_stone(
-                stone_subimage,
-                detection_function=detection_function,
-                cutoffs=cutoffs,
-            )
-            state[i][j] = position_state
+            deciding_values[i, j] = detection_function(stone_subimage)
 
-        return state
+        return deciding_values
 
     def detect_stone(self, stone_subimage, detection_function=None, cutoffs=None):
         """Run detection functions based on a stone subimage.
@@ -191,6 +494,7 @@ class Board:
 
         return position_state, deciding_value
 
+    @timings.timed("compare_to")
     def compare_to(self, other_board):
         """Compare this board state with another board.
 
@@ -200,26 +504,44 @@ class Board:
         returns:
             missing_stones (list(i, j, board_value, other_board_value): Position and values of states that do not match.
         """
-        board_state = self.state
+        return [
+            (i, j, STONES[board_value], STONES[other_board_value])
+            for i, j, board_value, other_board_value in self.diff(other_board).tolist()
+        ]
 
-        missing_stones = []
+    def diff(self, other_board):
+        """Compare this board state with another board in one vectorized step.
 
-        for (i, j), board_value in self._iterate(board_state):
-            other_board_value = other_board.state[i][j]
-            if board_value != other_board_value:
-                missing_stones.append((i, j, board_value, other_board_value))
-        return missing_stones
+        Args:
+            other_board (Board): Another board object with which to compare this one.
+
+        returns:
+            differences (np.ndarray): A structured array with fields row, col, this and other, where this and other are BLACK, EMPTY, or WHITE.
+        """
+        return diff(self.state_array, other_board.state_array)
 
     def calibrate(
-        self, black_stones=None, white_stones=None, empty_spaces=None, verbose=False
+        self,
+        black_stones=None,
+        white_stones=None,
+        empty_spaces=None,
+        verbose=False,
+        combinations=True,
+        tolerance=0,
     ):
         """Runs several detection functions to see if they can distinguish
         between white stones, black stones, and empty spaces.
 
+        Every labelled stone is measured by every detection function in one batch, and
+        the functions and weighted pairs of them are scored together, see
+        goban_irl.calibration.find_best_detection.
+
         Args:
             black_stones (list[tuple[int, int]]): A list of black stone locations.
             white_stones (list[tuple[int, int]]): A list of white stone locations.
             empty_spaces (list[tuple[int, int]]): A list of empty board spaces.
+            combinations (bool): Whether to also try weighted pairs of detection functions.
+            tolerance (float): The fraction of each kind of label allowed to be misread.
 
         returns:
             best_function (function: opencv image -> int): The detection function which differentiates the most between the board values.
@@ -230,74 +552,65 @@ class Board:
                 "Please provide black stones, white stones, and empty spaces for calibration."
             )
 
-        board_subimage = self.board_subimage
-        stone_subimage_boundaries = self.stone_subimage_boundaries
-
-        black_stone_images = [
-            utils.crop(board_subimage, stone_subimage_boundaries[i][j])
-            for i, j in black_stones
-        ]
-        white_stone_images = [
-            utils.crop(board_subimage, stone_subimage_boundaries[i][j])
-            for i, j in white_stones
-        ]
-        empty_space_images = [
-            utils.crop(board_subimage, stone_subimage_boundaries[i][j])
-            for i, j in empty_spaces
-        ]
-
-        test_functions = utils.DETECTION_FUNCTIONS
-
-        max_score = 0
-
-        best_function = None
-        boundaries = None
-
-        for measurement_function in test_functions:
-            b_measurements = [measurement_function(im) for im in black_stone_images]
-            e_measurements = [measurement_function(im) for im in empty_space_images]
-            w_measurements = [measurement_function(im) for im in white_stone_images]
-
-            min_b = min(b_measurements)
-            max_b = max(b_measurements)
-            min_e = min(e_measurements)
-            max_e = max(e_measurements)
-            min_w = min(w_measurements)
-            max_w = max(w_measurements)
-
-            if (max_w - min_b) > 0:
-                score = (min_e - max_b + min_w - max_e) / (max_w - min_b)
-            else:
-                score = 0
-
-            if (max_b < min_e) and (max_e < min_w):
-                if verbose:
-                    print(
-                        "{} partitions with gaps of size {} and {}".format(
-                            measurement_function.__name__, min_e - max_b, min_w - max_e
-                        )
-                    )
-                if score > max_score:
-                    max_score = score
-                    best_function = measurement_function
-                    boundaries = ((max_b + min_e) // 2, (max_e + min_w) // 2)
-
-            else:
-                if verbose:
-                    print("{} does not partition".format(measurement_function.__name__))
-
-            if verbose:
-                print("{} | {} | {}\n".format(max_b, [min_e, max_e], min_w))
+        locations = list(black_stones) + list(white_stones) + list(empty_spaces)
+        labels = (
+            [BLACK] * len(black_stones)
+            + [WHITE] * len(white_stones)
+            + [EMPTY] * len(empty_spaces)
+        )
+        rows, columns = np.array(locations, dtype=np.intp).reshape(-1, 2).T
+        boundaries = self.geometry.boundaries[rows, columns]
+
+        return find_best_detection(
+            self.integral_image,
+            boundaries,
+            labels,
+            combinations=combinations,
+            tolerance=tolerance,
+            verbose=verbose,
+            corrections=self._baseline_corrections(rows, columns),
+        )
+
+    def calibrate_from_state(
+        self, state, verbose=False, combinations=True, tolerance=0.01
+    ):
+        """Calibrate with every position on the board labelled by a known state.
 
-        print("")
-        if best_function is not None:
-            if verbose:
-                print("Best function is {}".format(best_function.__name__))
+        Instead of clicking a few stones, use a state that is known to match this image,
+        for example the state of the virtual board being followed or goban_irl.state.from_sgf,
+        so every intersection is labelled. The state is in the same orientation as `state`,
+        so it is flipped back to image order for flipped boards.
 
-            return best_function, boundaries
+        Args:
+            state: A size x size state as a StateView, a list of lists of strings, or an int8 array.
+            combinations (bool): Whether to also try weighted pairs of detection functions.
+            tolerance (float): The fraction of each kind of label allowed to be misread, so a
+                stray hand or a stone not yet copied across does not stop calibration.
 
-        else:
-            raise ValueError("No partitions of the space found.")
+        returns:
+            best_function (function: opencv image -> int): The detection function which differentiates the most between the board values.
+            cutoffs (tuple[int, int]): Halfway between the different board value readings for best_function.
+        """
+        labels = to_array(state)
+        if labels.shape != (self.size, self.size):
+            raise ValueError(
+                "A {} board needs a {} x {} state.".format(
+                    self.size, self.size, self.size
+                )
+            )
+        if self.flip:
+            labels = labels[::-1, ::-1]
+        rows, columns = np.indices(labels.shape).reshape(2, -1)
+
+        return find_best_detection(
+            self.integral_image,
+            self.geometry.boundaries.reshape(-1, 4),
+            labels.reshape(-1),
+            combinations=combinations,
+            tolerance=tolerance,
+            verbose=verbose,
+            corrections=self._baseline_corrections(rows, columns),
+        )
 
     @staticmethod
     def _iterate(two_dim_array):
@@ -306,20 +619,20 @@ class Board:
                 yield ((i, j), value)
 
     @staticmethod
-    def _get_board_params(image):
+    def _get_board_params(image, size=19):
         height, width, _ = image.shape
-        return width, height, width / 18, height / 18
+        return width, height, width / (size - 1), height / (size - 1)
 
     @staticmethod
-    def _human_readable_numeric(loc):
+    def _human_readable_numeric(loc, size=19):
         row, col = loc
-        return "{}-{}".format(col + 1, 19 - row)
+        return "{}-{}".format(col + 1, size - row)
 
     @staticmethod
-    def _human_readable_alpha(loc):
+    def _human_readable_alpha(loc, size=19):
         row, col = loc
         alpha = "ABCDEFGHJKLMNOPQRST"
-        return "{}{}".format(alpha[col], 19 - row)
+        return "{}{}".format(alpha[col], size - row)
 
     @staticmethod
     def _find_region(deciding_value, cutoffs):
@@ -333,28 +646,14 @@ class Board:
         return position_state
 
     @staticmethod
-    def _sort_corners(corners):
-        if len(corners) == 2:
-            xmin, xmax = sorted([corner[0] for corner in corners])
-            ymin, ymax = sorted([corner[1] for corner in corners])
-            sorted_corners = [(xmin, ymin), (xmax, ymax)]
-
-        if len(corners) == 4:
-            sums = [sum(corner) for corner in corners]
-            topleft_index = sums.index(min(sums))
-            topleft = corners[topleft_index]
-
-            bottomright_index = sums.index(max(sums))
-            bottomright = corners[bottomright_index]
-            remaining_corners = [
-                corner
-                for corner in corners
-                if (corner != topleft) and (corner != bottomright)
-            ]
-            if remaining_corners[0][0] > remaining_corners[1][0]:
-                topright, bottomleft = remaining_corners
-            else:
-                bottomleft, topright = remaining_corners
-            sorted_corners = [topleft, topright, bottomleft, bottomright]
+    def _find_regions(deciding_values, cutoffs):
+        min_cutoff, max_cutoff = cutoffs
+        return np.where(
+            deciding_values < min_cutoff,
+            BLACK,
+            np.where(deciding_values > max_cutoff, WHITE, EMPTY),
+        ).astype(np.int8)
 
-        return sorted_corners
+    @staticmethod
+    def _sort_corners(corners):
+        return sort_corners(corners)
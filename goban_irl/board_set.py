@@ -0,0 +1,316 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+import goban_irl.opencv_utilities as utils
+
+from goban_irl.board import Board
+from goban_irl.geometry import get_board_geometry
+from goban_irl.integral_image import IntegralImage
+
+
+class BoardSet:
+    def __init__(self, configs):
+        """Read many boards from one frame, sharing the work between them.
+
+        Building a Board per board crops, converts and integrates its own part of the frame.
+        A BoardSet instead groups the boards so each group costs one pass over the frame:
+
+            Two corner boards that overlap share one IntegralImage of the frame around
+            them, so the pixels they share are converted and summed once per frame. Other
+            two corner boards get their own, since one bigger summed-area table costs more
+            than several small ones even with no space between the boards.
+            Boards with samples_per_cell are sampled together with a single cv2.remap into
+            one sample image with one IntegralImage.
+            Four corner boards without samples_per_cell need their own perspective
+            transform, so they are read as separate Boards.
+
+        Args:
+            configs (list[dict]): Board keyword arguments for each board, for example
+                {"corners": [(0, 0), (800, 800)], "cutoffs": (70, 150)}. Every key other
+                than image is passed on to Board.
+
+        Example:
+            board_set = BoardSet([
+                {"corners": [(40, 60), (900, 920)]},
+                {"corners": [(1000, 60), (1860, 920)], "flip": True},
+                {"corners": table_3_corners, "samples_per_cell": 6},
+            ])
+            with CameraSource(width=3840, height=2160) as camera:
+                while True:
+                    boards = board_set.scan(camera.latest())
+        """
+        self.configs = [dict(config) for config in configs]
+        self._layouts = {}
+
+    def __len__(self):
+        return len(self.configs)
+
+    def scan(self, image):
+        """Make a Board for every config from one frame.
+
+        Args:
+            image (opencv image): The frame every config's corners are in.
+
+        Returns:
+            boards (list[Board]): One Board per config, in the same order.
+        """
+        if isinstance(image, str):
+            image = utils.import_image(image)
+
+        crop_groups, sample_group = self._layout(image.shape[:2])
+        detection_inputs = [None] * len(self.configs)
+
+        for boundary, indices, boundaries in crop_groups:
+            crop = utils.crop(image, boundary)
+            integral_image = IntegralImage(crop)
+            for index, board_boundaries in zip(indices, boundaries):
+                detection_inputs[index] = (crop, board_boundaries, integral_image)
+
+        if sample_group is not None:
+            (map_1, map_2), indices, boundaries = sample_group
+            sample_image = cv2.remap(image, map_1, map_2, cv2.INTER_LINEAR)
+            integral_image = IntegralImage(sample_image)
+            for index, board_boundaries in zip(indices, boundaries):
+                detection_inputs[index] = (
+                    sample_image,
+                    board_boundaries,
+                    integral_image,
+                )
+
+        return [
+            Board(image=image, detection_inputs=inputs, **config)
+            for config, inputs in zip(self.configs, detection_inputs)
+        ]
+
+    def _layout(self, image_shape):
+        """Cached groups of boards for frames of this shape, see __init__"""
+        if image_shape not in self._layouts:
+            crops = []
+            samples = []
+            for index, config in enumerate(self.configs):
+                geometry = get_board_geometry(
+                    config["corners"], image_shape, config.get("size", 19)
+                )
+                if config.get("samples_per_cell") is not None:
+                    samples.append((index, geometry, config["samples_per_cell"]))
+                elif len(geometry.corners) == 2:
+                    crops.append((index, geometry))
+
+            self._layouts[image_shape] = (
+                _crop_groups(crops, image_shape),
+                _sample_group(samples),
+            )
+        return self._layouts[image_shape]
+
+
+def _crop_groups(crops, image_shape):
+    """Two corner boards in groups that are cheaper to read together, see _crop_group.
+
+    Two groups are merged while the frame boundary around both is smaller than their own
+    boundaries put together, which only happens when they overlap.
+    """
+    height, width = image_shape
+    groups = []
+    for crop in crops:
+        (xmin, ymin), (xmax, ymax) = crop[1].corners
+        box = (max(0, xmin), min(width, xmax), max(0, ymin), min(height, ymax))
+        groups.append((box, [crop]))
+
+    merged = True
+    while merged:
+        merged = False
+        for first, second in itertools.combinations(range(len(groups)), 2):
+            (box, members), (other_box, other_members) = groups[first], groups[second]
+            union = _union(box, other_box)
+            if _area(union) < _area(box) + _area(other_box):
+                groups[first] = (union, members + other_members)
+                del groups[second]
+                merged = True
+                break
+    return [_crop_group(members, image_shape) for _, members in groups]
+
+
+def _crop_group(crops, image_shape):
+    """The frame boundary around some two corner boards and each board's boundaries in it"""
+    height, width = image_shape
+    origins = [geometry.corners[0] for _, geometry in crops]
+    xmin = max(0, min(int(x) for x, _ in origins))
+    ymin = max(0, min(int(y) for _, y in origins))
+    xmax = min(width, max(int(geometry.corners[1][0]) for _, geometry in crops))
+    ymax = min(height, max(int(geometry.corners[1][1]) for _, geometry in crops))
+
+    boundaries = []
+    for (x, y), (_, geometry) in zip(origins, crops):
+        shift = np.array([x - xmin, x - xmin, y - ymin, y - ymin], dtype=np.intp)
+        boundaries.append(geometry.boundaries + shift)
+    indices = [index for index, _ in crops]
+    return (xmin, xmax, ymin, ymax), indices, boundaries
+
+
+def _union(box, other_box):
+    xmin, xmax, ymin, ymax = box
+    other_xmin, other_xmax, other_ymin, other_ymax = other_box
+    return (
+        min(xmin, other_xmin),
+        max(xmax, other_xmax),
+        min(ymin, other_ymin),
+        max(ymax, other_ymax),
+    )
+
+
+def _area(box):
+    xmin, xmax, ymin, ymax = box
+    return max(0, xmax - xmin) * max(0, ymax - ymin)
+
+
+def _sample_group(samples):
+    """One pair of remap maps that samples every board side by side, and their boundaries"""
+    if len(samples) == 0:
+        return None
+    samplers = [geometry.sampler(k) for _, geometry, k in samples]
+    height = max(map_1.shape[0] for (map_1, _), _ in samplers)
+    width = sum(map_1.shape[1] for (map_1, _), _ in samplers)
+    combined_1 = np.zeros((height, width, 2), dtype=np.int16)
+    combined_2 = np.zeros((height, width), dtype=np.uint16)
+
+    boundaries = []
+    x = 0
+    for (map_1, map_2), block_boundaries in samplers:
+        block_height, block_width = map_1.shape[:2]
+        combined_1[:block_height, x : x + block_width] = map_1
+        combined_2[:block_height, x : x + block_width] = map_2
+        boundaries.append(block_boundaries + np.array([x, x, 0, 0]))
+        x += block_width
+    indices = [index for index, _, _ in samples]
+    return (combined_1, combined_2), indices, boundaries
+
+
+class ParallelBoardSet:
+    def __init__(self, configs, workers=None, processes=True):
+        """A BoardSet split across a pool of workers, for rooms with more boards than one core can read.
+
+        The configs are split into one contiguous chunk per worker and each worker reads
+        its chunk with its own BoardSet. With processes, every frame is copied once into
+        shared memory and the workers read it from there, so frames are never pickled and
+        only the small state arrays come back. Without processes, a thread pool reads the
+        frame directly, which helps less because only the opencv calls release the GIL.
+
+        Args:
+            configs (list[dict]): Board keyword arguments for each board, see BoardSet.
+            workers (int): The number of workers. If None, use one per CPU.
+            processes (bool): Use a ProcessPoolExecutor if True, else a ThreadPoolExecutor.
+
+        Example:
+            with ParallelBoardSet(configs, workers=8) as board_set:
+                while True:
+                    states = board_set.scan(camera.latest())
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = max(1, min(workers, len(configs)))
+        self.configs = [dict(config) for config in configs]
+        self.processes = processes
+        self._chunks = [
+            chunk.tolist() for chunk in np.array_split(np.arange(len(configs)), workers)
+        ]
+        chunk_configs = [[self.configs[i] for i in chunk] for chunk in self._chunks]
+        self._shared_memory = None
+
+        if processes:
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(chunk_configs,),
+            )
+        else:
+            self._board_sets = [BoardSet(chunk) for chunk in chunk_configs]
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def __len__(self):
+        return len(self.configs)
+
+    def scan(self, image):
+        """Read every board from one frame in parallel.
+
+        Args:
+            image (opencv image): The frame every config's corners are in.
+
+        Returns:
+            states (list[np.ndarray]): One int8 state_array per config, in the same order.
+        """
+        if isinstance(image, str):
+            image = utils.import_image(image)
+
+        if self.processes:
+            frame = self._share(image)
+            futures = [
+                self._executor.submit(_scan_shared, frame, chunk_index)
+                for chunk_index in range(len(self._chunks))
+            ]
+        else:
+            futures = [
+                self._executor.submit(_scan_states, board_set, image)
+                for board_set in self._board_sets
+            ]
+
+        states = [None] * len(self.configs)
+        for chunk, future in zip(self._chunks, futures):
+            for index, state_array in zip(chunk, future.result()):
+                states[index] = state_array
+        return states
+
+    def close(self):
+        self._executor.shutdown()
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+            self._shared_memory.unlink()
+            self._shared_memory = None
+
+    def _share(self, image):
+        """Copy a frame into shared memory, growing it when frames get bigger"""
+        if self._shared_memory is None or self._shared_memory.size < image.nbytes:
+            if self._shared_memory is not None:
+                self._shared_memory.close()
+                self._shared_memory.unlink()
+            self._shared_memory = shared_memory.SharedMemory(
+                create=True, size=image.nbytes
+            )
+        shared = np.ndarray(image.shape, image.dtype, buffer=self._shared_memory.buf)
+        shared[...] = image
+        return self._shared_memory.name, image.shape, image.dtype.str
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _scan_states(board_set, image):
+    return [board.state_array for board in board_set.scan(image)]
+
+
+_worker_board_sets = None
+_worker_shared_memory = None
+
+
+def _init_worker(chunk_configs):
+    global _worker_board_sets
+    _worker_board_sets = [BoardSet(chunk) for chunk in chunk_configs]
+
+
+def _scan_shared(frame, chunk_index):
+    """Read one chunk of boards from a frame in shared memory, inside a worker process"""
+    global _worker_shared_memory
+    name, shape, dtype = frame
+    if _worker_shared_memory is None or _worker_shared_memory.name != name:
+        if _worker_shared_memory is not None:
+            _worker_shared_memory.close()
+        _worker_shared_memory = shared_memory.SharedMemory(name=name)
+    image = np.ndarray(shape, np.dtype(dtype), buffer=_worker_shared_memory.buf)
+    return _scan_states(_worker_board_sets[chunk_index], image)
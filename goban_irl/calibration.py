@@ -0,0 +1,398 @@
+import itertools
+
+import numpy as np
+
+import goban_irl.opencv_utilities as utils
+
+from goban_irl.state import BLACK, EMPTY, WHITE
+
+# A pair of functions has a free weight to fit, so only trust pairs with this many of each label
+COMBINATION_SAMPLES = 5
+
+
+def feature_matrix(integral_image, boundaries, functions=None):
+    """Every detection function's value on every stone subimage.
+
+    Args:
+        integral_image (IntegralImage): Summed-area tables of the board_subimage.
+        boundaries: An array of (xmin, xmax, ymin, ymax), one per labelled stone subimage.
+        functions (list[function: opencv image -> int]): Defaults to DETECTION_FUNCTIONS.
+
+    Returns:
+        features (np.ndarray): A (samples, functions) float array.
+    """
+    if functions is None:
+        functions = utils.DETECTION_FUNCTIONS
+    boundaries = np.asarray(boundaries).reshape(-1, 4)
+    return np.stack(
+        [
+            utils.get_grid_function(function)(integral_image, boundaries)
+            for function in functions
+        ],
+        axis=1,
+    ).astype(np.float64)
+
+
+def measure_baseline(integral_image, boundaries, functions=None):
+    """Every detection function's value on every stone subimage of an empty board.
+
+    Args:
+        integral_image (IntegralImage): Summed-area tables of the empty board_subimage.
+        boundaries: A size x size array of (xmin, xmax, ymin, ymax).
+        functions (list[function: opencv image -> int]): Defaults to DETECTION_FUNCTIONS.
+
+    Returns:
+        baseline (dict[str, np.ndarray]): A size x size array of values per function name.
+    """
+    if functions is None:
+        functions = utils.DETECTION_FUNCTIONS
+    boundaries = np.asarray(boundaries)
+    features = feature_matrix(integral_image, boundaries, functions)
+    return {
+        function.__name__: features[:, index].reshape(boundaries.shape[:-1])
+        for index, function in enumerate(functions)
+    }
+
+
+def baseline_correction(baseline, detection_function):
+    """How much each position of an empty board reads above the average position.
+
+    Subtracting this from deciding values evens out a board lit from one side while
+    keeping them on the same scale, so cutoffs found without a baseline still roughly
+    apply. A LinearDetection is corrected by the weighted sum of its functions' corrections.
+    Functions in STEPPED_DETECTION_FUNCTIONS are never corrected, since their few fixed
+    values are decided before any offset could help.
+
+    Args:
+        baseline (dict[str, array]): Values per function name, see measure_baseline.
+        detection_function (function: opencv image -> int): The function to correct.
+
+    Returns:
+        correction (np.ndarray): An array shaped like the baseline values.
+    """
+    if isinstance(detection_function, utils.LinearDetection):
+        return sum(
+            weight * baseline_correction(baseline, function)
+            for weight, function in zip(
+                detection_function.weights, detection_function.functions
+            )
+        )
+    if detection_function.__name__ not in baseline:
+        raise ValueError(
+            "The baseline has no values for {}.".format(detection_function.__name__)
+        )
+    values = np.asarray(baseline[detection_function.__name__], dtype=np.float64)
+    if detection_function in utils.STEPPED_DETECTION_FUNCTIONS:
+        return np.zeros_like(values)
+    return values - values.mean()
+
+
+def pair_combinations(features, labels, functions):
+    """The best weighted sum of every pair of detection functions.
+
+    The weights of each pair are the Fisher direction from black to white stones using
+    the spread within all three classes, scaled so the absolute weights add up to one.
+
+    Args:
+        features (np.ndarray): A (samples, functions) array from feature_matrix.
+        labels (np.ndarray): BLACK, EMPTY, or WHITE for each sample.
+        functions (list[function: opencv image -> int]): The function of each feature column.
+
+    Returns:
+        combined_features (np.ndarray): A (samples, pairs) array of the weighted sums.
+        combined_functions (list[LinearDetection]): The function of each column.
+    """
+    pairs = np.array(list(itertools.combinations(range(len(functions)), 2)))
+    if len(pairs) == 0:
+        return np.empty((len(features), 0)), []
+    pair_features = features[:, pairs]
+
+    scatter = np.zeros((len(pairs), 2, 2))
+    for value in [BLACK, EMPTY, WHITE]:
+        centered = pair_features[labels == value]
+        centered = centered - centered.mean(axis=0)
+        scatter += np.einsum("npi,npj->pij", centered, centered)
+    difference = pair_features[labels == WHITE].mean(axis=0) - pair_features[
+        labels == BLACK
+    ].mean(axis=0)
+    scatter += (
+        1e-6 * np.eye(2) * (1 + np.trace(scatter, axis1=1, axis2=2))[:, None, None]
+    )
+    weights = np.linalg.solve(scatter, difference[..., None])[..., 0]
+    with np.errstate(invalid="ignore"):
+        weights = weights / np.abs(weights).sum(axis=1, keepdims=True)
+    weights = np.round(weights, 4)
+
+    combined_features = np.einsum("npi,pi->np", pair_features, weights)
+    combined_functions = [
+        utils.LinearDetection([functions[i] for i in pair], pair_weights)
+        for pair, pair_weights in zip(pairs, weights)
+    ]
+    return combined_features, combined_functions
+
+
+def score_features(features, labels, tolerance=0):
+    """Score how well every feature column separates black, empty, and white, all at once.
+
+    Each class is summarised by its low and high values, the tolerance and 1 - tolerance
+    quantiles, which are its min and max when tolerance is 0. A column partitions when
+    black is entirely below empty and empty is entirely below white.
+
+    Args:
+        features (np.ndarray): A (samples, columns) array.
+        labels (np.ndarray): BLACK, EMPTY, or WHITE for each sample.
+        tolerance (float): The fraction of each class allowed on the wrong side of a cutoff.
+
+    Returns:
+        A dictionary of arrays with one entry per column:
+            partitions: Whether the classes are in order with gaps between them.
+            gaps: The (black to empty, empty to white) gaps.
+            margin: Both gaps added together over the range from black to white.
+            separability: The smaller gap between class means in units of their spreads.
+            cutoffs: Values halfway across each gap.
+            ranges: The (black high, empty low, empty high, white low) values.
+    """
+    low, high, mean, spread = {}, {}, {}, {}
+    for value in [BLACK, EMPTY, WHITE]:
+        values = features[labels == value]
+        low[value] = np.quantile(values, tolerance, axis=0)
+        high[value] = np.quantile(values, 1 - tolerance, axis=0)
+        mean[value] = values.mean(axis=0)
+        spread[value] = values.std(axis=0)
+
+    black_gap = low[EMPTY] - high[BLACK]
+    white_gap = low[WHITE] - high[EMPTY]
+    total = high[WHITE] - low[BLACK]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = np.where(total > 0, (black_gap + white_gap) / total, 0)
+        separability = np.minimum(
+            (mean[EMPTY] - mean[BLACK]) / (spread[BLACK] + spread[EMPTY] + 1e-9),
+            (mean[WHITE] - mean[EMPTY]) / (spread[EMPTY] + spread[WHITE] + 1e-9),
+        )
+    return {
+        "partitions": (black_gap > 0) & (white_gap > 0),
+        "gaps": np.stack([black_gap, white_gap], axis=1),
+        "margin": margin,
+        "separability": separability,
+        "cutoffs": np.stack(
+            [(high[BLACK] + low[EMPTY]) // 2, (high[EMPTY] + low[WHITE]) // 2], axis=1
+        ),
+        "ranges": np.stack([high[BLACK], low[EMPTY], high[EMPTY], low[WHITE]], axis=1),
+    }
+
+
+def find_best_detection(
+    integral_image,
+    boundaries,
+    labels,
+    combinations=True,
+    tolerance=0,
+    verbose=False,
+    corrections=None,
+):
+    """Find the detection function and cutoffs that best separate labelled stone subimages.
+
+    Every function in DETECTION_FUNCTIONS, and with combinations every weighted pair of
+    them, is scored at once by score_features. Pairs are only tried when there are at
+    least COMBINATION_SAMPLES of each label. Of the ones that partition the labels,
+    the one with the highest separability wins, since it uses every sample rather than
+    only the most extreme ones.
+
+    Args:
+        integral_image (IntegralImage): Summed-area tables of the board_subimage.
+        boundaries: An array of (xmin, xmax, ymin, ymax), one per labelled stone subimage.
+        labels: BLACK, EMPTY, or WHITE for each boundary.
+        combinations (bool): Whether to also try weighted pairs of functions.
+        tolerance (float): The fraction of each class allowed to be misread, see score_features.
+        verbose (bool): Print how every function did.
+        corrections (np.ndarray): A (samples, DETECTION_FUNCTIONS) array to subtract from
+            the values of each function, such as baseline_correction at each boundary.
+
+    Returns:
+        best_function (function: opencv image -> int): The best detection function.
+        cutoffs (tuple[float, float]): Halfway across the gaps for best_function.
+    """
+    labels = np.asarray(labels).reshape(-1)
+    counts = [np.count_nonzero(labels == value) for value in [BLACK, EMPTY, WHITE]]
+    if min(counts) == 0:
+        raise ValueError(
+            "Calibration needs black stones, white stones, and empty spaces."
+        )
+
+    functions = list(utils.DETECTION_FUNCTIONS)
+    features = feature_matrix(integral_image, boundaries, functions)
+    if corrections is not None:
+        features = features - corrections
+    if combinations and min(counts) >= COMBINATION_SAMPLES:
+        combined_features, combined_functions = pair_combinations(
+            features, labels, functions
+        )
+        features = np.concatenate([features, combined_features], axis=1)
+        functions += combined_functions
+
+    scores = score_features(features, labels, tolerance)
+    if verbose:
+        _print_scores(functions, scores)
+
+    candidates = np.flatnonzero(scores["partitions"])
+    if len(candidates) == 0:
+        raise ValueError("No partitions of the space found.")
+    best = candidates[np.argmax(scores["separability"][candidates])]
+    if verbose:
+        print("Best function is {}".format(functions[best].__name__))
+    return functions[best], tuple(scores["cutoffs"][best].tolist())
+
+
+def _print_scores(functions, scores):
+    for index, function in enumerate(functions):
+        max_b, min_e, max_e, min_w = scores["ranges"][index].tolist()
+        if scores["partitions"][index]:
+            print(
+                "{} partitions with gaps of size {} and {} (separability {:.2f})".format(
+                    function.__name__,
+                    min_e - max_b,
+                    min_w - max_e,
+                    scores["separability"][index],
+                )
+            )
+        else:
+            print("{} does not partition".format(function.__name__))
+        print("{} | {} | {}\n".format(max_b, [min_e, max_e], min_w))
+
+
+class CutoffTracker:
+    def __init__(
+        self,
+        cutoffs,
+        alpha=0.05,
+        confidence=0.25,
+        max_uncertain=0.1,
+        min_samples=3,
+        max_step=0.02,
+        max_drift=0.25,
+    ):
+        """Follow slow changes in lighting by moving cutoffs along with the stones they read.
+
+        Each scan, positions whose deciding value is further than confidence times the
+        width of the empty band from both cutoffs count as confidently read. Their values
+        are averaged per class and blended into a running average of each class with
+        weight alpha. Each cutoff then moves by how much the running averages on either
+        side of it have moved since they were first seen, so the tracker follows drift
+        without second guessing the calibration.
+
+        A misread should not teach the tracker anything, so scans where more than
+        max_uncertain of the positions are close to a cutoff, like a hand over the board,
+        are skipped. A class is only updated from at least min_samples positions, each
+        cutoff moves by at most max_step times the band per scan, and neither cutoff ever
+        moves further than max_drift times the band from where it started. A tracker that
+        has reached that limit needs calibrating again, see `needs_calibration`.
+
+        Args:
+            cutoffs (tuple[float, float]): The calibrated cutoffs to start from.
+            alpha (float): How much each scan moves the running averages.
+            confidence (float): How far from a cutoff a value must be to learn from it, as a fraction of the band.
+            max_uncertain (float): The largest fraction of unconfident positions in a scan that is learned from.
+            min_samples (int): The fewest confident positions of a class that update it.
+            max_step (float): How far a cutoff may move per scan, as a fraction of the band.
+            max_drift (float): How far a cutoff may move in total, as a fraction of the band.
+
+        Attributes:
+            cutoffs (tuple[float, float]): The current cutoffs.
+            means (dict[int, float]): The running average of BLACK, EMPTY and WHITE deciding values, None until seen.
+            scans (int): How many scans were learned from.
+            skipped (int): How many scans were skipped as uncertain.
+
+        Example:
+            tracker = CutoffTracker(board.cutoffs)
+            while True:
+                board.update(get_snapshot("physical"))
+                board.cutoffs = tracker.observe(board.deciding_values, board.state_array)
+        """
+        self.initial_cutoffs = tuple(float(cutoff) for cutoff in cutoffs)
+        self.cutoffs = self.initial_cutoffs
+        self.alpha = alpha
+        self.confidence = confidence
+        self.max_uncertain = max_uncertain
+        self.min_samples = min_samples
+        self.max_step = max_step
+        self.max_drift = max_drift
+        self.means = {BLACK: None, EMPTY: None, WHITE: None}
+        self._first_means = {}
+        self.scans = 0
+        self.skipped = 0
+
+    @property
+    def band(self):
+        low, high = self.initial_cutoffs
+        return high - low
+
+    @property
+    def needs_calibration(self):
+        """Whether a cutoff has drifted as far as it is allowed to"""
+        drift = np.abs(np.subtract(self.cutoffs, self.initial_cutoffs))
+        return bool((drift >= self.max_drift * self.band - 1e-9).any())
+
+    def observe(self, deciding_values, state_array):
+        """Learn from one scan of a board and return the new cutoffs.
+
+        Args:
+            deciding_values (np.ndarray): The deciding value of every position, see Board.deciding_values.
+            state_array (np.ndarray): BLACK, EMPTY, or WHITE for every position, read with the current cutoffs.
+
+        Returns:
+            cutoffs (tuple[float, float]): The cutoffs to read the next scan with.
+        """
+        deciding_values = np.asarray(deciding_values, dtype=np.float64).reshape(-1)
+        state_array = np.asarray(state_array).reshape(-1)
+        low, high = self.cutoffs
+        distance = np.minimum(
+            np.abs(deciding_values - low), np.abs(deciding_values - high)
+        )
+        confident = distance > self.confidence * self.band
+        if np.count_nonzero(~confident) > self.max_uncertain * len(confident):
+            self.skipped += 1
+            return self.cutoffs
+
+        for value in [BLACK, EMPTY, WHITE]:
+            values = deciding_values[confident & (state_array == value)]
+            if len(values) < self.min_samples:
+                continue
+            mean = values.mean()
+            if self.means[value] is None:
+                self.means[value] = mean
+                self._first_means[value] = mean
+            else:
+                self.means[value] += self.alpha * (mean - self.means[value])
+        self.scans += 1
+
+        self.cutoffs = tuple(
+            self._move(index, lower, upper)
+            for index, (lower, upper) in enumerate([(BLACK, EMPTY), (EMPTY, WHITE)])
+        )
+        return self.cutoffs
+
+    def _move(self, index, lower, upper):
+        cutoff = self.cutoffs[index]
+        if self.means[lower] is None or self.means[upper] is None:
+            return cutoff
+        initial = self.initial_cutoffs[index]
+        target = (
+            initial
+            + (
+                self.means[lower]
+                - self._first_means[lower]
+                + self.means[upper]
+                - self._first_means[upper]
+            )
+            / 2
+        )
+        step = np.clip(
+            target - cutoff, -self.max_step * self.band, self.max_step * self.band
+        )
+        return float(
+            np.clip(
+                cutoff + step,
+                initial - self.max_drift * self.band,
+                initial + self.max_drift * self.band,
+            )
+        )
@@ -0,0 +1,55 @@
+import cv2
+
+from goban_irl.timing import timings
+
+
+class ChangeDetector:
+    def __init__(self, threshold=8, thumbnail_size=64):
+        """Cheaply tell whether an image has changed since the last change it saw.
+
+        Each image is shrunk to a small grayscale thumbnail and compared pixel by pixel to
+        the thumbnail of the last image that counted as a change. Slow drift still adds up
+        to a change eventually because the reference only moves when a change is reported.
+
+        Args:
+            threshold (int): The largest difference in a thumbnail pixel that is ignored.
+            thumbnail_size (int): Width and height of the thumbnails.
+
+        Attributes:
+            last_changed (bool): What the latest call to `changed` returned.
+
+        Example:
+            changes = ChangeDetector()
+            while True:
+                image = get_snapshot("physical")
+                if changes.changed(image):
+                    board = Board(image, corners)
+        """
+        self.threshold = threshold
+        self.thumbnail_size = thumbnail_size
+        self.reference = None
+        self.last_changed = False
+
+    @timings.timed("change_detection")
+    def changed(self, image):
+        """Whether image differs from the last changed image, and remember it if so"""
+        thumbnail = self.thumbnail(image)
+        self.last_changed = True
+        if self.reference is not None and self.reference.shape == thumbnail.shape:
+            if cv2.absdiff(thumbnail, self.reference).max() <= self.threshold:
+                self.last_changed = False
+        if self.last_changed:
+            self.reference = thumbnail
+        return self.last_changed
+
+    def reset(self):
+        self.reference = None
+
+    def thumbnail(self, image):
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(
+            image,
+            (self.thumbnail_size, self.thumbnail_size),
+            interpolation=cv2.INTER_AREA,
+        )
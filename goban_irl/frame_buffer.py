@@ -0,0 +1,189 @@
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Bytes before the first frame, enough for the write count and a sequence number per slot
+_HEADER_ALIGNMENT = 64
+
+
+class FrameBuffer:
+    def __init__(self, shape, dtype=np.uint8, slots=4, name=None):
+        """A fixed-size ring of frames in shared memory, written by one capture stage.
+
+        The writer copies each frame into the next slot, overwriting the oldest one, so
+        memory stays at slots frames however far behind detection falls. Readers get numpy
+        views straight into the shared memory. Each reader keeps its own place in the
+        ring and skips frames that were overwritten before it got to them.
+
+        A view stays valid until the writer comes back around to its slot, slots - 1
+        frames later. Check `is_current` or copy the frame if it needs to live longer.
+
+        Args:
+            shape (tuple[int, ...]): The shape of every frame.
+            dtype (np.dtype): The dtype of every frame.
+            slots (int): The number of frames kept.
+            name (str): The name of an existing FrameBuffer to attach to, for example from
+                another process. If None, create a new one.
+
+        Attributes:
+            name (str): The shared memory name other processes attach with.
+            dropped (int): Frames this reader skipped because they were overwritten.
+
+        Example:
+            buffer = FrameBuffer(frame.shape, slots=4)
+            buffer.write(frame)  # in the capture thread or process
+            sequence, frame = buffer.read(timeout=1)  # in a detection worker
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        header_bytes = 8 * (slots + 1)
+        self._data_start = -(-header_bytes // _HEADER_ALIGNMENT) * _HEADER_ALIGNMENT
+
+        self._owner = name is None
+        if self._owner:
+            self._shared_memory = shared_memory.SharedMemory(
+                create=True, size=self._data_start + slots * self.frame_bytes
+            )
+        else:
+            self._shared_memory = shared_memory.SharedMemory(name=name)
+        self.name = self._shared_memory.name
+
+        header = np.ndarray((slots + 1,), np.int64, buffer=self._shared_memory.buf)
+        self._write_count = header[:1]
+        self._sequences = header[1:]
+        self._frames = np.ndarray(
+            (slots,) + self.shape,
+            self.dtype,
+            buffer=self._shared_memory.buf,
+            offset=self._data_start,
+        )
+        if self._owner:
+            header[0] = 0
+            self._sequences[:] = -1
+
+        self._read_count = 0
+        self.dropped = 0
+
+    @property
+    def write_count(self):
+        """The number of frames written so far"""
+        return int(self._write_count[0])
+
+    def write(self, frame):
+        """Copy a frame into the oldest slot and return its sequence number"""
+        sequence = self.write_count
+        slot = sequence % self.slots
+        self._sequences[slot] = -1
+        self._frames[slot] = frame
+        self._sequences[slot] = sequence
+        self._write_count[0] = sequence + 1
+        return sequence
+
+    def read(self, timeout=None):
+        """The oldest frame this reader has not seen, waiting up to timeout seconds for one.
+
+        Returns:
+            sequence (int): The number of the frame, counting from 0.
+            frame (np.ndarray): A view of the frame in shared memory.
+
+            Both are None if no new frame was written before the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            write_count = self.write_count
+            oldest = max(0, write_count - self.slots + 1)
+            if self._read_count < oldest:
+                self.dropped += oldest - self._read_count
+                self._read_count = oldest
+
+            if self._read_count < write_count:
+                sequence = self._read_count
+                slot = sequence % self.slots
+                if self._sequences[slot] == sequence:
+                    self._read_count += 1
+                    return sequence, self._frames[slot]
+            elif deadline is not None and time.monotonic() > deadline:
+                return None, None
+            time.sleep(0.001)
+
+    def latest(self, timeout=None):
+        """The newest frame, skipping any this reader has not seen, see `read`.
+
+        Reading the newest frame leaves it the longest before its slot is written again.
+        """
+        write_count = self.write_count
+        if self._read_count < write_count - 1:
+            self.dropped += write_count - 1 - self._read_count
+            self._read_count = write_count - 1
+        return self.read(timeout)
+
+    def is_current(self, sequence):
+        """Whether the view of frame sequence still holds that frame"""
+        return bool(self._sequences[sequence % self.slots] == sequence)
+
+    def close(self):
+        """Detach from the shared memory, and free it if this FrameBuffer created it.
+
+        Frames that are still referenced keep the memory mapped until they are dropped.
+        """
+        del self._write_count, self._sequences, self._frames
+        if self._owner:
+            self._shared_memory.unlink()
+        try:
+            self._shared_memory.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FrameProducer:
+    def __init__(self, buffer, grab, fps=None):
+        """A capture stage that keeps writing frames into a FrameBuffer from a background thread.
+
+        Args:
+            buffer (FrameBuffer): Where the frames go.
+            grab (function: () -> np.ndarray): Takes one frame, for example a screenshot.
+                It is only ever called from the background thread.
+            fps (float): The most frames to grab per second. If None, grab as fast as possible.
+
+        Example:
+            producer = FrameProducer(buffer, lambda: utils.grab_screen(sct, region))
+            sequence, frame = buffer.read(timeout=1)
+            producer.close()
+        """
+        self.buffer = buffer
+        self.grab = grab
+        self.fps = fps
+        self.error = None
+        self._running = True
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+
+    def _produce(self):
+        try:
+            while self._running:
+                start = time.monotonic()
+                self.buffer.write(self.grab())
+                if self.fps is not None:
+                    time.sleep(max(0, 1 / self.fps - (time.monotonic() - start)))
+        except Exception as error:
+            self.error = error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
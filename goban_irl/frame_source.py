@@ -0,0 +1,190 @@
+import threading
+import time
+
+import cv2
+import mss
+
+import goban_irl.opencv_utilities as utils
+
+# Frames a webcam reads before a single picture is taken, so auto exposure can settle
+SETTLE_FRAMES = 30
+
+
+class ScreenSource:
+    def __init__(self, sct, screen_scale=1, margin=20):
+        """Grab the screen once per tick for every virtual board that is watched.
+
+        Each board registers its corners with `add`. `grab` then takes a single screenshot of
+        the bounding box around all of them, and `view` hands each board a numpy view into
+        that screenshot, so both boards are read from the same instant without copies.
+
+        Args:
+            sct (mss.mss): An open mss instance.
+            screen_scale (float): Screenshot pixels per screen point, see helpers.get_scale.
+            margin (int): Extra screenshot pixels to grab on each side of each board.
+
+        Attributes:
+            frame (np.ndarray): The latest screenshot of the bounding box.
+            offset (tuple[int, int]): The screenshot pixel of the top left of frame.
+
+        Example:
+            with mss.mss() as sct:
+                screen = ScreenSource(sct, screen_scale=2)
+                screen.add(first_corners)
+                screen.add(second_corners)
+                while True:
+                    screen.grab()
+                    image, offset = screen.view(first_corners)
+        """
+        self.sct = sct
+        self.screen_scale = screen_scale
+        self.margin = margin
+        self.regions = {}
+        self.frame = None
+        self.offset = (0, 0)
+        self._sct_thread = threading.current_thread()
+        self._local = threading.local()
+
+    def add(self, corners):
+        """Include a board in every grab from now on"""
+        region, _ = utils.get_capture_region(corners, self.screen_scale, self.margin)
+        self.regions[self._key(corners)] = region
+
+    def grab(self):
+        """Take one screenshot covering every added board"""
+        if len(self.regions) == 0:
+            return
+        self.use(self.capture())
+
+    def capture(self):
+        """Take one screenshot covering every added board and return it without keeping it.
+
+        This can be called from any thread, for example by a FrameProducer. Threads other
+        than the one that made this ScreenSource open their own mss instance.
+        """
+        return utils.grab_screen(self._thread_sct(), self._union(self.regions.values()))
+
+    def use(self, frame):
+        """Make a frame from capture the latest grab"""
+        region = self._union(self.regions.values())
+        self.frame = frame
+        self.offset = (
+            round(region["left"] * self.screen_scale),
+            round(region["top"] * self.screen_scale),
+        )
+
+    def view(self, corners):
+        """The part of the latest grab around a board.
+
+        Returns:
+            image (np.ndarray): A view into frame around the board.
+            offset (tuple[int, int]): The screenshot pixel of the top left of image.
+        """
+        region = self.regions[self._key(corners)]
+        xmin = round(region["left"] * self.screen_scale) - self.offset[0]
+        ymin = round(region["top"] * self.screen_scale) - self.offset[1]
+        xmax = xmin + round(region["width"] * self.screen_scale)
+        ymax = ymin + round(region["height"] * self.screen_scale)
+        image = utils.crop(self.frame, (xmin, xmax, ymin, ymax))
+        return image, (xmin + self.offset[0], ymin + self.offset[1])
+
+    def _thread_sct(self):
+        if threading.current_thread() is self._sct_thread:
+            return self.sct
+        if not hasattr(self._local, "sct"):
+            self._local.sct = mss.mss()
+        return self._local.sct
+
+    @staticmethod
+    def _key(corners):
+        return tuple(tuple(corner) for corner in corners)
+
+    @staticmethod
+    def _union(regions):
+        regions = list(regions)
+        left = min(region["left"] for region in regions)
+        top = min(region["top"] for region in regions)
+        right = max(region["left"] + region["width"] for region in regions)
+        bottom = max(region["top"] + region["height"] for region in regions)
+        return {"left": left, "top": top, "width": right - left, "height": bottom - top}
+
+
+class CameraSource:
+    def __init__(self, device=0, width=None, height=None, fps=None):
+        """A webcam that stays open while a background thread keeps reading frames.
+
+        Opening a webcam takes a long time and the first frames often come before auto
+        exposure settles, so open it once and use `latest` whenever a frame is needed.
+
+        Args:
+            device (int): The opencv device index of the webcam.
+            width (int): Requested frame width. If None, use the camera default.
+            height (int): Requested frame height. If None, use the camera default.
+            fps (int): Requested frames per second. If None, use the camera default.
+
+        Attributes:
+            frame_count (int): The number of frames read so far.
+
+        Example:
+            with CameraSource(device=0, width=3840, height=2160) as camera:
+                image = get_snapshot("physical", source=camera)
+        """
+        self.capture = cv2.VideoCapture(device)
+        if not self.capture.isOpened():
+            raise IOError("Cannot open webcam")
+        if width is not None:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height is not None:
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps is not None:
+            self.capture.set(cv2.CAP_PROP_FPS, fps)
+
+        self.frame_count = 0
+        self._frame = None
+        self._lock = threading.Lock()
+        self._frame_ready = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._read_frames, daemon=True)
+        self._thread.start()
+
+    def latest(self, timeout=5):
+        """The most recent frame, waiting up to timeout seconds for the first one"""
+        if not self._frame_ready.wait(timeout):
+            raise IOError("No frames from webcam")
+        with self._lock:
+            return self._frame
+
+    def settled(self, frames=SETTLE_FRAMES, timeout=5):
+        """The latest frame once at least frames have been read, for a single picture.
+
+        A webcam that was just opened is still adjusting its exposure, so use this instead
+        of `latest` for corners, calibration and other one off pictures.
+        """
+        deadline = time.monotonic() + timeout
+        while self.frame_count < frames:
+            if time.monotonic() > deadline:
+                break
+            time.sleep(0.01)
+        return self.latest(timeout)
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+        self.capture.release()
+
+    def _read_frames(self):
+        while self._running:
+            success, frame = self.capture.read()
+            if not success:
+                time.sleep(0.01)
+                continue
+            with self._lock:
+                self._frame = frame
+                self.frame_count += 1
+            self._frame_ready.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,183 @@
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+import goban_irl.opencv_utilities as utils
+
+
+class BoardGeometry:
+    def __init__(self, corners, image_shape, size=19):
+        """Everything about a board that depends only on where it is, not what is on it.
+
+        In `watch_boards` the corners and the image size are the same for every frame, so
+        use `get_board_geometry` to build this once and share it between Board objects.
+        The nested tuples are shared between boards and should be treated as read-only.
+
+        Args:
+            corners (list[tuple[int, int]]): Two or four (x, y) corners of the board in the image.
+            image_shape (tuple[int, int]): The (height, width) of the image the corners are in.
+            size (int): The number of lines on the board.
+
+        Attributes:
+            corners (list[tuple[int, int]]): The sorted corners which define a board_subimage.
+            height (int): Height of the board_subimage the corners make.
+            width (int): Width of the board_subimage the corners make.
+            xstep (float): Horizontal distance between intersections.
+            ystep (float): Vertical distance between intersections.
+            intersections: A size x size array of integer (x, y) coordinates for each intersection.
+            stone_subimage_boundaries: A size x size array of (xmin, xmax, ymin, ymax) for each stone.
+            boundaries (np.ndarray): stone_subimage_boundaries as a (size, size, 4) integer array.
+        """
+        self.corners = sort_corners(corners)
+        self.size = size
+        self.height, self.width = subimage_shape(self.corners, image_shape)
+        self.xstep = self.width / (size - 1)
+        self.ystep = self.height / (size - 1)
+
+        self.intersections = get_intersections(self.xstep, self.ystep, size)
+        self.stone_subimage_boundaries = get_stone_subimage_boundaries(
+            self.width, self.height, self.xstep, self.ystep, self.intersections
+        )
+        self.boundaries = np.array(self.stone_subimage_boundaries, dtype=np.intp)
+        self._samplers = {}
+
+    def sample(self, image, samples_per_cell):
+        """Sample every stone subimage straight from the image, without a board_subimage.
+
+        Each stone subimage is read as a samples_per_cell x samples_per_cell block of
+        bilinear samples spread evenly over its boundaries, mapped back through the
+        perspective transform for four corners. The blocks are tiled in board order.
+
+        Args:
+            image (opencv image): The full image the corners are in.
+            samples_per_cell (int): Samples along each side of a stone subimage.
+
+        Returns:
+            sample_image (opencv image): An image made of size x size blocks, one per stone.
+            sample_boundaries (np.ndarray): A (size, size, 4) array of the block boundaries.
+        """
+        maps, sample_boundaries = self.sampler(samples_per_cell)
+        map_1, map_2 = maps
+        sample_image = cv2.remap(image, map_1, map_2, cv2.INTER_LINEAR)
+        return sample_image, sample_boundaries
+
+    def sampler(self, samples_per_cell):
+        """The cached cv2.remap maps and block boundaries that `sample` uses"""
+        if samples_per_cell not in self._samplers:
+            offsets = (np.arange(samples_per_cell) + 0.5) / samples_per_cell
+            x_bounds = self.boundaries[0, :, :2]
+            y_bounds = self.boundaries[:, 0, 2:]
+            xs = _spread(x_bounds, offsets)[None, :]
+            ys = _spread(y_bounds, offsets)[:, None]
+
+            if len(self.corners) == 4:
+                plan = utils.get_warp_plan(self.corners)
+                map_x, map_y = plan.source_points(xs, ys)
+            else:
+                (xmin, ymin), _ = self.corners
+                map_x, map_y = np.broadcast_arrays(xs + xmin, ys + ymin)
+
+            maps = cv2.convertMaps(
+                np.ascontiguousarray(map_x, np.float32),
+                np.ascontiguousarray(map_y, np.float32),
+                cv2.CV_16SC2,
+            )
+            self._samplers[samples_per_cell] = (
+                maps,
+                get_block_boundaries(self.size, samples_per_cell),
+            )
+        return self._samplers[samples_per_cell]
+
+
+def _spread(bounds, offsets):
+    """Pixel coordinates of evenly spaced samples in each (min, max) band"""
+    low, high = bounds[:, :1], bounds[:, 1:]
+    return (low + offsets[None, :] * (high - low) - 0.5).reshape(-1).astype(np.float32)
+
+
+def get_block_boundaries(size, block_size):
+    """A (size, size, 4) array of boundaries for a grid of block_size x block_size squares"""
+    starts = np.arange(size) * block_size
+    xmin = np.broadcast_to(starts[None, :], (size, size))
+    ymin = np.broadcast_to(starts[:, None], (size, size))
+    return np.stack([xmin, xmin + block_size, ymin, ymin + block_size], axis=-1)
+
+
+@lru_cache(maxsize=16)
+def _cached_board_geometry(corners, image_shape, size):
+    return BoardGeometry(list(corners), image_shape, size)
+
+
+def get_board_geometry(corners, image_shape, size=19):
+    """Return a cached BoardGeometry for these corners, image shape, and board size"""
+    corners = tuple(tuple(int(value) for value in corner) for corner in corners)
+    return _cached_board_geometry(corners, tuple(image_shape[:2]), size)
+
+
+def sort_corners(corners):
+    """Order two corners as topleft, bottomright and four as topleft, topright, bottomleft, bottomright"""
+    if len(corners) == 2:
+        xmin, xmax = sorted([corner[0] for corner in corners])
+        ymin, ymax = sorted([corner[1] for corner in corners])
+        sorted_corners = [(xmin, ymin), (xmax, ymax)]
+
+    if len(corners) == 4:
+        sums = [sum(corner) for corner in corners]
+        topleft_index = sums.index(min(sums))
+        topleft = corners[topleft_index]
+
+        bottomright_index = sums.index(max(sums))
+        bottomright = corners[bottomright_index]
+        remaining_corners = [
+            corner
+            for corner in corners
+            if (corner != topleft) and (corner != bottomright)
+        ]
+        if remaining_corners[0][0] > remaining_corners[1][0]:
+            topright, bottomleft = remaining_corners
+        else:
+            bottomleft, topright = remaining_corners
+        sorted_corners = [topleft, topright, bottomleft, bottomright]
+
+    return sorted_corners
+
+
+def subimage_shape(corners, image_shape):
+    """The (height, width) of the board_subimage that Board.transform_image makes from sorted corners"""
+    if len(corners) == 2:
+        (xmin, ymin), (xmax, ymax) = corners
+        image_height, image_width = image_shape[:2]
+        height = len(range(image_height)[int(ymin) : int(ymax)])
+        width = len(range(image_width)[int(xmin) : int(xmax)])
+        return height, width
+
+    elif len(corners) == 4:
+        return utils.perspective_shape(corners)
+
+
+def get_intersections(xstep, ystep, size=19):
+    """A size x size array of integer (x, y) coordinates spaced xstep and ystep apart"""
+    x_locs = [round((ind * xstep)) for ind in range(size)]
+    y_locs = [round((ind * ystep)) for ind in range(size)]
+
+    return tuple(tuple((x_loc, y_loc) for x_loc in x_locs) for y_loc in y_locs)
+
+
+def get_stone_subimage_boundaries(width, height, xstep, ystep, intersections):
+    """Boundaries +- xstep/2 and ystep/2 around each intersection, kept inside the image"""
+    boundaries = []
+    for row in intersections:
+        boundary_row = []
+        for loc in row:
+            xmin, ymin = (
+                max(0, int(loc[0] - xstep / 2)),
+                max(0, int(loc[1] - ystep / 2)),
+            )
+            xmax, ymax = (
+                int(min(loc[0] + xstep / 2, width)),
+                int(min(loc[1] + ystep / 2, height)),
+            )
+            boundary_row.append((xmin, xmax, ymin, ymax))
+        boundaries.append(tuple(boundary_row))
+    return tuple(boundaries)
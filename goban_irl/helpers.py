@@ -2,6 +2,7 @@ import pyautogui
 import goban_irl.opencv_utilities as utils
 
 from goban_irl.board import Board
+from goban_irl.timing import timings
 
 
 def boxify(string):
@@ -32,21 +33,24 @@ def get_nearest_intersection(xstep, ystep, click):
     return (round(click[1] / ystep), round(click[0] / xstep))
 
 
+@timings.timed("click")
 def click(board, missing_stone_location, screen_scale=2):
     start_x, start_y = pyautogui.position()
     i, j, _, _ = missing_stone_location
     screen_position = board.intersections[i][j]
     topleft = board.corners[0]
+    offset = board.offset
 
     click_location = [
-        (screen_position[index] + topleft[index]) // screen_scale for index in range(2)
+        (screen_position[index] + topleft[index] + offset[index]) // screen_scale
+        for index in range(2)
     ]
     pyautogui.moveTo(click_location[0], click_location[1])
     pyautogui.click()
     pyautogui.moveTo(start_x, start_y)
 
 
-def print_describe_missing(missing_stones, board_name):
+def print_describe_missing(missing_stones, board_name, size=19):
     print("")
     if len(missing_stones) == 0:
         print("Board {} is not missing any stones".format(board_name))
@@ -66,8 +70,8 @@ def print_describe_missing(missing_stones, board_name):
             for (i, j, this_stone, other_stone) in missing_stones:
                 print(
                     "    At {} ({}) {} has {} and other board has {}".format(
-                        board._human_readable_alpha((i, j)),
-                        board._human_readable_numeric((i, j)),
+                        board._human_readable_alpha((i, j), size),
+                        board._human_readable_numeric((i, j), size),
                         board_name,
                         this_stone,
                         other_stone,
@@ -0,0 +1,93 @@
+import cv2
+import numpy as np
+
+
+class IntegralImage:
+    def __init__(self, image):
+        """Summed-area tables for an opencv image so that the mean of any rectangle is O(1)
+
+        A table is built the first time a plane is asked for and reused after that, so
+        each frame costs one pass over the pixels per plane no matter how many stones,
+        detection functions or sub-rectangles are measured.
+
+        Args:
+            image (opencv image): A BGR or BGRA image, usually a board_subimage.
+
+        Attributes:
+            image (opencv image): The image the tables are built from.
+            height (int): Height of the image.
+            width (int): Width of the image.
+
+        Planes:
+            bgr: Every channel of the image, including alpha for screenshots.
+            gray: The opencv grayscale conversion of the image.
+            hsv: The opencv HSV conversion of the image.
+
+        Example:
+            integral = IntegralImage(board.board_subimage)
+            blue = integral.means("bgr", board.stone_subimage_boundaries)[:, :, 0]
+        """
+        self.image = image
+        self.height, self.width = image.shape[:2]
+        self._tables = {}
+
+    def table(self, plane):
+        """The (height + 1, width + 1, channels) summed-area table of a plane"""
+        if plane not in self._tables:
+            self._tables[plane] = self._build_table(self._convert(plane))
+        return self._tables[plane]
+
+    def sums(self, plane, boundaries):
+        """Sum each channel of a plane over rectangles.
+
+        Args:
+            plane (str): One of `bgr`, `gray`, or `hsv`.
+            boundaries: An array of (xmin, xmax, ymin, ymax) with any leading shape,
+                for example the 19x19 stone_subimage_boundaries.
+
+        Returns:
+            An array with the leading shape of boundaries and one entry per channel.
+        """
+        xmin, xmax, ymin, ymax = self._clip(boundaries)
+        table = self.table(plane)
+        return (
+            table[ymax, xmax]
+            - table[ymin, xmax]
+            - table[ymax, xmin]
+            + table[ymin, xmin]
+        ).astype(np.float64)
+
+    def means(self, plane, boundaries):
+        """Average each channel of a plane over rectangles, see `sums`"""
+        xmin, xmax, ymin, ymax = self._clip(boundaries)
+        areas = (xmax - xmin) * (ymax - ymin)
+        return self.sums(plane, boundaries) / areas[..., None]
+
+    def _clip(self, boundaries):
+        boundaries = np.asarray(boundaries).astype(np.intp)
+        xmin, xmax, ymin, ymax = np.moveaxis(boundaries, -1, 0)
+        return (
+            np.clip(xmin, 0, self.width),
+            np.clip(xmax, 0, self.width),
+            np.clip(ymin, 0, self.height),
+            np.clip(ymax, 0, self.height),
+        )
+
+    def _convert(self, plane):
+        if plane == "bgr":
+            return self.image
+        elif plane == "gray":
+            return cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        elif plane == "hsv":
+            return cv2.cvtColor(self.image, cv2.COLOR_BGR2HSV)
+        raise ValueError("Unknown plane {}".format(plane))
+
+    @staticmethod
+    def _build_table(image):
+        height, width = image.shape[:2]
+        if 255 * height * width < np.iinfo(np.int32).max:
+            sdepth = cv2.CV_32S
+        else:
+            sdepth = cv2.CV_64F
+        table = cv2.integral(image, sdepth=sdepth)
+        return table.reshape(height + 1, width + 1, -1)
@@ -1,7 +1,11 @@
+from functools import lru_cache
+
 import cv2
 import mss
 import numpy as np
 
+from goban_irl.timing import timings
+
 
 def find_width_and_height(start, end):
     """Given two points (x1, y1), (x2, y2)
@@ -19,25 +23,90 @@ def crop(image, boundary):
     return image[int(ymin) : int(ymax), int(xmin) : int(xmax)]
 
 
-def perspective_transform(image, corners):
-    """Does opencv perspective transform with 4 corners as input)"""
-    japan_board_ratio = 454.5 / 424.2
-    topleft, topright, bottomleft, bottomright = corners
+JAPAN_BOARD_RATIO = 454.5 / 424.2
+
+
+def perspective_shape(corners):
+    """The (height, width) of the image perspective_transform makes from 4 corners"""
+    _, _, bottomleft, bottomright = corners
     width, _ = find_width_and_height(bottomright, bottomleft)
-    _, height = find_width_and_height(topright, bottomright)
-    source = np.array(corners, np.float32)
-    destination = np.array(
-        [(0, 0), (width, 0), (0, height), (width, height)], np.float32
-    )
-    M = cv2.getPerspectiveTransform(source, destination)
-    transformed_subimage = cv2.warpPerspective(image, M, (width, height))
-    board_subimage = scale_image(
-        transformed_subimage,
-        target_width=width,
-        target_height=int(japan_board_ratio * width),
-    )
+    return int(JAPAN_BOARD_RATIO * width), width
+
+
+class WarpPlan:
+    def __init__(self, corners):
+        """A perspective transform and board ratio resize fused into one opencv remap.
+
+        Building the plan does the expensive work once per set of corners: the homography,
+        the board ratio scaling and fixed-point remap maps for every board_subimage pixel.
+        Applying it to a frame is then a single cv2.remap.
+
+        Args:
+            corners (list[tuple[int, int]]): topleft, topright, bottomleft, bottomright.
+
+        Attributes:
+            height (int): Height of the board_subimage.
+            width (int): Width of the board_subimage.
+            destination_to_source (np.ndarray): 3x3 matrix from board_subimage pixels to image pixels.
+            maps (tuple[np.ndarray, np.ndarray]): CV_16SC2 maps for cv2.remap.
+        """
+        topleft, topright, bottomleft, bottomright = corners
+        warp_width, _ = find_width_and_height(bottomright, bottomleft)
+        _, warp_height = find_width_and_height(topright, bottomright)
+        self.height, self.width = perspective_shape(corners)
+
+        source = np.array(corners, np.float32)
+        destination = np.array(
+            [(0, 0), (warp_width, 0), (0, warp_height), (warp_width, warp_height)],
+            np.float32,
+        )
+        M = cv2.getPerspectiveTransform(source, destination)
+
+        xscale = warp_width / self.width
+        yscale = warp_height / self.height
+        resize = np.array(
+            [
+                [xscale, 0, (xscale - 1) / 2],
+                [0, yscale, (yscale - 1) / 2],
+                [0, 0, 1],
+            ]
+        )
+        self.destination_to_source = np.linalg.inv(M) @ resize
+
+        xs = np.arange(self.width, dtype=np.float32)[None, :]
+        ys = np.arange(self.height, dtype=np.float32)[:, None]
+        map_x, map_y = self.source_points(xs, ys)
+        self.maps = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+    def source_points(self, xs, ys):
+        """Image coordinates of board_subimage points, xs and ys broadcast together"""
+        H = self.destination_to_source.astype(np.float32)
+        denominator = H[2, 0] * xs + H[2, 1] * ys + H[2, 2]
+        source_x = (H[0, 0] * xs + H[0, 1] * ys + H[0, 2]) / denominator
+        source_y = (H[1, 0] * xs + H[1, 1] * ys + H[1, 2]) / denominator
+        return source_x, source_y
+
+    def apply(self, image):
+        map_1, map_2 = self.maps
+        return cv2.remap(image, map_1, map_2, cv2.INTER_LINEAR)
+
+
+@lru_cache(maxsize=16)
+def _cached_warp_plan(corners):
+    return WarpPlan(corners)
+
+
+def get_warp_plan(corners):
+    """Return a cached WarpPlan for 4 sorted corners"""
+    return _cached_warp_plan(tuple(tuple(corner) for corner in corners))
+
+
+def perspective_transform(image, corners):
+    """Does opencv perspective transform with 4 corners as input)
 
-    return board_subimage
+    The transform and resize are done with a cached WarpPlan for the corners.
+    """
+    return get_warp_plan(corners).apply(image)
 
 
 def scale_image(image, target_width, target_height):
@@ -188,24 +257,211 @@ DETECTION_FUNCTIONS = [
     check_bgr_and_bw,
 ]
 
+# Detection functions that only return a few fixed values, which an offset per position
+# would push across the cutoffs instead of evening out
+STEPPED_DETECTION_FUNCTIONS = [
+    check_subimage_max_difference,
+    check_max_difference,
+]
+
+
+def inner_boundaries(boundaries):
+    """The crop done by the *_subimage detection functions for an array of boundaries"""
+    boundaries = np.asarray(boundaries)
+    xmin, xmax, ymin, ymax = np.moveaxis(boundaries, -1, 0)
+    width = xmax - xmin
+    height = ymax - ymin
+    return np.stack(
+        [
+            xmin + 2 * width // 5,
+            xmin + 4 * width // 5,
+            ymin + 2 * height // 5,
+            ymin + 4 * height // 5,
+        ],
+        axis=-1,
+    )
+
+
+def check_bgr_blue_grid(integral, boundaries):
+    return integral.means("bgr", boundaries)[..., 0]
+
+
+def check_hsv_value_grid(integral, boundaries):
+    return integral.means("hsv", boundaries)[..., 2]
+
+
+def check_bw_grid(integral, boundaries):
+    return integral.means("gray", boundaries)[..., 0]
+
+
+def check_bgr_subimage_grid(integral, boundaries):
+    return check_bgr_blue_grid(integral, inner_boundaries(boundaries))
+
+
+def check_bw_subimage_grid(integral, boundaries):
+    return check_bw_grid(integral, inner_boundaries(boundaries))
+
+
+def check_subimage_max_difference_grid(integral, boundaries):
+    return check_max_difference_grid(integral, inner_boundaries(boundaries))
+
+
+def check_sum_grid(integral, boundaries):
+    return integral.means("bgr", boundaries).sum(axis=-1)
+
+
+def check_max_difference_grid(integral, boundaries):
+    average = integral.means("bgr", boundaries)
+    max_difference = np.maximum(
+        abs(average[..., 1] - average[..., 0]),
+        abs(average[..., 2] - average[..., 0]),
+    )
+    score = average.sum(axis=-1)
+    return np.where(max_difference < 70, np.where(score > 700, 800, 600), 700)
+
+
+def check_bgr_and_bw_grid(integral, boundaries):
+    return check_bgr_blue_grid(integral, boundaries) + check_bw_grid(
+        integral, boundaries
+    )
+
+
+GRID_DETECTION_FUNCTIONS = {
+    check_bgr_blue: check_bgr_blue_grid,
+    check_hsv_value: check_hsv_value_grid,
+    check_bw: check_bw_grid,
+    check_bgr_subimage: check_bgr_subimage_grid,
+    check_bw_subimage: check_bw_subimage_grid,
+    check_subimage_max_difference: check_subimage_max_difference_grid,
+    check_sum: check_sum_grid,
+    check_max_difference: check_max_difference_grid,
+    check_bgr_and_bw: check_bgr_and_bw_grid,
+}
+
+
+class LinearDetection:
+    def __init__(self, functions, weights):
+        """A weighted sum of detection functions, which is itself a detection function.
+
+        Calibration builds these when two functions together separate the stones better
+        than either alone. The name lists the weights and functions, for example
+        `0.25*check_bw+0.75*check_sum`, so it can be saved in board metadata and read
+        back with load_detection_function.
+
+        Args:
+            functions (list[function: opencv image -> int]): Functions from DETECTION_FUNCTIONS.
+            weights (list[float]): How much of each function to add.
+        """
+        self.functions = list(functions)
+        self.weights = [float(weight) for weight in weights]
+        self.__name__ = "+".join(
+            "{!r}*{}".format(weight, function.__name__)
+            for weight, function in zip(self.weights, self.functions)
+        )
+
+    def __call__(self, image):
+        return sum(
+            weight * function(image)
+            for weight, function in zip(self.weights, self.functions)
+        )
+
+    def grid(self, integral, boundaries):
+        return sum(
+            weight * GRID_DETECTION_FUNCTIONS[function](integral, boundaries)
+            for weight, function in zip(self.weights, self.functions)
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, LinearDetection) and self.__name__ == other.__name__
+
+    def __hash__(self):
+        return hash(self.__name__)
+
+    def __repr__(self):
+        return "LinearDetection({})".format(self.__name__)
+
+
+def get_grid_function(detection_function):
+    """The version of a detection function that scores a whole grid from an IntegralImage, or None"""
+    if isinstance(detection_function, LinearDetection):
+        return detection_function.grid
+    return GRID_DETECTION_FUNCTIONS.get(detection_function)
+
 
 def load_detection_function(function_name):
+    if "*" in function_name:
+        functions, weights = [], []
+        for term in function_name.split("+"):
+            weight, name = term.split("*")
+            functions.append(load_detection_function(name))
+            weights.append(float(weight))
+        return LinearDetection(functions, weights)
     for function in DETECTION_FUNCTIONS:
         if function_name == function.__name__:
             return function
     raise ValueError("Detection function {} not loaded".format(function_name))
 
 
-def get_snapshot(loader_type, sct=None):
+def get_capture_region(corners, screen_scale=1, margin=20):
+    """The part of the screen to grab to see a board, for get_snapshot
+
+    Args:
+        corners (list[tuple[int, int]]): Corners of the board in full screenshot pixels.
+        screen_scale (float): Screenshot pixels per screen point, see helpers.get_scale.
+        margin (int): Extra screenshot pixels to grab on each side of the board.
+
+    Returns:
+        region (dict): left, top, width and height in screen points relative to the monitor.
+        offset (tuple[int, int]): The screenshot pixel of the top left of the grabbed image.
+    """
+    xs = [corner[0] for corner in corners]
+    ys = [corner[1] for corner in corners]
+    left = max(0, int((min(xs) - margin) // screen_scale))
+    top = max(0, int((min(ys) - margin) // screen_scale))
+    right = int(-(-(max(xs) + margin) // screen_scale))
+    bottom = int(-(-(max(ys) + margin) // screen_scale))
+
+    region = {"left": left, "top": top, "width": right - left, "height": bottom - top}
+    offset = (round(left * screen_scale), round(top * screen_scale))
+    return region, offset
+
+
+@timings.timed("get_snapshot")
+def get_snapshot(loader_type, sct=None, region=None, source=None):
+    """Take a screenshot or webcam picture
+
+    Args:
+        loader_type (str): Either `virtual` for the screen or `physical` for the webcam.
+        sct (mss.mss): An open mss instance to reuse between screenshots.
+        region (dict): Only grab this part of the screen, see get_capture_region.
+        source (CameraSource): An open webcam to take the latest frame from.
+    """
     if loader_type == "virtual":
         if sct is None:
             with mss.mss() as sct:
-                img = np.array(sct.grab(sct.monitors[1]))
+                img = grab_screen(sct, region)
         else:
-            img = np.array(sct.grab(sct.monitors[1]))
-        height, width, _ = img.shape
+            img = grab_screen(sct, region)
 
     elif loader_type == "physical":
-        img = video_capture()
+        if source is None:
+            img = video_capture()
+        else:
+            img = source.latest()
 
     return img
+
+
+@timings.timed("grab_screen")
+def grab_screen(sct, region=None):
+    monitor = sct.monitors[1]
+    if region is not None:
+        left = min(region["left"], monitor["width"] - 1)
+        top = min(region["top"], monitor["height"] - 1)
+        monitor = {
+            "left": monitor["left"] + left,
+            "top": monitor["top"] + top,
+            "width": min(region["width"], monitor["width"] - left),
+            "height": min(region["height"], monitor["height"] - top),
+        }
+    return np.asarray(sct.grab(monitor))
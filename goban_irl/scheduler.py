@@ -0,0 +1,74 @@
+import time
+
+# Scan rates in board metadata, next to `delay`, and what boards saved without them use
+SCAN_DEFAULTS = {
+    "fps": 10,
+    "boost_fps": 30,
+    "idle_fps": 2,
+    "boost_seconds": 10,
+    "idle_seconds": 30,
+}
+
+
+class ScanScheduler:
+    def __init__(
+        self,
+        fps=10,
+        boost_fps=30,
+        idle_fps=2,
+        boost_seconds=10,
+        idle_seconds=30,
+    ):
+        """Decide how long to wait between scans from how recently a board changed.
+
+        A move is usually followed by a reply, so for boost_seconds after a change scans
+        run at boost_fps. After that they run at fps. Once nothing has changed for
+        idle_seconds the rate halves every idle_seconds more, down to idle_fps.
+
+        Args:
+            fps (float): Scans per second while a game is going on.
+            boost_fps (float): Scans per second just after a change.
+            idle_fps (float): The fewest scans per second when nothing changes.
+            boost_seconds (float): How long to stay at boost_fps after a change.
+            idle_seconds (float): How long without changes before backing off.
+
+        Example:
+            scheduler = ScanScheduler.from_metadata(first_board_metadata)
+            while True:
+                scheduler.record(changes.changed(get_snapshot("physical")))
+                time.sleep(scheduler.interval())
+        """
+        self.fps = fps
+        self.boost_fps = boost_fps
+        self.idle_fps = idle_fps
+        self.boost_seconds = boost_seconds
+        self.idle_seconds = idle_seconds
+        self.last_change = time.monotonic()
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """A ScanScheduler with the rates saved in board metadata, see SCAN_DEFAULTS"""
+        return cls(
+            **{key: metadata.get(key, value) for key, value in SCAN_DEFAULTS.items()}
+        )
+
+    def record(self, changed, now=None):
+        """Tell the scheduler whether the latest scan saw a change"""
+        if changed:
+            self.last_change = time.monotonic() if now is None else now
+
+    def current_fps(self, now=None):
+        """The scan rate for the time since the last change"""
+        if now is None:
+            now = time.monotonic()
+        quiet = now - self.last_change
+        if quiet < self.boost_seconds:
+            return self.boost_fps
+        if quiet < self.idle_seconds:
+            return self.fps
+        halvings = int(quiet // self.idle_seconds)
+        return max(self.idle_fps, self.fps / 2**halvings)
+
+    def interval(self, now=None, elapsed=0):
+        """Seconds to wait before the next scan, given the last one took elapsed seconds"""
+        return max(0, 1 / self.current_fps(now) - elapsed)
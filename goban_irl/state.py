@@ -0,0 +1,232 @@
+import re
+
+import numpy as np
+
+BLACK = -1
+EMPTY = 0
+WHITE = 1
+
+# Indexed by stone value, so STONES[BLACK] == "black"
+STONES = ("empty", "white", "black")
+VALUES = {"black": BLACK, "empty": EMPTY, "white": WHITE}
+
+DIFF_DTYPE = np.dtype(
+    [("row", np.int16), ("col", np.int16), ("this", np.int8), ("other", np.int8)]
+)
+
+
+def diff(state_array, other_state_array):
+    """Every position where two state arrays differ, as a structured array of DIFF_DTYPE"""
+    mismatched = state_array != other_state_array
+    rows, columns = np.nonzero(mismatched)
+    differences = np.empty(len(rows), dtype=DIFF_DTYPE)
+    differences["row"] = rows
+    differences["col"] = columns
+    differences["this"] = state_array[mismatched]
+    differences["other"] = other_state_array[mismatched]
+    return differences
+
+
+def to_array(state):
+    """Turn a nested list of `black`, `empty` and `white` (or stone values) into an int8 array"""
+    if isinstance(state, StateView):
+        return state.array.copy()
+    state = np.asarray(state)
+    if state.dtype.kind in "US":
+        return np.vectorize(VALUES.__getitem__, otypes=[np.int8])(state)
+    return state.astype(np.int8)
+
+
+def to_strings(array):
+    """Turn an int8 state array into a nested list of `black`, `empty` and `white`"""
+    return np.array(STONES)[np.asarray(array)].tolist()
+
+
+def from_sgf(sgf, size=None):
+    """The position at the end of the main line of an SGF game as an int8 state array.
+
+    Setup stones (AB, AW, AE) and moves (B, W) are placed in order. After each move, the
+    opponent groups it leaves without liberties are captured, and then the mover's own
+    group if it has none, so the position matches the board at the end of the game.
+
+    Args:
+        sgf (str): The text of an SGF file.
+        size (int): The board size. If None, use the SZ property, or 19 without one.
+    """
+    properties = re.findall(
+        r"([A-Z]+)\s*((?:\[(?:[^\]\\]|\\.)*\]\s*)+)", _main_line(sgf)
+    )
+    if size is None:
+        sizes = [values for name, values in properties if name == "SZ"]
+        size = int(re.findall(r"\d+", sizes[0])[0]) if sizes else 19
+
+    state = np.zeros((size, size), np.int8)
+    placed = {"AB": BLACK, "AW": WHITE, "AE": EMPTY, "B": BLACK, "W": WHITE}
+    for name, values in properties:
+        if name not in placed:
+            continue
+        for value in re.findall(r"\[([^\]]*)\]", values):
+            for row, col in _sgf_points(value, size):
+                state[row, col] = placed[name]
+                if name in ("B", "W"):
+                    _capture(state, row, col)
+    return state
+
+
+def _capture(state, row, col):
+    """Remove the groups left without liberties by the stone at (row, col), opponents first"""
+    colour = state[row, col]
+    neighbours = _neighbours(state, row, col)
+    for point in neighbours:
+        if state[point] == -colour:
+            _remove_if_captured(state, point)
+    _remove_if_captured(state, (row, col))
+
+
+def _remove_if_captured(state, point):
+    colour = state[point]
+    group = {point}
+    frontier = [point]
+    while frontier:
+        for neighbour in _neighbours(state, *frontier.pop()):
+            if state[neighbour] == EMPTY:
+                return
+            if state[neighbour] == colour and neighbour not in group:
+                group.add(neighbour)
+                frontier.append(neighbour)
+    for stone in group:
+        state[stone] = EMPTY
+
+
+def _neighbours(state, row, col):
+    size = len(state)
+    return [
+        (i, j)
+        for i, j in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]
+        if 0 <= i < size and 0 <= j < size
+    ]
+
+
+def _main_line(sgf):
+    """The SGF text of the first variation at every branch, values included"""
+    text = []
+    depth = 0
+    closed = set()
+    skip = None
+    in_value = False
+    escaped = False
+    for character in sgf:
+        if in_value:
+            if escaped:
+                escaped = False
+            elif character == "\\":
+                escaped = True
+            elif character == "]":
+                in_value = False
+        elif character == "[":
+            in_value = True
+        elif character == "(":
+            depth += 1
+            if skip is None and depth in closed:
+                skip = depth
+            continue
+        elif character == ")":
+            if skip == depth:
+                skip = None
+            closed.discard(depth + 1)
+            closed.add(depth)
+            depth -= 1
+            continue
+        if skip is None:
+            text.append(character)
+    return "".join(text)
+
+
+def _sgf_points(value, size):
+    """The (row, col) of an SGF point like `dp`, or every point in a rectangle like `aa:cc`"""
+    corners = value.split(":")
+    if any(len(corner) != 2 for corner in corners):
+        return []
+    (col_1, row_1), (col_2, row_2) = [
+        (ord(corner[0]) - ord("a"), ord(corner[1]) - ord("a"))
+        for corner in (corners * 2)[:2]
+    ]
+    if max(col_1, row_1, col_2, row_2) >= size:
+        return []
+    return [
+        (row, col)
+        for row in range(min(row_1, row_2), max(row_1, row_2) + 1)
+        for col in range(min(col_1, col_2), max(col_1, col_2) + 1)
+    ]
+
+
+class StateView:
+    def __init__(self, array):
+        """A nested list of `black`, `empty` and `white` backed by an int8 state array.
+
+        Reading gives strings and writing strings updates the array, so code written for
+        the list of lists of strings keeps working while the array does the heavy lifting.
+
+        Args:
+            array (np.ndarray): A 2d int8 array of BLACK, EMPTY, and WHITE.
+
+        Example:
+            state = StateView(np.zeros((19, 19), np.int8))
+            state[3][15] = "black"
+            assert state.array[3, 15] == BLACK
+        """
+        self.array = array
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [_RowView(row) for row in self.array[index]]
+        return _RowView(self.array[index])
+
+    def __setitem__(self, index, row):
+        self.array[index] = to_array(row)
+
+    def __iter__(self):
+        for row in self.array:
+            yield _RowView(row)
+
+    def __len__(self):
+        return len(self.array)
+
+    def __eq__(self, other):
+        if isinstance(other, StateView):
+            return np.array_equal(self.array, other.array)
+        return self.tolist() == other
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def tolist(self):
+        return to_strings(self.array)
+
+
+class _RowView:
+    def __init__(self, array):
+        self.array = array
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return to_strings(self.array[index])
+        return STONES[self.array[index]]
+
+    def __setitem__(self, index, value):
+        self.array[index] = VALUES[value]
+
+    def __iter__(self):
+        for value in self.array:
+            yield STONES[value]
+
+    def __len__(self):
+        return len(self.array)
+
+    def __eq__(self, other):
+        if isinstance(other, _RowView):
+            return np.array_equal(self.array, other.array)
+        return list(self) == other
+
+    def __repr__(self):
+        return repr(list(self))
@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+
+from goban_irl.state import EMPTY
+
+# Settings in physical board metadata, and what physical boards saved without them use
+FILTER_DEFAULTS = {
+    "stable_frames": 3,
+    "stable_seconds": 0.5,
+    "min_confidence": 0,
+}
+
+# Kept in the history for readings too close to a cutoff to trust
+UNSURE = 2
+
+
+class TemporalFilter:
+    def __init__(self, size=19, frames=3, seconds=0.5, min_confidence=0):
+        """Only accept a change to a position once it has been read the same way for a while.
+
+        The latest frames readings of every position are kept in a ring of size x size
+        arrays. A position changes once all of them agree on the new value and it has
+        been read that way for at least seconds, so a hand passing over the board or a
+        single noisy frame is never taken for a move, however fast scans run. Readings
+        with a confidence below min_confidence, see Board.confidence, never count.
+
+        Args:
+            size (int): The number of lines on the board.
+            frames (int): How many readings in a row must agree. 1 accepts every reading.
+            seconds (float): How long a new reading must last.
+            min_confidence (float): The lowest confidence of a reading that counts.
+
+        Attributes:
+            state_array (np.ndarray): The accepted size x size int8 state, or None before the first reading.
+
+        Example:
+            state_filter = TemporalFilter(frames=3, seconds=0.5)
+            while True:
+                board.update(get_snapshot("physical"))
+                if state_filter.update(board.state_array, board.confidence):
+                    print(StateView(state_filter.state_array))
+        """
+        self.size = size
+        self.frames = frames
+        self.seconds = seconds
+        self.min_confidence = min_confidence
+        self.state_array = None
+        self._history = np.zeros((frames, size, size), np.int8)
+        self._since = np.zeros((size, size))
+        self._index = 0
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """A TemporalFilter with the settings in board metadata.
+
+        Physical boards use FILTER_DEFAULTS for missing settings. Screenshots of virtual
+        boards do not flicker, so their readings are accepted at once unless set otherwise.
+        """
+        defaults = {"stable_frames": 1, "stable_seconds": 0, "min_confidence": 0}
+        if metadata.get("loader_type") == "physical":
+            defaults = FILTER_DEFAULTS
+        settings = {key: metadata.get(key, value) for key, value in defaults.items()}
+        return cls(
+            size=metadata.get("size", 19),
+            frames=settings["stable_frames"],
+            seconds=settings["stable_seconds"],
+            min_confidence=settings["min_confidence"],
+        )
+
+    @property
+    def pending(self):
+        """Whether a confident latest reading differs from the accepted state anywhere"""
+        if self.state_array is None:
+            return False
+        latest = self._history[self._latest]
+        return bool(((latest != self.state_array) & (latest != UNSURE)).any())
+
+    @property
+    def _latest(self):
+        return (self._index - 1) % self.frames
+
+    def update(self, state_array, confidence=None, now=None):
+        """Add a reading of the board and accept the positions that have settled.
+
+        Args:
+            state_array (np.ndarray): A size x size int8 reading of BLACK, EMPTY, or WHITE.
+            confidence (np.ndarray): How sure each position of the reading is, or None.
+            now (float): The time of the reading. Defaults to time.monotonic().
+
+        Returns:
+            changed (bool): Whether the accepted state changed.
+        """
+        if now is None:
+            now = time.monotonic()
+        reading = np.asarray(state_array, dtype=np.int8)
+        if confidence is not None:
+            reading = np.where(confidence < self.min_confidence, UNSURE, reading)
+
+        if self.state_array is None:
+            self._history[:] = reading
+            self._since[:] = now
+            self._index = 1 % self.frames
+            self.state_array = np.where(reading == UNSURE, EMPTY, reading).astype(
+                np.int8
+            )
+            return True
+
+        self._since[reading != self._history[self._latest]] = now
+        self._history[self._index] = reading
+        self._index = (self._index + 1) % self.frames
+
+        settled = (
+            (self._history == reading).all(axis=0)
+            & (now - self._since >= self.seconds)
+            & (reading != UNSURE)
+            & (reading != self.state_array)
+        )
+        if not settled.any():
+            return False
+        self.state_array[settled] = reading[settled]
+        return True
@@ -0,0 +1,144 @@
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class Timings:
+    def __init__(self, window=1000):
+        """Rolling timings of each stage of the scan loop, and counters of what happened.
+
+        Each stage keeps its last window durations, so percentiles follow the recent
+        behaviour of the loop rather than its whole history. Recording is cheap enough
+        to leave on, and `enabled` turns it off entirely.
+
+        Args:
+            window (int): How many of the latest durations to keep per stage.
+
+        Attributes:
+            enabled (bool): Whether stages and counts are recorded.
+            counters (dict[str, int]): Totals such as scans and dropped frames.
+
+        Example:
+            with timings.stage("find_state"):
+                state = board.find_state(...)
+            timings.count("scans")
+            print(timings.report())
+        """
+        self.window = window
+        self.enabled = True
+        self.counters = {}
+        self._durations = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+        self._start = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        """Time the body of a with block as one run of a stage"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorate a function so that every call is timed as a run of a stage"""
+
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+
+            return wrapper
+
+        return decorator
+
+    def record(self, name, seconds):
+        """Add one duration of a stage"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if name not in self._durations:
+                self._durations[name] = deque(maxlen=self.window)
+                self._totals[name] = 0
+            self._durations[name].append(seconds)
+            self._totals[name] += 1
+
+    def count(self, name, number=1):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + number
+
+    def percentiles(self, name, percentiles=(50, 95, 99)):
+        """The given percentiles of a stage's recent durations in milliseconds"""
+        with self._lock:
+            durations = np.array(self._durations.get(name, ()))
+        if len(durations) == 0:
+            return {"p{}".format(p): None for p in percentiles}
+        values = np.percentile(durations * 1000, percentiles)
+        return {"p{}".format(p): float(v) for p, v in zip(percentiles, values)}
+
+    def summary(self):
+        """Every stage's run count and recent p50, p95, and p99 in milliseconds, and every counter"""
+        with self._lock:
+            names = list(self._durations)
+            totals = dict(self._totals)
+            counters = dict(self.counters)
+        stages = {}
+        for name in names:
+            stages[name] = {"count": totals[name]}
+            stages[name].update(self.percentiles(name))
+        return {
+            "time": time.time(),
+            "uptime": time.time() - self._start,
+            "stages": stages,
+            "counters": counters,
+        }
+
+    def report(self):
+        """The summary as a table for printing"""
+        summary = self.summary()
+        lines = [
+            "{:<20}{:>8}{:>10}{:>10}{:>10}".format("stage", "runs", "p50", "p95", "p99")
+        ]
+        for name, stage in summary["stages"].items():
+            lines.append(
+                "{:<20}{:>8}{:>10.2f}{:>10.2f}{:>10.2f}".format(
+                    name, stage["count"], stage["p50"], stage["p95"], stage["p99"]
+                )
+            )
+        for name, value in summary["counters"].items():
+            lines.append("{:<20}{:>8}".format(name, value))
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """Append the summary to a JSON lines file"""
+        with open(path, "a") as f:
+            f.write(json.dumps(self.summary()) + "\n")
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self._durations = {}
+            self._totals = {}
+            self._start = time.time()
+
+
+# Shared by the board, snapshot, and ui code so one report covers the whole scan loop
+timings = Timings()
@@ -1,10 +1,16 @@
+import asyncio
+import contextlib
 import json
 import os
-import time
 import mss
+import numpy as np
 
 
 from goban_irl.board import Board
+from goban_irl.calibration import CutoffTracker
+from goban_irl.change_detector import ChangeDetector
+from goban_irl.frame_buffer import FrameBuffer, FrameProducer
+from goban_irl.frame_source import CameraSource, ScreenSource
 from goban_irl.helpers import (
     boxify,
     prompt_handler,
@@ -13,8 +19,15 @@ from goban_irl.helpers import (
     click,
     print_describe_missing,
 )
+from goban_irl.scheduler import SCAN_DEFAULTS, ScanScheduler
+from goban_irl.state import STONES, diff
+from goban_irl.temporal_filter import FILTER_DEFAULTS, TemporalFilter
+from goban_irl.timing import timings
 import goban_irl.opencv_utilities as utils
 
+# More stones than this newly missing in one scan is a catch up or a misread, not a move
+MAX_NEW_STONES = 2
+
 
 def welcome_message():
     welcome_message = boxify("Welcome!")
@@ -54,6 +67,8 @@ def load_existing_metadata(board_metadata):
         loaded_boards_message = ""
         loaded_boards_message += "Board ({}):\n".format(board_metadata["name"])
         for key, value in board_metadata.items():
+            if key == "baseline":
+                value = "measured ({0}x{0})".format(board_metadata.get("size", 19))
             loaded_boards_message += "    {} = {}\n".format(key, value)
         loaded_boards_message += "\n"
         print(loaded_boards_message)
@@ -62,19 +77,83 @@ def load_existing_metadata(board_metadata):
         return board_metadata, False
 
 
-def load_board_from_metadata(metadata, sct=None, debug=False):
+def load_board_from_metadata(
+    metadata,
+    sct=None,
+    debug=False,
+    screen_scale=None,
+    screen_source=None,
+    camera_source=None,
+    change_detector=None,
+    previous_board=None,
+):
+    """Take a snapshot and make a Board from saved board metadata.
+
+    Given a screen_scale, virtual boards only grab the part of the screen around their
+    corners and the Board is given the offset of that region so clicks still land.
+    Given a ScreenSource, virtual boards use their view of its latest grab instead.
+    Given a CameraSource, physical boards use its latest frame instead of opening the webcam.
+    Given the previous Board, update it in place with the new snapshot instead of making a
+    new Board. Given a ChangeDetector as well, skip the update when the snapshot has not changed.
+    """
     detection_function = utils.load_detection_function(metadata["detection_function"])
-    return Board(
-        image=utils.get_snapshot(metadata["loader_type"], sct=sct),
-        corners=metadata["corners"],
+    corners = metadata["corners"]
+    offset = (0, 0)
+    if screen_source is not None and metadata["loader_type"] == "virtual":
+        image, offset = screen_source.view(corners)
+    elif screen_scale is not None and metadata["loader_type"] == "virtual":
+        region, offset = utils.get_capture_region(corners, screen_scale)
+        image = utils.get_snapshot(metadata["loader_type"], sct=sct, region=region)
+    else:
+        image = utils.get_snapshot(
+            metadata["loader_type"], sct=sct, source=camera_source
+        )
+    corners = [(x - offset[0], y - offset[1]) for (x, y) in corners]
+
+    if change_detector is not None:
+        if not change_detector.changed(image) and previous_board is not None:
+            return previous_board
+
+    if previous_board is not None:
+        previous_board.update(image)
+        return previous_board
+
+    board = Board(
+        image=image,
+        corners=corners,
         detection_function=detection_function,
         cutoffs=metadata["cutoffs"],
         flip=metadata["flip"],
         debug=debug,
+        samples_per_cell=metadata.get("samples_per_cell"),
+        offset=offset,
+        size=metadata.get("size", 19),
+        baseline=metadata.get("baseline"),
     )
+    return board
+
+
+@contextlib.contextmanager
+def open_camera(*board_metadata):
+    """Open the webcam of the first physical board, see the `camera` setting in watch_boards.
+
+    Its exposure is given time to settle before it is used, so pictures taken from it
+    with get_snapshot are not too dark. Gives None when every board is virtual.
+
+    Example:
+        with open_camera(board_metadata) as camera_source:
+            image = utils.get_snapshot(board_metadata["loader_type"], source=camera_source)
+    """
+    for metadata in board_metadata:
+        if metadata.get("loader_type") == "physical":
+            with CameraSource(**metadata.get("camera", {})) as camera_source:
+                camera_source.settled()
+                yield camera_source
+            return
+    yield None
 
 
-def interactive_corners(loader_type):
+def interactive_corners(loader_type, camera_source=None):
     cornerloader_text()
 
     if loader_type == "virtual":
@@ -86,23 +165,40 @@ def interactive_corners(loader_type):
 
     corners = []
     while len(set(corners)) != 2 and len(set(corners)) != 4:
-        snapshot = utils.get_snapshot(loader_type)
+        snapshot = utils.get_snapshot(loader_type, source=camera_source)
         corners = utils.get_clicks(snapshot)
 
     return list(set(corners))
 
 
-def interactive_calibrate(corners, loader_type):
+def interactive_baseline(corners, loader_type, size=19, camera_source=None):
+    """Measure the empty board so each position is read relative to how it looks empty.
+
+    Returns:
+        baseline (dict[str, list]): Values per detection function to save in board metadata.
+    """
+    input("Clear every stone off the board and press Enter to continue...")
+    snapshot = utils.get_snapshot(loader_type, source=camera_source)
+    board = Board(snapshot, corners, size=size)
+    return {
+        name: np.round(values, 2).tolist()
+        for name, values in board.measure_baseline().items()
+    }
+
+
+def interactive_calibrate(
+    corners, loader_type, size=19, baseline=None, camera_source=None
+):
     calibrate_text()
     input("Press Enter to continue...")
-    snapshot = utils.get_snapshot(loader_type)
-    board = Board(snapshot, corners)
+    snapshot = utils.get_snapshot(loader_type, source=camera_source)
+    board = Board(snapshot, corners, size=size, baseline=baseline)
 
     black_clicks = utils.get_clicks(board.board_subimage)
     white_clicks = utils.get_clicks(board.board_subimage)
     empty_clicks = utils.get_clicks(board.board_subimage)
 
-    _, _, xstep, ystep = board._get_board_params(board.board_subimage)
+    _, _, xstep, ystep = board._get_board_params(board.board_subimage, size)
     black_stones = [
         get_nearest_intersection(xstep, ystep, click) for click in black_clicks
     ]
@@ -126,12 +222,64 @@ def interactive_calibrate(corners, loader_type):
     return detection_function, cutoffs
 
 
+def auto_calibrate(board_metadata, reference_metadata):
+    """Calibrate a board from another board that shows the same position.
+
+    Every intersection of the reference board's state labels the board's snapshot, so no
+    clicking is needed. The new detection function and cutoffs are saved to the board's
+    metadata file.
+
+    Args:
+        board_metadata (dict): The board to calibrate, usually the physical board.
+        reference_metadata (dict): A board that reads correctly, usually the virtual board.
+
+    Returns:
+        board_metadata (dict): The metadata with the new detection function and cutoffs.
+    """
+    with open_camera(board_metadata, reference_metadata) as camera_source:
+        reference_board = load_board_from_metadata(
+            reference_metadata, camera_source=camera_source
+        )
+        snapshot = utils.get_snapshot(
+            board_metadata["loader_type"], source=camera_source
+        )
+    board = Board(
+        snapshot,
+        board_metadata["corners"],
+        flip=board_metadata["flip"],
+        size=board_metadata.get("size", 19),
+        baseline=board_metadata.get("baseline"),
+    )
+    detection_function, cutoffs = board.calibrate_from_state(
+        reference_board.state, verbose=True
+    )
+
+    board_metadata = {**board_metadata}
+    board_metadata["detection_function"] = detection_function.__name__
+    board_metadata["cutoffs"] = cutoffs
+    with open(board_metadata["path"], "w") as f:
+        json.dump(board_metadata, f)
+    return board_metadata
+
+
+def board_size_prompt():
+    size_str = input("What size is the board, 9, 13, or 19 (default)? ")
+    if size_str in ["9", "13", "19"]:
+        return int(size_str)
+    elif size_str == "":
+        return 19
+    else:
+        print("Please input 9, 13, or 19")
+        return board_size_prompt()
+
+
 def update_board_metadata(
     board_metadata,
     fix_corners=True,
     fix_calibration=True,
     fix_delay=False,
     fix_click=False,
+    fix_baseline=False,
 ):
     new_metadata = {**board_metadata}
 
@@ -141,28 +289,56 @@ def update_board_metadata(
         fix_calibration = True
 
         new_metadata["delay"] = 0
+        new_metadata.update(SCAN_DEFAULTS)
+        new_metadata["size"] = board_size_prompt()
         if prompt_handler("Is this a virtual board?"):
             new_metadata["loader_type"] = "virtual"
             new_metadata["flip"] = False
             new_metadata["click"] = True
+            new_metadata["adapt_cutoffs"] = False
 
         else:
             new_metadata["loader_type"] = "physical"
             new_metadata["flip"] = True
             new_metadata["click"] = False
+            new_metadata["adapt_cutoffs"] = True
+            new_metadata.update(FILTER_DEFAULTS)
+            fix_baseline = prompt_handler(
+                "Would you like to measure the empty board to even out its lighting?"
+            )
 
-    if fix_corners:
-        new_metadata["corners"] = interactive_corners(new_metadata["loader_type"])
+    camera = contextlib.nullcontext()
+    if fix_corners or fix_baseline or fix_calibration:
+        camera = open_camera(new_metadata)
+    with camera as camera_source:
+        if fix_corners:
+            new_metadata["corners"] = interactive_corners(
+                new_metadata["loader_type"], camera_source=camera_source
+            )
 
-    if fix_calibration:
-        if prompt_handler("Would you like to use the default calibration?"):
-            new_metadata["detection_function"] = utils.check_max_difference.__name__
-            new_metadata["cutoffs"] = (650, 750)
-        else:
-            detection_function, new_metadata["cutoffs"] = interactive_calibrate(
-                new_metadata["corners"], new_metadata["loader_type"]
+        if fix_baseline:
+            new_metadata["baseline"] = interactive_baseline(
+                new_metadata["corners"],
+                new_metadata["loader_type"],
+                new_metadata.get("size", 19),
+                camera_source=camera_source,
             )
-            new_metadata["detection_function"] = detection_function.__name__
+        elif fix_corners:
+            new_metadata.pop("baseline", None)
+
+        if fix_calibration:
+            if prompt_handler("Would you like to use the default calibration?"):
+                new_metadata["detection_function"] = utils.check_max_difference.__name__
+                new_metadata["cutoffs"] = (650, 750)
+            else:
+                detection_function, new_metadata["cutoffs"] = interactive_calibrate(
+                    new_metadata["corners"],
+                    new_metadata["loader_type"],
+                    new_metadata.get("size", 19),
+                    new_metadata.get("baseline"),
+                    camera_source=camera_source,
+                )
+                new_metadata["detection_function"] = detection_function.__name__
 
     if fix_delay:
         delay_str = input("What delay would you like (in seconds)? ")
@@ -193,6 +369,7 @@ def update_handler(board_metadata):
             "c(o)rners",
             "(d)elay",
             "(c)lick",
+            "(b)aseline of the empty board",
             "(n)ew board",
             "(u)se as is (default)",
         ]
@@ -203,6 +380,7 @@ def update_handler(board_metadata):
     fix_calibration = False
     fix_delay = False
     fix_click = False
+    fix_baseline = False
 
     if "a" in modify_choice:
         fix_calibration = True
@@ -214,6 +392,8 @@ def update_handler(board_metadata):
         fix_delay = True
     if "c" in modify_choice:
         fix_click = True
+    if "b" in modify_choice:
+        fix_baseline = True
 
     if "n" in modify_choice:
         fix_corners = True
@@ -226,6 +406,7 @@ def update_handler(board_metadata):
         fix_calibration = False
         fix_delay = False
         fix_click = False
+        fix_baseline = False
 
     board_metadata = update_board_metadata(
         board_metadata,
@@ -233,6 +414,7 @@ def update_handler(board_metadata):
         fix_calibration=fix_calibration,
         fix_delay=fix_delay,
         fix_click=fix_click,
+        fix_baseline=fix_baseline,
     )
 
     return board_metadata
@@ -247,6 +429,7 @@ def exit_handler(first_board_metadata, second_board_metadata):
         "(s)econd board needs update",
         "(r)estart app",
         "(z)oom state forward",
+        "(a)uto calibrate second board from first",
         "(e)xit",
     ]
     print("\n    ".join(options))
@@ -269,6 +452,15 @@ def exit_handler(first_board_metadata, second_board_metadata):
         elif response == "r":
             run_app()
 
+        elif response == "a":
+            try:
+                second_board_metadata = auto_calibrate(
+                    second_board_metadata, first_board_metadata
+                )
+            except ValueError as error:
+                print("Calibration failed: {}".format(error))
+            watch_boards(first_board_metadata, second_board_metadata)
+
         elif response == "z":
             fast_forward(first_board_metadata, second_board_metadata)
             watch_boards(first_board_metadata, second_board_metadata)
@@ -317,8 +509,13 @@ def play_stones(first_board, stones_to_play, up_next, screen_scale, play_odd=Tru
 
 def fast_forward(first_board_metadata, second_board_metadata):
     screen_scale = get_scale()
-    first_board = load_board_from_metadata(first_board_metadata)
-    second_board = load_board_from_metadata(second_board_metadata)
+    with open_camera(first_board_metadata, second_board_metadata) as camera_source:
+        first_board = load_board_from_metadata(
+            first_board_metadata, camera_source=camera_source
+        )
+        second_board = load_board_from_metadata(
+            second_board_metadata, camera_source=camera_source
+        )
     mismatched_stones = first_board.compare_to(second_board)
 
     stones_to_play = [
@@ -330,44 +527,6 @@ def fast_forward(first_board_metadata, second_board_metadata):
     play_stones(first_board, stones_to_play, "black", screen_scale, play_odd=False)
 
 
-def evaluate_state(first_board, second_board, all_pending):
-    mismatched_stones = first_board.compare_to(second_board)
-    current_time = time.time()
-    first_board_missing_stones = [
-        (i, j, this_board_stone, other_board_stone)
-        for (i, j, this_board_stone, other_board_stone) in mismatched_stones
-        if (this_board_stone == "empty")
-    ]
-    all_pending_stones = [stone for (stone, _) in all_pending]
-    new_missing_stones = [
-        (stone, current_time)
-        for stone in first_board_missing_stones
-        if (stone not in all_pending_stones)
-    ]
-    return first_board_missing_stones, new_missing_stones
-
-
-def update_all_pending(
-    all_pending, first_board_missing_stones, new_missing_stones, delay
-):
-    all_pending = [
-        (stone, first_seen)
-        for (stone, first_seen) in all_pending
-        if (stone in first_board_missing_stones)
-    ] + new_missing_stones
-    to_play = [
-        stone
-        for (stone, first_seen) in all_pending
-        if (time.time() - first_seen > delay) and (stone in first_board_missing_stones)
-    ]
-    all_pending = [
-        (stone, first_seen)
-        for (stone, first_seen) in all_pending
-        if stone not in to_play
-    ]
-    return all_pending, to_play
-
-
 def get_board_name(load_options, descriptor="board"):
     """Prompt to ask for a board name.
 
@@ -412,51 +571,389 @@ def watch_boards(first_board_metadata, second_board_metadata):
         first_board_metadata (dict): A dictionary with enough information to load the first board
         second_board_metadata (dict): A dictionary with enough information to load the second board
 
+    A physical board's metadata may have a `camera` dictionary of CameraSource arguments,
+    for example {"device": 1, "width": 3840, "height": 2160, "fps": 30}.
+
+    Virtual boards are captured by a FrameProducer into a FrameBuffer, so the next
+    screenshot is taken while the boards in the last one are being read. When reading falls
+    behind, the screenshots it missed are dropped and the newest one is read.
+
+    The boards are then watched by `watch_pair`, paced by a ScanScheduler with the rates
+    in the first board's metadata. The FrameProducer follows the same rate, so an idle
+    board takes only as many screenshots as it reads.
+
     """
+    camera_source = None
+    screen_buffer = None
+    screen_producer = None
     try:
-        screen_scale = get_scale()
-        print("Watching boards! Press C-c to quit.")
+        try:
+            screen_scale = get_scale()
+            print("Watching boards! Press C-c to quit.")
+
+            with mss.mss() as sct:
+                screen_source = ScreenSource(sct, screen_scale)
+                for metadata in [first_board_metadata, second_board_metadata]:
+                    if metadata["loader_type"] == "virtual":
+                        screen_source.add(metadata["corners"])
+                    elif camera_source is None:
+                        camera_source = CameraSource(**metadata.get("camera", {}))
+                        camera_source.settled()
+
+                if len(screen_source.regions) > 0:
+                    frame = screen_source.capture()
+                    screen_buffer = FrameBuffer(frame.shape, frame.dtype, slots=8)
+                    boost_fps = first_board_metadata.get(
+                        "boost_fps", SCAN_DEFAULTS["boost_fps"]
+                    )
+                    screen_producer = FrameProducer(
+                        screen_buffer, screen_source.capture, fps=boost_fps
+                    )
 
-        up_next = "black"
-        all_pending = []
-        previous_missing_stones = []
-        delay = first_board_metadata["delay"]
+                asyncio.run(
+                    watch_pair(
+                        first_board_metadata,
+                        second_board_metadata,
+                        screen_scale,
+                        screen_source=screen_source,
+                        screen_buffer=screen_buffer,
+                        camera_source=camera_source,
+                        screen_producer=screen_producer,
+                    )
+                )
+        finally:
+            if camera_source is not None:
+                camera_source.close()
+            if screen_producer is not None:
+                screen_producer.close()
+            if screen_buffer is not None:
+                screen_buffer.close()
 
-        with mss.mss() as sct:
+    except KeyboardInterrupt:
+        exit_handler(first_board_metadata, second_board_metadata)
+
+
+class PairReader:
+    def __init__(
+        self,
+        first_board_metadata,
+        second_board_metadata,
+        screen_source=None,
+        camera_source=None,
+    ):
+        """Read a pair of boards from each new frame and compare the stones that settled.
+
+        Each board is updated in place, and skipped while its ChangeDetector sees no change.
+        Its readings go through a TemporalFilter with the settings in its metadata, and only
+        the stones it accepts are compared, so a hand over a physical board is not mistaken
+        for moves. Boards whose metadata has `adapt_cutoffs` set get a CutoffTracker, and
+        their cutoffs follow the lighting every time they are read again. The saved cutoffs
+        are unchanged. Once a tracker has drifted as far as it may, a warning that the board
+        needs calibrating again is printed once.
+
+        Args:
+            first_board_metadata (dict): The board that stones are played on.
+            second_board_metadata (dict): The board that is followed.
+            screen_source (ScreenSource): Where virtual boards are viewed from.
+            camera_source (CameraSource): Where physical boards are read from.
+
+        Attributes:
+            first_board (Board): The latest first board, or None before the first read.
+            second_board (Board): The latest second board, or None before the first read.
+
+        Example:
+            reader = PairReader(first_board_metadata, second_board_metadata, screen_source)
             while True:
-                first_board = load_board_from_metadata(first_board_metadata, sct=sct)
-                second_board = load_board_from_metadata(second_board_metadata, sct=sct)
+                mismatched_stones = reader.read(screen_source.capture())
+                if mismatched_stones is not None:
+                    print(mismatched_stones)
+        """
+        self.metadata = [first_board_metadata, second_board_metadata]
+        self.screen_source = screen_source
+        self.camera_source = camera_source
+        self.first_board = None
+        self.second_board = None
+        self._changes = [ChangeDetector(), ChangeDetector()]
+        self._trackers = [_cutoff_tracker(metadata) for metadata in self.metadata]
+        self._warned = [False, False]
+        self._filters = [
+            TemporalFilter.from_metadata(metadata) for metadata in self.metadata
+        ]
 
-                (
-                    first_board_missing_stones,
-                    new_missing_stones,
-                ) = evaluate_state(first_board, second_board, all_pending)
+    def read(self, frame=None, rescan=False):
+        """Read both boards and compare them if what either accepted changed.
+
+        Args:
+            frame (np.ndarray): A capture of screen_source to read virtual boards from. If
+                None, use screen_source's latest grab.
+            rescan (bool): Read both boards as if they changed and compare them anyway.
+
+        Returns:
+            mismatched_stones (list): Like Board.compare_to for the accepted states, or None
+                if neither changed.
+        """
+        first_scan = self.first_board is None
+        if frame is not None:
+            self.screen_source.use(frame)
+        if rescan:
+            for changes in self._changes:
+                changes.reset()
+
+        boards = [self.first_board, self.second_board]
+        changed = False
+        for index, metadata in enumerate(self.metadata):
+            changes = self._changes[index]
+            board = load_board_from_metadata(
+                metadata,
+                screen_source=self.screen_source,
+                camera_source=self.camera_source,
+                change_detector=changes,
+                previous_board=boards[index],
+            )
+            boards[index] = board
+            changed_now = first_scan or changes.last_changed
+            tracker = self._trackers[index]
+            if tracker is not None and changed_now:
+                board.cutoffs = tracker.observe(
+                    board.deciding_values, board.state_array
+                )
+                if tracker.needs_calibration and not self._warned[index]:
+                    self._warned[index] = True
+                    print_calibration_warning(metadata, index == 1)
+            state_filter = self._filters[index]
+            if changed_now or state_filter.pending:
+                changed |= state_filter.update(board.state_array, board.confidence)
+        self.first_board, self.second_board = boards
+        timings.count("scans")
+
+        if changed or rescan:
+            timings.count("changes")
+            first_filter, second_filter = self._filters
+            return _compare_states(first_filter.state_array, second_filter.state_array)
+
+
+async def watch_pair(
+    first_board_metadata,
+    second_board_metadata,
+    screen_scale,
+    screen_source=None,
+    screen_buffer=None,
+    camera_source=None,
+    scheduler=None,
+    screen_producer=None,
+):
+    """Watch two boards and play the stones the first is missing, until cancelled.
+
+    The work is split into tasks connected by queues:
+
+        capture: Takes the newest screenshot from screen_buffer as often as the scheduler
+            says, and sets screen_producer to take screenshots at that rate too.
+        detect: Loads both boards from it in a worker thread, compares them, and tells the
+            scheduler whether either changed. If the screenshot's slot in screen_buffer was
+            written over while it was read, the result is dropped and both boards are read
+            again from the next screenshot without skipping unchanged ones.
+        diff: Prints the missing stones and starts a timer of the first board's `delay`
+            for each newly missing stone, cancelling timers of stones that came back.
+        play: Clicks every stone whose timer went off.
+        report: If the first board's metadata has `report_seconds`, prints the stage
+            timings that often, and appends them to its `timings_path` if it has one.
+
+    Both boards are read by a PairReader, so only the stones its TemporalFilters accept
+    are compared, and boards with `adapt_cutoffs` set follow the lighting.
+
+    Stones are only played when at most the first board's `max_new_stones`, by default
+    MAX_NEW_STONES, are newly missing at once. More than that is a board that needs
+    catching up, or one that was covered or misread, which is left to `fast_forward`.
 
-                if previous_missing_stones != first_board_missing_stones:
-                    print_describe_missing(
-                        first_board_missing_stones,
-                        first_board_metadata["name"],
+    The capture and detect queues only hold the newest item, so a slow stage skips old
+    frames instead of falling further behind. Nothing here blocks the event loop, so
+    several pairs with their own screen sources can be watched with `watch_pairs`.
+
+    Args:
+        first_board_metadata (dict): The board that stones are played on.
+        second_board_metadata (dict): The board that is followed.
+        screen_scale (float): Screenshot pixels per screen point, see helpers.get_scale.
+        screen_source (ScreenSource): Where virtual boards are viewed from.
+        screen_buffer (FrameBuffer): Screenshots of screen_source from a FrameProducer.
+        camera_source (CameraSource): Where physical boards are read from.
+        scheduler (ScanScheduler): Paces the scans. If None, use the rates in first_board_metadata.
+        screen_producer (FrameProducer): What writes screen_buffer, to pace it and report its errors.
+    """
+    if scheduler is None:
+        scheduler = ScanScheduler.from_metadata(first_board_metadata)
+    loop = asyncio.get_running_loop()
+    frames = asyncio.Queue(maxsize=1)
+    scans = asyncio.Queue(maxsize=1)
+    ready = asyncio.Queue()
+
+    delay = first_board_metadata["delay"]
+    max_new_stones = first_board_metadata.get("max_new_stones", MAX_NEW_STONES)
+    reader = PairReader(
+        first_board_metadata,
+        second_board_metadata,
+        screen_source=screen_source,
+        camera_source=camera_source,
+    )
+    load_boards = timings.timed("load_boards")(reader.read)
+    up_next = "black"
+    pending = {}
+
+    async def capture():
+        while True:
+            start = loop.time()
+            sequence, frame = None, None
+            if screen_producer is not None:
+                screen_producer.fps = scheduler.current_fps()
+            if screen_buffer is not None:
+                dropped = screen_buffer.dropped
+                sequence, frame = await loop.run_in_executor(
+                    None, screen_buffer.latest, 5
+                )
+                if frame is None:
+                    error = None if screen_producer is None else screen_producer.error
+                    raise IOError("No screenshots: {}".format(error))
+                timings.count("dropped_frames", screen_buffer.dropped - dropped)
+            timings.count("frames")
+            _put_newest(frames, (sequence, frame))
+            await asyncio.sleep(scheduler.interval(elapsed=loop.time() - start))
+
+    async def detect():
+        rescan = False
+        while True:
+            sequence, frame = await frames.get()
+            mismatched_stones = await loop.run_in_executor(
+                None, load_boards, frame, rescan
+            )
+            # A frame that waited behind a slow scan may have had its slot written
+            # over while it was read, so read the next frame from scratch instead
+            rescan = sequence is not None and not screen_buffer.is_current(sequence)
+            if rescan:
+                timings.count("rescans")
+                continue
+            scheduler.record(mismatched_stones is not None)
+            if mismatched_stones is not None:
+                _put_newest(scans, mismatched_stones)
+
+    def stone_ready(stone):
+        del pending[stone]
+        ready.put_nowait(stone)
+
+    async def diff():
+        previous_missing_stones = []
+        while True:
+            mismatched_stones = await scans.get()
+            first_board_missing_stones = [
+                stone for stone in mismatched_stones if stone[2] == "empty"
+            ]
+            described = previous_missing_stones != first_board_missing_stones
+            if described:
+                print_describe_missing(
+                    first_board_missing_stones,
+                    first_board_metadata["name"],
+                    first_board_metadata.get("size", 19),
+                )
+                previous_missing_stones = first_board_missing_stones
+
+            if not first_board_metadata["click"]:
+                continue
+            still_missing = set(first_board_missing_stones)
+            for stone in list(pending):
+                if stone not in still_missing:
+                    pending.pop(stone).cancel()
+            new_missing_stones = [
+                stone for stone in first_board_missing_stones if stone not in pending
+            ]
+            if len(new_missing_stones) > max_new_stones:
+                if described:
+                    print(
+                        "Not playing {} new stones at once. Press C-c and (z)oom "
+                        "to catch up.".format(len(new_missing_stones))
                     )
-                    previous_missing_stones = first_board_missing_stones
+                continue
+            for stone in new_missing_stones:
+                pending[stone] = loop.call_later(delay, stone_ready, stone)
+
+    async def play():
+        nonlocal up_next
+        while True:
+            stones_to_play = [await ready.get()]
+            while not ready.empty():
+                stones_to_play.append(ready.get_nowait())
+            up_next = await loop.run_in_executor(
+                None,
+                play_stones,
+                reader.first_board,
+                stones_to_play,
+                up_next,
+                screen_scale,
+            )
+            timings.count("stones_played", len(stones_to_play))
+
+    async def report():
+        report_seconds = first_board_metadata.get("report_seconds")
+        if report_seconds is None:
+            return
+        while True:
+            await asyncio.sleep(report_seconds)
+            print("\n" + timings.report())
+            if first_board_metadata.get("timings_path") is not None:
+                timings.dump(first_board_metadata["timings_path"])
+
+    tasks = [
+        asyncio.create_task(task()) for task in [capture, detect, diff, play, report]
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for timer in pending.values():
+            timer.cancel()
+
+
+async def watch_pairs(pairs, screen_scale):
+    """Watch several pairs of boards in one process.
 
-                if first_board_metadata["click"]:
-                    if len(new_missing_stones) > 2:
-                        continue
+    Args:
+        pairs (list[dict]): watch_pair keyword arguments for each pair, each with its own
+            first_board_metadata, second_board_metadata and sources.
+        screen_scale (float): Screenshot pixels per screen point, see helpers.get_scale.
+    """
+    await asyncio.gather(
+        *[watch_pair(screen_scale=screen_scale, **pair) for pair in pairs]
+    )
 
-                    elif len(all_pending) > 0 or len(new_missing_stones) > 0:
-                        all_pending, stones_to_play = update_all_pending(
-                            all_pending,
-                            first_board_missing_stones,
-                            new_missing_stones,
-                            delay,
-                        )
 
-                        up_next = play_stones(
-                            first_board, stones_to_play, up_next, screen_scale
-                        )
+def print_calibration_warning(metadata, second_board):
+    """Tell the user a board's lighting changed more than its cutoffs can follow"""
+    action = "(a)uto calibrate second board from first"
+    if not second_board:
+        action = "(f)irst board needs update, then c(a)libration"
+    print(
+        "\nThe light on {} has changed too much to follow. Press C-c and choose "
+        "{}.".format(metadata.get("name", "the board"), action)
+    )
 
-    except KeyboardInterrupt:
-        exit_handler(first_board_metadata, second_board_metadata)
+
+def _cutoff_tracker(metadata):
+    if not metadata.get("adapt_cutoffs", False):
+        return None
+    return CutoffTracker(metadata["cutoffs"])
+
+
+def _compare_states(state_array, other_state_array):
+    """Like Board.compare_to for two state arrays"""
+    return [
+        (i, j, STONES[this], STONES[other])
+        for i, j, this, other in diff(state_array, other_state_array).tolist()
+    ]
+
+
+def _put_newest(queue, item):
+    """Put an item on a queue of size one, replacing what is there"""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(item)
 
 
 def run_app():
@@ -2,8 +2,12 @@ import itertools
 
 import pytest
 import cv2
+import numpy as np
+
+import goban_irl.opencv_utilities as utils
 
 from goban_irl.board import Board
+from goban_irl.state import BLACK, EMPTY, WHITE, StateView
 
 
 def test_transform_image_two_corners():
@@ -224,3 +228,232 @@ def test_compare_to():
     assert (17, 17, "white", "empty") in board_2.compare_to(board_1)
 
     assert len(board_2.compare_to(board_1)) == 2
+
+
+def test_grid_detection_functions():
+    """Each grid detection function should give the same values
+    as running its detection function on every stone subimage
+    """
+    corners = [(1105, 548), (2956, 559), (3669, 2305), (455, 2315)]
+    board = Board(image="tests/image_samples/real_board_1.png", corners=corners)
+    for function, grid_function in utils.GRID_DETECTION_FUNCTIONS.items():
+        values = grid_function(board.integral_image, board.stone_subimage_boundaries)
+        assert values.shape == (19, 19)
+        for (i, j), boundary in board._iterate(board.stone_subimage_boundaries):
+            stone_subimage = utils.crop(board.board_subimage, boundary)
+            assert values[i][j] == pytest.approx(function(stone_subimage)), (
+                function.__name__,
+                (i, j),
+            )
+
+
+def test_warp_plan_is_reused():
+    """The remap maps for a set of corners are built once
+    and give an image close to a warp followed by a resize
+    """
+    image = cv2.imread("tests/image_samples/real_board_1.png")
+    corners = Board._sort_corners([(1105, 548), (2956, 559), (3669, 2305), (455, 2315)])
+    plan = utils.get_warp_plan(corners)
+    assert utils.get_warp_plan([list(corner) for corner in corners]) is plan
+
+    topleft, topright, bottomleft, bottomright = corners
+    width, _ = utils.find_width_and_height(bottomright, bottomleft)
+    _, height = utils.find_width_and_height(topright, bottomright)
+    M = cv2.getPerspectiveTransform(
+        np.array(corners, np.float32),
+        np.array([(0, 0), (width, 0), (0, height), (width, height)], np.float32),
+    )
+    expected = utils.scale_image(
+        cv2.warpPerspective(image, M, (width, height)), plan.width, plan.height
+    )
+
+    board_subimage = utils.perspective_transform(image, corners)
+    assert board_subimage.shape == expected.shape
+    assert np.abs(board_subimage.astype(int) - expected).mean() < 2
+
+
+def test_find_state_from_samples():
+    """Given samples_per_cell, detect stones from samples of the original image
+    and only build the board_subimage when it is asked for
+    """
+    corners = [(888, 248), (2470, 1830)]
+    board = Board(
+        image="tests/image_samples/find_stones_test_1.png",
+        corners=corners,
+        samples_per_cell=10,
+    )
+    check_stones(board)
+    assert board._board_subimage is None
+    assert board.board_subimage.shape == (1582, 1582, 3)
+
+    corners = [(1105, 548), (2956, 559), (3669, 2305), (455, 2315)]
+    board = Board(
+        image="tests/image_samples/real_board_1.png",
+        corners=corners,
+        samples_per_cell=10,
+    )
+    check_stones(board)
+    assert board._board_subimage is None
+
+
+def test_update():
+    """After the first update, update only re-detects stones whose subimages changed
+    and gives the same state as a new board
+    """
+    image = cv2.imread("tests/image_samples/find_stones_test_1.png")
+    corners = [(888, 248), (2470, 1830)]
+    for samples_per_cell in [None, 10]:
+        for flip in [False, True]:
+            board = Board(image, corners, flip=flip, samples_per_cell=samples_per_cell)
+            assert len(board.update(image.copy())) == 19 * 19
+            assert board.update(image.copy()) == []
+
+            moved_image = image.copy()
+            moved_image[1010:1070, 1650:1710] = 0
+            moved_image[248:270, 888:910] = (90, 170, 220)
+            dirty_cells = board.update(moved_image)
+
+            new_board = Board(
+                moved_image, corners, flip=flip, samples_per_cell=samples_per_cell
+            )
+            assert board.state == new_board.state
+            assert np.allclose(board.deciding_values, new_board.deciding_values)
+            assert len(dirty_cells) < 10
+            if flip:
+                assert (9, 9) in dirty_cells and (18, 18) in dirty_cells
+                assert board.state[9][9] == "black"
+            else:
+                assert (9, 9) in dirty_cells and (0, 0) in dirty_cells
+                assert board.state[9][9] == "black"
+
+
+def test_update_perspective():
+    """Update through a perspective transform gives the same state as a new board"""
+    image = cv2.imread("tests/image_samples/real_board_1.png")
+    corners = [(1105, 548), (2956, 559), (3669, 2305), (455, 2315)]
+    for samples_per_cell in [None, 10]:
+        board = Board(image, corners, samples_per_cell=samples_per_cell)
+        assert len(board.update(image.copy())) == 19 * 19
+        assert board.update(image.copy()) == []
+
+        moved_image = cv2.circle(image.copy(), (2050, 1195), 40, (255, 255, 255), -1)
+        dirty_cells = board.update(moved_image)
+
+        new_board = Board(moved_image, corners, samples_per_cell=samples_per_cell)
+        assert dirty_cells == [(9, 9)]
+        assert board.state[9][9] == "white"
+        assert board.state == new_board.state
+        assert np.allclose(board.deciding_values, new_board.deciding_values)
+
+
+def test_update_from_samples():
+    """A board read from samples notices every change in the samples it reads"""
+    corners = [(1105, 548), (2956, 559), (3669, 2305), (455, 2315)]
+    options = {"samples_per_cell": 6, "detection_function": utils.check_bw}
+    image = cv2.imread("tests/image_samples/real_board_1.png")
+    other_image = cv2.imread("tests/image_samples/real_board_2.png")
+    board = Board(image, corners, **options)
+    board.update(image)
+    board.update(other_image)
+    assert board.state == Board(other_image, corners, **options).state
+
+
+def test_confidence():
+    """Confidence is the distance of each deciding value from the nearest cutoff"""
+    board = Board(
+        image="tests/image_samples/find_stones_test_1.png",
+        corners=[(888, 248), (2470, 1830)],
+        cutoffs=(70, 150),
+    )
+    assert board.confidence.shape == (19, 19)
+    assert np.allclose(
+        board.confidence,
+        np.minimum(abs(board.deciding_values - 70), abs(board.deciding_values - 150)),
+    )
+    assert Board().confidence is None
+
+
+def test_diff():
+    """diff gives the same mismatches as compare_to as a structured array"""
+    corners = [(888, 1830), (2470, 248)]
+    board_1 = Board(image="tests/image_samples/find_stones_test_1.png", corners=corners)
+    board_2 = Board(image="tests/image_samples/find_stones_test_1.png", corners=corners)
+    assert len(board_1.diff(board_2)) == 0
+
+    board_1.state[1][1] = "black"
+    board_2.state[17][17] = "white"
+    differences = board_1.diff(board_2)
+    assert differences.dtype.names == ("row", "col", "this", "other")
+    assert differences.tolist() == [(1, 1, BLACK, EMPTY), (17, 17, EMPTY, WHITE)]
+    assert board_1.compare_to(board_2) == [
+        (1, 1, "black", "empty"),
+        (17, 17, "empty", "white"),
+    ]
+
+
+def test_small_boards():
+    """Given a size, find stones on 9x9 and 13x13 boards"""
+    for size in [9, 13]:
+        step = 60
+        width = step * (size - 1)
+        image = np.zeros((width + 200, width + 200, 3), np.uint8)
+        image[100 : 100 + width, 100 : 100 + width] = (100, 170, 220)
+        stones = {(0, 0): (245, 245, 245), (size - 1, 2): (15, 15, 15)}
+        for (i, j), colour in stones.items():
+            center = (100 + j * step, 100 + i * step)
+            image = cv2.circle(image, center, 25, colour, -1)
+
+        board = Board(image, [(100, 100), (100 + width, 100 + width)], size=size)
+        assert board.state_array.shape == (size, size)
+        assert len(board.intersections) == size
+        assert board.intersections[1][1] == (step, step)
+        for (i, j), position_state in board._iterate(board.state):
+            if (i, j) == (0, 0):
+                assert position_state == "white"
+            elif (i, j) == (size - 1, 2):
+                assert position_state == "black"
+            else:
+                assert position_state == "empty", (i, j)
+
+        assert board._human_readable_alpha((0, 0), size) == "A{}".format(size)
+        assert board._human_readable_numeric((size - 1, 2), size) == "3-1"
+
+
+def test_calibrate_from_state():
+    """A known state labels every intersection, in state order for flipped boards"""
+    step = 40
+    width = step * 8
+    image = np.zeros((width + 100, width + 100, 3), np.uint8)
+    image[50 : 50 + width, 50 : 50 + width] = (100, 170, 220)
+    state = np.zeros((9, 9), np.int8)
+    state[1, 1:7] = BLACK
+    state[6, 2:8] = WHITE
+    for (i, j), value in np.ndenumerate(state):
+        if value != EMPTY:
+            colour = (20, 20, 20) if value == BLACK else (240, 240, 240)
+            image = cv2.circle(image, (50 + j * step, 50 + i * step), 17, colour, -1)
+    corners = [(50, 50), (50 + width, 50 + width)]
+
+    board = Board(image, corners, size=9)
+    detection_function, cutoffs = board.calibrate_from_state(state)
+    calibrated = Board(
+        image, corners, detection_function=detection_function, cutoffs=cutoffs, size=9
+    )
+    assert np.array_equal(calibrated.state_array, state)
+
+    flipped = Board(image, corners, flip=True, size=9)
+    detection_function, cutoffs = flipped.calibrate_from_state(
+        StateView(state[::-1, ::-1].copy())
+    )
+    calibrated = Board(
+        image,
+        corners,
+        detection_function=detection_function,
+        cutoffs=cutoffs,
+        flip=True,
+        size=9,
+    )
+    assert np.array_equal(calibrated.state_array, state[::-1, ::-1])
+
+    with pytest.raises(ValueError):
+        board.calibrate_from_state(np.zeros((19, 19), np.int8))
@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+
+from goban_irl.board import Board
+from goban_irl.board_set import BoardSet, ParallelBoardSet
+
+
+def make_frame():
+    """A frame with three 9x9 boards side by side and a few stones on each"""
+    step = 40
+    width = step * 8
+    frame = np.zeros((width + 100, 3 * width + 200, 3), np.uint8)
+    corners = []
+    for index in range(3):
+        left = 50 + index * (width + 50)
+        frame[50 : 50 + width, left : left + width] = (100, 170, 220)
+        stones = {(index, 0): (245, 245, 245), (8, index + 2): (15, 15, 15)}
+        for (i, j), colour in stones.items():
+            center = (left + j * step, 50 + i * step)
+            frame = cv2.circle(frame, center, 17, colour, -1)
+        corners.append([(left, 50), (left + width, 50 + width)])
+    return frame, corners
+
+
+def test_scan():
+    """Given boards in one frame
+    Find the same states as reading each board on its own
+    """
+    frame, corners = make_frame()
+    left, top = corners[2][0]
+    right, bottom = corners[2][1]
+    configs = [
+        {"corners": corners[0], "size": 9},
+        {"corners": corners[1], "size": 9, "flip": True},
+        {"corners": corners[2], "size": 9, "samples_per_cell": 6},
+        {
+            "corners": [(left, top), (right, top), (left, bottom), (right, bottom)],
+            "size": 9,
+        },
+    ]
+    board_set = BoardSet(configs)
+    assert len(board_set) == 4
+
+    for _ in range(2):
+        boards = board_set.scan(frame)
+        assert len(boards) == 4
+        for config, board in zip(configs, boards):
+            expected = Board(frame, **config)
+            assert np.array_equal(board.state_array, expected.state_array)
+            assert board.state_array.shape == (9, 9)
+
+    assert boards[0].state[0][0] == "white"
+    assert boards[0].state[8][2] == "black"
+    assert boards[1].state[7][8] == "white"
+    assert boards[1].state[0][5] == "black"
+    assert boards[2].state[2][0] == "white"
+    assert boards[2].state[8][4] == "black"
+    assert np.array_equal(boards[2].state_array, boards[3].state_array)
+    assert boards[0].integral_image is not None
+
+    frame[72:108, 72:108] = (245, 245, 245)
+    boards[0].update(frame)
+    assert boards[0].state[1][1] == "white"
+
+
+def test_crop_groups():
+    """Only two corner boards that overlap share an IntegralImage"""
+    frame, corners = make_frame()
+    configs = [
+        {"corners": corners[0], "size": 9},
+        {"corners": corners[1], "size": 9},
+        {"corners": corners[0], "size": 9, "flip": True},
+    ]
+    board_set = BoardSet(configs)
+    crop_groups, _ = board_set._layout(frame.shape[:2])
+    assert sorted(indices for _, indices, _ in crop_groups) == [[0, 2], [1]]
+
+    boards = board_set.scan(frame)
+    integral_images = [board._detection_inputs()[2] for board in boards]
+    assert integral_images[0] is integral_images[2]
+    assert integral_images[0] is not integral_images[1]
+    for config, board in zip(configs, boards):
+        assert np.array_equal(board.state_array, Board(frame, **config).state_array)
+
+
+def test_parallel_scan():
+    """Given boards in one frame and a pool of workers
+    Find the same states as a BoardSet, with processes or threads
+    """
+    frame, corners = make_frame()
+    configs = [
+        {"corners": corners[0], "size": 9},
+        {"corners": corners[1], "size": 9, "flip": True},
+        {"corners": corners[2], "size": 9, "samples_per_cell": 6},
+    ]
+    expected = [board.state_array for board in BoardSet(configs).scan(frame)]
+
+    for processes in [True, False]:
+        with ParallelBoardSet(configs, workers=2, processes=processes) as board_set:
+            assert len(board_set) == 3
+            for _ in range(2):
+                states = board_set.scan(frame)
+                assert len(states) == 3
+                for state_array, expected_array in zip(states, expected):
+                    assert np.array_equal(state_array, expected_array)
+
+            bigger = np.zeros((frame.shape[0] + 10, frame.shape[1], 3), np.uint8)
+            bigger[: frame.shape[0]] = frame
+            states = board_set.scan(bigger)
+            assert np.array_equal(states[0], expected[0])
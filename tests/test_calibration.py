@@ -0,0 +1,250 @@
+import cv2
+import numpy as np
+import pytest
+
+import goban_irl.opencv_utilities as utils
+
+from goban_irl.board import Board
+from goban_irl.calibration import (
+    CutoffTracker,
+    baseline_correction,
+    feature_matrix,
+    find_best_detection,
+    score_features,
+)
+from goban_irl.state import BLACK, EMPTY, WHITE
+
+
+def draw_board(size=9, step=40, empty=False):
+    """A board with a black and a white stone on every other row, and its state"""
+    width = step * (size - 1)
+    image = np.zeros((width + 100, width + 100, 3), np.uint8)
+    image[50 : 50 + width, 50 : 50 + width] = (100, 170, 220)
+    state = np.zeros((size, size), np.int8)
+    if not empty:
+        state[::2, 0] = BLACK
+        state[::2, size - 1] = WHITE
+        state[1, 1:6] = BLACK
+        state[3, 1:6] = WHITE
+    for (i, j), value in np.ndenumerate(state):
+        if value != EMPTY:
+            colour = (20, 20, 20) if value == BLACK else (240, 240, 240)
+            image = cv2.circle(image, (50 + j * step, 50 + i * step), 17, colour, -1)
+    corners = [(50, 50), (50 + width, 50 + width)]
+    return image, corners, state
+
+
+def make_board(size=9, step=40):
+    image, corners, state = draw_board(size, step)
+    return Board(image, corners, size=size), state
+
+
+def test_feature_matrix():
+    """Every detection function is measured on every boundary at once"""
+    board, _ = make_board()
+    boundaries = board.geometry.boundaries[:3, :3]
+    features = feature_matrix(board.integral_image, boundaries)
+    assert features.shape == (9, len(utils.DETECTION_FUNCTIONS))
+
+    for row, boundary in enumerate(boundaries.reshape(-1, 4)):
+        stone_subimage = utils.crop(board.board_subimage, boundary)
+        for column, function in enumerate(utils.DETECTION_FUNCTIONS):
+            assert abs(features[row, column] - function(stone_subimage)) < 1e-6
+
+
+def test_score_features():
+    labels = np.array([BLACK, BLACK, EMPTY, EMPTY, WHITE, WHITE])
+    features = np.array(
+        [[0, 5], [10, 60], [50, 50], [60, 10], [100, 90], [110, 100]], np.float64
+    )
+    scores = score_features(features, labels)
+    assert scores["partitions"].tolist() == [True, False]
+    assert scores["cutoffs"][0].tolist() == [30, 80]
+    assert scores["gaps"][0].tolist() == [40, 40]
+    assert abs(scores["margin"][0] - 80 / 110) < 1e-9
+    assert scores["separability"][0] > scores["separability"][1]
+
+
+def test_find_best_detection():
+    """With a whole board of labels, the best function and cutoffs read the board back"""
+    board, state = make_board()
+    labels = state.reshape(-1)
+    boundaries = board.geometry.boundaries.reshape(-1, 4)
+
+    for combinations in [False, True]:
+        function, cutoffs = find_best_detection(
+            board.integral_image, boundaries, labels, combinations=combinations
+        )
+        found = board.find_state(
+            board.board_subimage,
+            board.stone_subimage_boundaries,
+            detection_function=function,
+            cutoffs=cutoffs,
+        )
+        assert np.array_equal(found.array, state)
+        assert utils.load_detection_function(function.__name__) == function
+
+    with pytest.raises(ValueError):
+        find_best_detection(
+            board.integral_image, boundaries, np.full(len(labels), EMPTY)
+        )
+
+
+def test_tolerance():
+    """One mislabelled stone stops a partition unless some misreads are tolerated"""
+    board, state = make_board()
+    labels = state.reshape(-1).copy()
+    labels[1 * 9 + 3] = WHITE
+    boundaries = board.geometry.boundaries.reshape(-1, 4)
+
+    with pytest.raises(ValueError):
+        find_best_detection(board.integral_image, boundaries, labels)
+    function, cutoffs = find_best_detection(
+        board.integral_image, boundaries, labels, tolerance=0.2
+    )
+    found = board.find_state(
+        board.board_subimage,
+        board.stone_subimage_boundaries,
+        detection_function=function,
+        cutoffs=cutoffs,
+    )
+    assert np.array_equal(found.array, state)
+
+
+def test_linear_detection():
+    """A weighted pair of functions reads the same from crops and from the grid"""
+    board, _ = make_board()
+    function = utils.load_detection_function("0.25*check_bw+0.75*check_sum")
+    assert function.__name__ == "0.25*check_bw+0.75*check_sum"
+    grid = utils.get_grid_function(function)(
+        board.integral_image, board.geometry.boundaries
+    )
+    for (i, j), boundary in np.ndenumerate(board.geometry.boundaries[..., 0]):
+        stone_subimage = utils.crop(
+            board.board_subimage, board.geometry.boundaries[i, j]
+        )
+        assert abs(grid[i, j] - function(stone_subimage)) < 1e-6
+
+
+def test_baseline():
+    """With a baseline of the empty board, a board lit from one side reads evenly"""
+    image, corners, state = draw_board()
+    empty_image, _, _ = draw_board(empty=True)
+    light = np.linspace(0.3, 1, image.shape[1])[None, :, None]
+    image = (image * light).astype(np.uint8)
+    empty_image = (empty_image * light).astype(np.uint8)
+
+    baseline = Board(empty_image, corners, size=9).measure_baseline()
+    assert set(baseline) == {f.__name__ for f in utils.DETECTION_FUNCTIONS}
+    assert baseline["check_bw"].shape == (9, 9)
+
+    board = Board(image, corners, size=9, detection_function=utils.check_bw)
+    even_board = Board(
+        image, corners, size=9, detection_function=utils.check_bw, baseline=baseline
+    )
+    assert np.ptp(board.deciding_values[state == EMPTY]) > 50
+    assert np.ptp(even_board.deciding_values[state == EMPTY]) < 1
+
+    function, cutoffs = even_board.calibrate_from_state(state)
+    pair = utils.load_detection_function("0.25*check_bw+0.75*check_sum")
+    assert np.allclose(
+        baseline_correction(baseline, pair),
+        0.25 * baseline_correction(baseline, utils.check_bw)
+        + 0.75 * baseline_correction(baseline, utils.check_sum),
+    )
+
+    for flip in [False, True]:
+        board = Board(
+            empty_image,
+            corners,
+            size=9,
+            detection_function=function,
+            cutoffs=cutoffs,
+            flip=flip,
+            baseline=baseline,
+        )
+        board.update(image)
+        expected = state[::-1, ::-1] if flip else state
+        assert np.array_equal(board.state_array, expected)
+        new_board = Board(
+            image,
+            corners,
+            size=9,
+            detection_function=function,
+            cutoffs=cutoffs,
+            flip=flip,
+            baseline=baseline,
+        )
+        assert np.allclose(board.deciding_values, new_board.deciding_values)
+
+    with pytest.raises(ValueError):
+        Board(image, corners, size=13, baseline=baseline)
+
+
+def test_baseline_stepped():
+    """A baseline leaves detection functions with a few fixed values as they are"""
+    image, corners, state = draw_board()
+    empty_image, _, _ = draw_board(empty=True)
+    light = np.linspace(0.3, 1, image.shape[1])[None, :, None]
+    image = (image * light).astype(np.uint8)
+    empty_image = (empty_image * light).astype(np.uint8)
+    baseline = Board(empty_image, corners, size=9).measure_baseline()
+
+    for function in utils.STEPPED_DETECTION_FUNCTIONS:
+        assert not baseline_correction(baseline, function).any()
+
+    options = {"size": 9, "detection_function": utils.check_max_difference}
+    board = Board(image, corners, cutoffs=(650, 750), **options)
+    even_board = Board(image, corners, cutoffs=(650, 750), baseline=baseline, **options)
+    assert np.array_equal(even_board.deciding_values, board.deciding_values)
+    assert even_board.state[4][0] == "black"
+
+
+def tracker_scan(shift=0, size=9):
+    """Deciding values of a board with every kind of stone, all moved by shift"""
+    rng = np.random.default_rng(size)
+    state = np.zeros((size, size), np.int8)
+    state[:2] = BLACK
+    state[-2:] = WHITE
+    values = np.choose(state + 1, [30, 110, 190]) + rng.normal(0, 3, state.shape)
+    return values + shift
+
+
+def test_cutoff_tracker():
+    """Cutoffs follow the deciding values when the light slowly changes"""
+    tracker = CutoffTracker((70, 150))
+    for _ in range(100):
+        values = tracker_scan(shift=10)
+        state = Board._find_regions(values, tracker.cutoffs)
+        cutoffs = tracker.observe(values, state)
+    assert cutoffs == tracker.cutoffs
+    assert tracker.scans == 100
+    assert np.allclose(cutoffs, (70, 150))
+
+    for scan in range(100):
+        values = tracker_scan(shift=10 + 0.1 * scan)
+        state = Board._find_regions(values, tracker.cutoffs)
+        tracker.observe(values, state)
+    assert np.allclose(tracker.cutoffs, (78, 158), atol=1.5)
+    assert not tracker.needs_calibration
+
+
+def test_cutoff_tracker_guard_rails():
+    """Uncertain scans are skipped and cutoffs never move too fast or drift too far"""
+    tracker = CutoffTracker((70, 150), alpha=1)
+    tracker.observe(tracker_scan(), Board._find_regions(tracker_scan(), (70, 150)))
+
+    hand = tracker_scan()
+    hand[3:6] = 75
+    assert tracker.observe(hand, Board._find_regions(hand, (70, 150))) == (70, 150)
+    assert tracker.skipped == 1
+
+    values = tracker_scan(shift=15)
+    cutoffs = tracker.observe(values, Board._find_regions(values, (70, 150)))
+    assert np.allclose(cutoffs, (71.6, 151.6))
+
+    for scan in range(200):
+        values = tracker_scan(shift=15 + scan)
+        tracker.observe(values, Board._find_regions(values, tracker.cutoffs))
+    assert tracker.cutoffs == (90, 170)
+    assert tracker.needs_calibration
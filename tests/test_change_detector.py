@@ -0,0 +1,29 @@
+import numpy as np
+
+from goban_irl.change_detector import ChangeDetector
+
+
+def test_changed():
+    """The first image is a change, an identical one is not,
+    and a stone sized change is
+    """
+    image = np.full((640, 640, 3), 120, np.uint8)
+    changes = ChangeDetector()
+    assert changes.changed(image)
+    assert not changes.changed(image.copy())
+
+    image[300:340, 300:340] = 0
+    assert changes.changed(image)
+    assert not changes.changed(image)
+
+
+def test_slow_drift_is_a_change():
+    """Small changes are ignored one at a time but add up"""
+    image = np.full((100, 100, 3), 120, np.uint8)
+    changes = ChangeDetector(threshold=8)
+    changes.changed(image)
+    results = [changes.changed(image + step) for step in range(1, 12)]
+    assert results.count(True) == 1
+
+    changes.reset()
+    assert changes.changed(image)
@@ -0,0 +1,101 @@
+import multiprocessing
+import time
+
+import numpy as np
+
+from goban_irl.frame_buffer import FrameBuffer, FrameProducer
+
+
+def frame(value):
+    return np.full((4, 6, 3), value, np.uint8)
+
+
+def test_read_in_order():
+    """Frames are read oldest first, as views into the buffer"""
+    with FrameBuffer((4, 6, 3), slots=4) as buffer:
+        assert buffer.read(timeout=0) == (None, None)
+        for value in range(3):
+            assert buffer.write(frame(value)) == value
+
+        for value in range(3):
+            sequence, view = buffer.read(timeout=0)
+            assert sequence == value
+            assert (view == value).all()
+            assert buffer.is_current(sequence)
+        assert buffer.read(timeout=0) == (None, None)
+        assert buffer.dropped == 0
+        del view
+
+
+def test_drop_oldest():
+    """When the reader falls behind, the oldest frames are skipped and counted"""
+    with FrameBuffer((4, 6, 3), slots=3) as buffer:
+        for value in range(10):
+            buffer.write(frame(value))
+        sequence, view = buffer.read(timeout=0)
+        assert sequence == 8
+        assert (view == 8).all()
+        assert buffer.dropped == 8
+
+        buffer.write(frame(10))
+        buffer.write(frame(11))
+        assert not buffer.is_current(sequence)
+
+        sequence, view = buffer.latest(timeout=0)
+        assert sequence == 11
+        assert (view == 11).all()
+        assert buffer.dropped == 10
+        assert buffer.latest(timeout=0) == (None, None)
+        del view
+
+
+def _read_from_other_process(name, queue):
+    buffer = FrameBuffer((4, 6, 3), slots=4, name=name)
+    sequence, view = buffer.read(timeout=5)
+    queue.put((sequence, int(view[0, 0, 0])))
+    del view
+    buffer.close()
+
+
+def test_attach_by_name():
+    """Another process can read frames by attaching with the buffer name"""
+    with FrameBuffer((4, 6, 3), slots=4) as buffer:
+        buffer.write(frame(7))
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_read_from_other_process, args=(buffer.name, queue)
+        )
+        process.start()
+        assert queue.get(timeout=10) == (0, 7)
+        process.join()
+
+
+def test_frame_producer():
+    """A producer keeps writing grabbed frames at no more than its fps"""
+    grabs = []
+
+    def grab():
+        grabs.append(time.monotonic())
+        return frame(len(grabs) % 256)
+
+    with FrameBuffer((4, 6, 3), slots=4) as buffer:
+        with FrameProducer(buffer, grab, fps=100) as producer:
+            sequence, view = buffer.read(timeout=5)
+            assert sequence == 0
+            assert (view == 1).all()
+            time.sleep(0.1)
+        assert producer.error is None
+        assert 2 <= buffer.write_count <= 12
+        del view
+
+
+def test_frame_producer_error():
+    """Errors in the capture thread are kept for the reader"""
+
+    def grab():
+        raise IOError("Screen went away")
+
+    with FrameBuffer((4, 6, 3), slots=4) as buffer:
+        with FrameProducer(buffer, grab) as producer:
+            assert buffer.read(timeout=0.05) == (None, None)
+        assert isinstance(producer.error, IOError)
@@ -0,0 +1,124 @@
+import time
+
+import cv2
+import numpy as np
+
+import goban_irl.opencv_utilities as utils
+
+from goban_irl.frame_source import CameraSource, ScreenSource
+from unittest.mock import patch
+
+
+class MockScreen:
+    """Stands in for mss with a retina screen twice the size of its points"""
+
+    def __init__(self, image):
+        self.image = image
+        height, width, _ = image.shape
+        self.monitors = [
+            None,
+            {"left": 0, "top": 0, "width": width // 2, "height": height // 2},
+        ]
+        self.grabs = []
+
+    def grab(self, monitor):
+        self.grabs.append(monitor)
+        left, top = 2 * monitor["left"], 2 * monitor["top"]
+        right = left + 2 * monitor["width"]
+        bottom = top + 2 * monitor["height"]
+        return self.image[top:bottom, left:right]
+
+
+def test_screen_source_grabs_once():
+    """Two boards are read from one grab of their bounding box
+    and each view matches the full screenshot around that board
+    """
+    image = utils.import_image("tests/image_samples/find_stones_test_1.png")
+    sct = MockScreen(image)
+    first_corners = [(888, 248), (1500, 900)]
+    second_corners = [[1800, 1200], [2470, 1830]]
+
+    screen = ScreenSource(sct, screen_scale=2)
+    screen.add(first_corners)
+    screen.add(second_corners)
+    screen.grab()
+    assert len(sct.grabs) == 1
+
+    for corners in [first_corners, second_corners]:
+        view, (x, y) = screen.view(corners)
+        height, width, _ = view.shape
+        assert np.shares_memory(view, screen.frame)
+        assert (view == image[y : y + height, x : x + width]).all()
+        assert x <= corners[0][0] and x + width >= corners[1][0]
+        assert y <= corners[0][1] and y + height >= corners[1][1]
+
+
+def test_screen_source_without_boards():
+    sct = MockScreen(np.zeros((10, 10, 4), np.uint8))
+    screen = ScreenSource(sct)
+    screen.grab()
+    assert len(sct.grabs) == 0
+
+
+class MockCapture:
+    def __init__(self, device):
+        self.device = device
+        self.properties = {}
+        self.frames = 0
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        self.properties[prop] = value
+
+    def read(self):
+        self.frames += 1
+        time.sleep(0.001)
+        return True, np.full((4, 4, 3), self.frames % 256, np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+def test_camera_source():
+    """The webcam is opened once and every snapshot is its latest frame"""
+    with patch("cv2.VideoCapture", side_effect=MockCapture) as video_capture:
+        with CameraSource(device=1, width=640, fps=30) as camera:
+            first = utils.get_snapshot("physical", source=camera)
+            time.sleep(0.05)
+            second = utils.get_snapshot("physical", source=camera)
+            assert second[0, 0, 0] != first[0, 0, 0]
+            assert camera.frame_count > 1
+            assert camera.capture.properties[cv2.CAP_PROP_FRAME_WIDTH] == 640
+            assert cv2.CAP_PROP_FRAME_HEIGHT not in camera.capture.properties
+
+        assert video_capture.call_count == 1
+        assert video_capture.call_args.args == (1,)
+        assert camera.capture.released
+
+
+def test_screen_source_capture():
+    """A screenshot from capture can be used as the latest grab later"""
+    image = utils.import_image("tests/image_samples/find_stones_test_1.png")
+    sct = MockScreen(image)
+    corners = [(888, 248), (1500, 900)]
+
+    screen = ScreenSource(sct, screen_scale=2)
+    screen.add(corners)
+    frame = screen.capture()
+    assert screen.frame is None
+    screen.use(frame)
+    view, (x, y) = screen.view(corners)
+    height, width, _ = view.shape
+    assert (view == image[y : y + height, x : x + width]).all()
+
+
+def test_camera_source_settled():
+    """A single picture is only taken once the webcam has read a few frames"""
+    with patch("cv2.VideoCapture", side_effect=MockCapture):
+        with CameraSource() as camera:
+            frame = camera.settled(frames=5)
+            assert camera.frame_count >= 5
+            assert frame[0, 0, 0] >= 5
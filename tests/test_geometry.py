@@ -0,0 +1,42 @@
+from goban_irl.board import Board
+from goban_irl.geometry import get_board_geometry
+
+
+def test_geometry_is_cached():
+    """Boards with the same corners and image size share one geometry"""
+    corners = [(888, 248), (2470, 1830)]
+    geometry = get_board_geometry(corners, (2100, 2800, 3))
+    assert get_board_geometry([[888, 248], [2470, 1830]], (2100, 2800)) is geometry
+    assert get_board_geometry(corners[::-1], (2100, 2800)) is not geometry
+    assert get_board_geometry(corners, (2100, 2800), size=9) is not geometry
+
+    image = "tests/image_samples/find_stones_test_1.png"
+    board_1 = Board(image, corners)
+    board_2 = Board(image, corners)
+    assert board_1.geometry is board_2.geometry
+
+
+def test_geometry_matches_board_subimage():
+    """The geometry is built without the board_subimage
+    but should describe the same image that transform_image makes
+    """
+    cases = [
+        ("tests/image_samples/find_stones_test_1.png", [(888, 248), (2470, 1830)]),
+        ("tests/image_samples/find_stones_test_1.png", [(2000, 1000), (3000, 3000)]),
+        (
+            "tests/image_samples/real_board_1.png",
+            [(1105, 548), (2956, 559), (3669, 2305), (455, 2315)],
+        ),
+    ]
+    for image, corners in cases:
+        board = Board(image, corners)
+        height, width, _ = board.board_subimage.shape
+        assert (board.geometry.height, board.geometry.width) == (height, width)
+        assert board.intersections == board.get_intersections(board.board_subimage)
+        assert board.stone_subimage_boundaries == board.get_stone_subimage_boundaries(
+            board.board_subimage, board.intersections
+        )
+        assert board.geometry.boundaries.tolist() == [
+            [list(boundary) for boundary in row]
+            for row in board.stone_subimage_boundaries
+        ]
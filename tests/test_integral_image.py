@@ -0,0 +1,42 @@
+import cv2
+import numpy as np
+import pytest
+
+from goban_irl.integral_image import IntegralImage
+
+
+def test_means_match_crops():
+    """The mean of every plane over a rectangle should match
+    the mean of the cropped image
+    """
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(60, 80, 3), dtype=np.uint8)
+    integral = IntegralImage(image)
+    boundaries = [(0, 80, 0, 60), (5, 17, 40, 59), (79, 80, 0, 1), (10, 30, 20, 21)]
+
+    for xmin, xmax, ymin, ymax in boundaries:
+        crop = image[ymin:ymax, xmin:xmax]
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
+        box = (xmin, xmax, ymin, ymax)
+        assert integral.means("bgr", box) == pytest.approx(crop.mean(axis=(0, 1)))
+        assert integral.means("gray", box) == pytest.approx([gray.mean()])
+        assert integral.means("hsv", box) == pytest.approx(hsv.mean(axis=(0, 1)))
+
+    assert integral.means("bgr", boundaries).shape == (4, 3)
+
+
+def test_boundaries_are_clipped():
+    """Rectangles hanging off the image behave like numpy slicing"""
+    image = np.arange(4 * 5 * 3, dtype=np.uint8).reshape(4, 5, 3)
+    integral = IntegralImage(image)
+    assert integral.sums("bgr", (-3, 2, 2, 10)) == pytest.approx(
+        image[2:, :2].sum(axis=(0, 1))
+    )
+
+
+def test_tables_are_reused():
+    integral = IntegralImage(np.zeros((4, 4, 3), np.uint8))
+    assert integral.table("gray") is integral.table("gray")
+    with pytest.raises(ValueError):
+        integral.table("lab")
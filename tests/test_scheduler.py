@@ -0,0 +1,33 @@
+from goban_irl.scheduler import SCAN_DEFAULTS, ScanScheduler
+
+
+def test_boost_and_back_off():
+    """Scan fast just after a change, at fps after that,
+    and slower and slower while nothing changes
+    """
+    scheduler = ScanScheduler(
+        fps=10, boost_fps=40, idle_fps=2, boost_seconds=5, idle_seconds=20
+    )
+    scheduler.record(True, now=100)
+    assert scheduler.current_fps(now=101) == 40
+    assert scheduler.current_fps(now=110) == 10
+    assert scheduler.current_fps(now=121) == 5
+    assert scheduler.current_fps(now=141) == 2.5
+    assert scheduler.current_fps(now=500) == 2
+
+    scheduler.record(False, now=500)
+    assert scheduler.current_fps(now=500) == 2
+    scheduler.record(True, now=500)
+    assert scheduler.current_fps(now=500) == 40
+
+    assert scheduler.interval(now=510) == 0.1
+    assert abs(scheduler.interval(now=510, elapsed=0.04) - 0.06) < 1e-9
+    assert scheduler.interval(now=510, elapsed=1) == 0
+
+
+def test_from_metadata():
+    """Rates come from board metadata, with defaults for boards saved without them"""
+    scheduler = ScanScheduler.from_metadata({"delay": 0, "fps": 4, "idle_fps": 1})
+    assert scheduler.fps == 4
+    assert scheduler.idle_fps == 1
+    assert scheduler.boost_fps == SCAN_DEFAULTS["boost_fps"]
@@ -0,0 +1,95 @@
+import numpy as np
+
+from goban_irl.board import Board
+from goban_irl.state import (
+    BLACK,
+    EMPTY,
+    WHITE,
+    StateView,
+    from_sgf,
+    to_array,
+    to_strings,
+)
+
+
+def test_round_trip():
+    strings = [["black", "empty"], ["white", "empty"]]
+    array = to_array(strings)
+    assert array.dtype == np.int8
+    assert array.tolist() == [[BLACK, EMPTY], [WHITE, EMPTY]]
+    assert to_strings(array) == strings
+    assert to_array(StateView(array)) is not array
+
+
+def test_state_view_writes_through():
+    """Old code reads and writes strings, the array holds the values"""
+    array = np.zeros((19, 19), np.int8)
+    state = StateView(array)
+    state[3][15] = "black"
+    state[15][3] = "white"
+    assert array[3, 15] == BLACK and array[15, 3] == WHITE
+    assert state[3][15] == "black"
+    assert state[3][14:16] == ["empty", "black"]
+    assert len(state) == 19 and len(state[0]) == 19
+    assert [row[::-1] for row in state[::-1]][15][3] == "black"
+    assert state == to_strings(array)
+    assert state == StateView(array.copy())
+    assert state != StateView(np.zeros((19, 19), np.int8))
+
+
+def test_board_state():
+    """Boards keep an int8 state and still take a nested list of strings"""
+    board = Board()
+    assert board.state is None
+
+    board.state = [["empty"] * 19 for _ in range(19)]
+    board.state[0][0] = "white"
+    assert board.state_array.dtype == np.int8
+    assert board.state_array[0, 0] == WHITE
+    assert len(board.state_key()) == 361
+
+    other_board = Board()
+    other_board.state = board.state_array.copy()
+    assert other_board.state_key() == board.state_key()
+    other_board.state[18][18] = "black"
+    assert board.compare_to(other_board) == [(18, 18, "empty", "black")]
+
+
+def test_from_sgf():
+    """Setup stones, rectangles and moves are placed in order on the main line"""
+    sgf = (
+        "(;GM[1]SZ[9]C[a comment with \\] and (brackets)]"
+        "AB[aa][cc:dd]AW[ia]"
+        ";W[ee];B[]"
+        "(;B[ff];AE[aa](;W[gg])(;W[hh]))"
+        "(;B[ab]))"
+    )
+    state = from_sgf(sgf)
+    assert state.shape == (9, 9)
+    expected = np.zeros((9, 9), np.int8)
+    expected[2:4, 2:4] = BLACK
+    expected[0, 8] = WHITE
+    expected[4, 4] = WHITE
+    expected[5, 5] = BLACK
+    expected[6, 6] = WHITE
+    assert np.array_equal(state, expected)
+
+    assert from_sgf("(;AB[pd])").shape == (19, 19)
+    assert from_sgf("(;AB[pd])")[3, 15] == BLACK
+    assert from_sgf("(;SZ[19]B[tt])", size=13).shape == (13, 13)
+
+
+def test_from_sgf_captures():
+    """Moves capture opponent groups left without liberties, and suicides are removed"""
+    state = from_sgf("(;SZ[9];W[aa];B[ba];W[ee];B[ab])")
+    assert state[0, 0] == EMPTY
+    assert state[0, 1] == BLACK and state[1, 0] == BLACK
+
+    state = from_sgf("(;SZ[9]AW[ba][ca]AB[aa][da][bb][cb];W[hh])")
+    assert state[0, 1] == WHITE and state[0, 2] == WHITE
+    state = from_sgf("(;SZ[9]AW[ba][ca]AB[aa][da][bb];B[cb])")
+    assert (state[0, 1:3] == EMPTY).all()
+    assert state[1, 2] == BLACK
+
+    state = from_sgf("(;SZ[9]AB[ba][ab];W[aa])")
+    assert state[0, 0] == EMPTY
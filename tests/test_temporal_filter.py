@@ -0,0 +1,66 @@
+import numpy as np
+
+from goban_irl.state import BLACK, EMPTY, WHITE
+from goban_irl.temporal_filter import FILTER_DEFAULTS, TemporalFilter
+
+
+def reading(*stones, size=9):
+    state_array = np.full((size, size), EMPTY, np.int8)
+    for i, j, value in stones:
+        state_array[i, j] = value
+    return state_array
+
+
+def test_glitch_is_ignored():
+    """A change is accepted only once it has lasted for enough frames and seconds"""
+    state_filter = TemporalFilter(size=9, frames=3, seconds=0.5)
+    assert state_filter.update(reading((0, 0, WHITE)), now=0)
+    assert state_filter.state_array[0, 0] == WHITE
+
+    assert not state_filter.update(reading((0, 0, WHITE), (4, 4, BLACK)), now=0.1)
+    assert state_filter.pending
+    assert not state_filter.update(reading((0, 0, WHITE)), now=0.2)
+    assert not state_filter.pending
+
+    for now in [1, 1.1, 1.2, 1.3, 1.4]:
+        assert not state_filter.update(reading((0, 0, WHITE), (4, 4, BLACK)), now=now)
+    assert state_filter.update(reading((0, 0, WHITE), (4, 4, BLACK)), now=1.5)
+    assert np.array_equal(
+        state_filter.state_array, reading((0, 0, WHITE), (4, 4, BLACK))
+    )
+    assert not state_filter.pending
+
+
+def test_enough_frames():
+    """However long a reading lasts, it needs enough frames in a row"""
+    state_filter = TemporalFilter(size=9, frames=3, seconds=0)
+    state_filter.update(reading(), now=0)
+    assert not state_filter.update(reading((2, 3, BLACK)), now=10)
+    assert not state_filter.update(reading((2, 3, BLACK)), now=20)
+    assert state_filter.update(reading((2, 3, BLACK)), now=30)
+
+
+def test_unsure_readings():
+    """Readings too close to a cutoff never change the accepted state"""
+    state_filter = TemporalFilter(size=9, frames=1, seconds=0, min_confidence=5)
+    confidence = np.full((9, 9), 20.0)
+    state_filter.update(reading(), confidence, now=0)
+
+    confidence[1, 1] = 2
+    changed = state_filter.update(reading((1, 1, WHITE), (2, 2, BLACK)), confidence)
+    assert changed
+    assert state_filter.state_array[1, 1] == EMPTY
+    assert state_filter.state_array[2, 2] == BLACK
+    assert not state_filter.pending
+
+
+def test_from_metadata():
+    """Physical boards are filtered by default and virtual boards are not"""
+    state_filter = TemporalFilter.from_metadata({"loader_type": "physical", "size": 13})
+    assert state_filter.frames == FILTER_DEFAULTS["stable_frames"]
+    assert state_filter.seconds == FILTER_DEFAULTS["stable_seconds"]
+    assert state_filter.state_array is None
+
+    state_filter = TemporalFilter.from_metadata({"loader_type": "virtual", "size": 9})
+    state_filter.update(reading(), now=0)
+    assert state_filter.update(reading((0, 0, BLACK)), now=0)
@@ -0,0 +1,52 @@
+import json
+
+from goban_irl.timing import Timings
+
+
+def test_stage_percentiles():
+    """Percentiles come from the latest window of durations, in milliseconds"""
+    timings = Timings(window=100)
+    for milliseconds in range(200):
+        timings.record("find_state", milliseconds / 1000)
+
+    percentiles = timings.percentiles("find_state")
+    assert abs(percentiles["p50"] - 149.5) < 1e-6
+    assert abs(percentiles["p99"] - 198.01) < 1e-6
+    assert timings.summary()["stages"]["find_state"]["count"] == 200
+    assert timings.percentiles("missing") == {"p50": None, "p95": None, "p99": None}
+
+
+def test_timed_and_counters(tmp_path):
+    timings = Timings()
+
+    @timings.timed("double")
+    def double(value):
+        return 2 * value
+
+    assert double(4) == 8
+    with timings.stage("block"):
+        pass
+    timings.count("frames")
+    timings.count("dropped_frames", 3)
+
+    summary = timings.summary()
+    assert summary["stages"]["double"]["count"] == 1
+    assert summary["stages"]["block"]["count"] == 1
+    assert summary["counters"] == {"frames": 1, "dropped_frames": 3}
+    assert "double" in timings.report()
+
+    path = tmp_path / "timings.jsonl"
+    timings.dump(path)
+    timings.dump(path)
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["counters"]["dropped_frames"] == 3
+
+    timings.enabled = False
+    double(1)
+    timings.count("frames")
+    assert timings.summary()["stages"]["double"]["count"] == 1
+    assert timings.counters["frames"] == 1
+
+    timings.reset()
+    assert timings.summary()["stages"] == {}
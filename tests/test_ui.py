@@ -1,8 +1,19 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+
 import goban_irl.ui as ui
 import goban_irl.opencv_utilities as utils
 
 from goban_irl.board import Board
-from unittest.mock import patch
+from goban_irl.change_detector import ChangeDetector
+from goban_irl.frame_buffer import FrameBuffer
+from goban_irl.frame_source import ScreenSource
+from goban_irl.scheduler import ScanScheduler
+from goban_irl.timing import timings
+from unittest.mock import MagicMock, patch
 
 
 def test_print_functions(capsys):
@@ -50,6 +61,84 @@ def test_load_existing_metadata(capsys):
     assert not board_exists
 
 
+def test_load_existing_metadata_baseline(tmp_path, capsys):
+    """A measured baseline is summarised instead of printed"""
+    path = str(tmp_path / "physical.json")
+    baseline = {"check_bw": [[0.5] * 9] * 9}
+    with open(path, "w") as f:
+        json.dump(
+            {"name": "physical", "path": path, "size": 9, "baseline": baseline}, f
+        )
+    board_metadata, _ = ui.load_existing_metadata({"path": path})
+    captured = capsys.readouterr().out
+    assert "baseline = measured (9x9)\n" in captured
+    assert "0.5" not in captured
+    assert board_metadata["baseline"] == baseline
+
+
+def test_load_board_from_metadata():
+    """Given a screen scale, only grab the screen around a virtual board
+    and find the same stones and click locations as the full screenshot
+    """
+    image = utils.import_image("tests/image_samples/find_stones_test_1.png")
+    with open("sample.json") as f:
+        metadata = json.load(f)
+    metadata["detection_function"] = "check_bgr_blue"
+    metadata["cutoffs"] = [70, 150]
+
+    def grab(loader_type, sct=None, region=None, source=None):
+        if region is None:
+            return image
+        left, top = 2 * region["left"], 2 * region["top"]
+        right = left + 2 * region["width"]
+        bottom = top + 2 * region["height"]
+        return image[top:bottom, left:right]
+
+    with patch("goban_irl.opencv_utilities.get_snapshot", side_effect=grab):
+        full_board = ui.load_board_from_metadata(metadata)
+        board = ui.load_board_from_metadata(metadata, screen_scale=2)
+
+    assert board.state == full_board.state
+    assert board.board_subimage.shape == full_board.board_subimage.shape
+    assert board.offset == (868, 228)
+    assert [
+        (corner[0] + board.offset[0], corner[1] + board.offset[1])
+        for corner in board.corners
+    ] == full_board.corners
+
+
+def test_load_board_from_metadata_unchanged():
+    """Given a change detector and the previous board,
+    only update the board when the snapshot changes
+    """
+    image = utils.import_image("tests/image_samples/find_stones_test_1.png")
+    with open("sample.json") as f:
+        metadata = json.load(f)
+    metadata["detection_function"] = "check_bgr_blue"
+    metadata["cutoffs"] = [70, 150]
+    changes = ChangeDetector()
+
+    with patch("goban_irl.opencv_utilities.get_snapshot", return_value=image):
+        board = ui.load_board_from_metadata(metadata, change_detector=changes)
+        with patch.object(Board, "update") as update:
+            same_board = ui.load_board_from_metadata(
+                metadata, change_detector=changes, previous_board=board
+            )
+            assert not update.called
+        assert same_board is board
+        assert not changes.last_changed
+
+    moved_image = image.copy()
+    moved_image[1010:1070, 1650:1710] = 0
+    with patch("goban_irl.opencv_utilities.get_snapshot", return_value=moved_image):
+        new_board = ui.load_board_from_metadata(
+            metadata, change_detector=changes, previous_board=board
+        )
+        assert changes.last_changed
+        assert new_board is board
+        assert board.state[9][9] == "black"
+
+
 def test_interactive_corners(capsys):
     corners = [(0, 0), (1, 1)]
     with patch("goban_irl.opencv_utilities.get_snapshot"), patch(
@@ -88,6 +177,82 @@ def test_interactive_calibrate(capsys):
         assert len(cutoffs) == 2
 
 
+def test_interactive_baseline():
+    """The empty board baseline can be saved as JSON and read back by a Board"""
+    corners = [(888, 248), (2470, 1830)]
+    image = utils.import_image("tests/image_samples/find_stones_test_1.png")
+    with patch("goban_irl.opencv_utilities.get_snapshot", return_value=image), patch(
+        "builtins.input", return_value=""
+    ):
+        baseline = ui.interactive_baseline(corners, "physical")
+
+    baseline = json.loads(json.dumps(baseline))
+    assert len(baseline["check_bgr_blue"]) == 19
+    board = Board(image, corners, baseline=baseline)
+    assert np.ptp(board.deciding_values) < 0.1
+
+
+def test_auto_calibrate(tmp_path, capsys):
+    """The reference board's state calibrates the other board and is saved"""
+    corners = [(888, 248), (2470, 1830)]
+    image = utils.import_image("tests/image_samples/find_stones_test_1.png")
+    reference_board = Board(image, corners)
+    metadata = {
+        "name": "physical",
+        "path": str(tmp_path / "physical.json"),
+        "loader_type": "physical",
+        "flip": False,
+        "corners": corners,
+        "detection_function": "check_bgr_blue",
+        "cutoffs": [0, 0],
+        "camera": {"device": 1},
+    }
+    with patch(
+        "goban_irl.ui.load_board_from_metadata", return_value=reference_board
+    ) as load, patch(
+        "goban_irl.opencv_utilities.get_snapshot", return_value=image
+    ) as get_snapshot, patch(
+        "goban_irl.ui.CameraSource"
+    ) as camera_source:
+        new_metadata = ui.auto_calibrate(metadata, {"name": "virtual"})
+
+    camera = camera_source.return_value.__enter__.return_value
+    assert camera_source.call_args.kwargs == {"device": 1}
+    assert camera.settled.called
+    assert get_snapshot.call_args.kwargs["source"] is camera
+    assert load.call_args.kwargs["camera_source"] is camera
+
+    with open(metadata["path"]) as f:
+        assert json.load(f) == json.loads(json.dumps(new_metadata))
+    detection_function = utils.load_detection_function(
+        new_metadata["detection_function"]
+    )
+    board = Board(
+        image,
+        corners,
+        detection_function=detection_function,
+        cutoffs=new_metadata["cutoffs"],
+    )
+    assert board.state == reference_board.state
+    assert metadata["cutoffs"] == [0, 0]
+
+
+def test_open_camera():
+    """Only physical boards open a webcam, with the settings in their metadata"""
+    virtual = {"loader_type": "virtual"}
+    physical = {"loader_type": "physical", "camera": {"device": 2, "fps": 30}}
+    with patch("goban_irl.ui.CameraSource") as camera_source:
+        with ui.open_camera(virtual) as camera:
+            assert camera is None
+        assert not camera_source.called
+
+        with ui.open_camera(virtual, physical) as camera:
+            assert camera is camera_source.return_value.__enter__.return_value
+            assert camera.settled.called
+        assert camera_source.call_args.kwargs == {"device": 2, "fps": 30}
+        assert camera_source.return_value.__exit__.called
+
+
 def test_update_board_metadata_new_board(capsys):
     with patch("builtins.open") as save, patch("json.dump"), patch(
         "builtins.input", return_value=""
@@ -155,6 +320,11 @@ def test_update_handler(update, load):
         assert update.call_args.kwargs["fix_click"]
         assert not update.call_args.kwargs["fix_calibration"]
 
+    with patch("builtins.input", return_value="b"):
+        ui.update_handler({})
+        assert update.call_args.kwargs["fix_baseline"]
+        assert not update.call_args.kwargs["fix_calibration"]
+
     with patch("builtins.input", return_value="n"):
         ui.update_handler({})
         assert update.call_args.kwargs["fix_calibration"]
@@ -204,6 +374,13 @@ def test_exit_handler(fast_forward, run_app, update_handler, watch_boards):
         ui.exit_handler({}, {})
         assert fast_forward.called
 
+    with patch("builtins.input", return_value="a"), patch(
+        "goban_irl.ui.auto_calibrate", return_value={"name": "calibrated"}
+    ) as auto_calibrate:
+        ui.exit_handler({"name": "first"}, {"name": "second"})
+        assert auto_calibrate.call_args.args == ({"name": "second"}, {"name": "first"})
+        assert watch_boards.call_args.args[1] == {"name": "calibrated"}
+
 
 @patch("goban_irl.ui.click")
 def test_play_stones_odd(click):
@@ -291,20 +468,360 @@ def test_play_stones_edge_cases(click):
     assert click.call_count == 4
 
 
-def test_evaluate_state():
+def test_get_board_name():
     pass
 
 
-def test_update_all_pending():
-    pass
+@patch("goban_irl.ui.exit_handler")
+@patch("goban_irl.ui.watch_pair", new_callable=MagicMock)
+@patch("goban_irl.ui.FrameProducer")
+@patch("goban_irl.ui.FrameBuffer")
+@patch("goban_irl.ui.ScreenSource")
+@patch("goban_irl.ui.mss.mss")
+@patch("goban_irl.ui.get_scale", return_value=1)
+def test_watch_boards(
+    get_scale, mss, screen_source, frame_buffer, producer, watch_pair, exit_handler
+):
+    """Capture resources are closed whatever stops the watch"""
+    screen_source.return_value.regions = [None]
+    screen_source.return_value.capture.return_value = np.zeros((4, 4, 3), np.uint8)
+    metadata = {"loader_type": "virtual", "corners": [(0, 0), (3, 3)]}
+
+    watch_pair.side_effect = IOError("No screenshots")
+    with patch("asyncio.run", side_effect=lambda coroutine: coroutine):
+        try:
+            ui.watch_boards(metadata, metadata)
+            assert False
+        except IOError:
+            pass
+    assert producer.return_value.close.called
+    assert frame_buffer.return_value.close.called
+    assert not exit_handler.called
+
+    watch_pair.side_effect = KeyboardInterrupt
+    with patch("asyncio.run", side_effect=lambda coroutine: coroutine):
+        ui.watch_boards(metadata, metadata)
+    assert producer.return_value.close.call_count == 2
+    assert exit_handler.called
+
+
+def test_pair_reader():
+    """Boards read from frames are compared only when what they show changed"""
+    image = utils.import_image("tests/image_samples/find_stones_test_1.png")
+    width = image.shape[1]
+    moved_image = image.copy()
+    moved_image[1010:1070, 1650:1710] = 0
+    corners = [(888, 248), (2470, 1830)]
+    screen_source = ScreenSource(MagicMock(), margin=0)
+    metadata = []
+    for offset in [0, width]:
+        board_corners = [(x + offset, y) for x, y in corners]
+        screen_source.add(board_corners)
+        metadata.append(
+            {
+                "loader_type": "virtual",
+                "corners": board_corners,
+                "detection_function": "check_bgr_blue",
+                "cutoffs": [70, 150],
+                "flip": False,
+                "adapt_cutoffs": True,
+            }
+        )
+    reader = ui.PairReader(*metadata, screen_source=screen_source)
+
+    # Frames are captures of the region around both boards, like ScreenSource.capture
+    frame = np.concatenate([image, image], axis=1)[248:1830, 888:]
+    moved_frame = np.concatenate([image, moved_image], axis=1)[248:1830, 888:]
+    assert reader.read(frame) == []
+    assert reader.read(frame) is None
+    assert reader.read(moved_frame) == [(9, 9, "empty", "black")]
+    assert reader.second_board.state[9][9] == "black"
+    assert reader.read(frame, rescan=True) == []
+
+
+@patch("goban_irl.ui.load_board_from_metadata")
+def test_pair_reader_calibration_warning(load, capsys):
+    """A board whose cutoffs drifted as far as they may is reported once"""
+    state = np.zeros((9, 9), np.int8)
+    state[:2] = -1
+    state[-2:] = 1
+    boards = {}
+    scans = []
+
+    def load_board(metadata, change_detector=None, previous_board=None, **kwargs):
+        change_detector.last_changed = True
+        if metadata["name"] == "first":
+            scans.append(None)
+        board = previous_board or Board()
+        board.cutoffs = getattr(board, "cutoffs", (70, 150))
+        shift = len(scans) if metadata["name"] == "second" else 0
+        board.deciding_values = np.choose(state + 1, [30.0, 110, 190]) + shift
+        board.state_array = Board._find_regions(board.deciding_values, board.cutoffs)
+        boards[metadata["name"]] = board
+        return board
+
+    load.side_effect = load_board
+    reader = ui.PairReader(
+        {"name": "first", "size": 9, "cutoffs": (70, 150), "adapt_cutoffs": True},
+        {"name": "second", "size": 9, "cutoffs": (70, 150), "adapt_cutoffs": True},
+    )
+    for _ in range(10):
+        reader.read()
+    assert "second" not in capsys.readouterr().out
+
+    for _ in range(300):
+        reader.read()
+    out = capsys.readouterr().out
+    assert out.count("The light on second has changed too much") == 1
+    assert "(a)uto calibrate" in out
+    assert "The light on first" not in out
+
+
+def test_watch_pair_no_screenshots():
+    """When screenshots stop, the capture thread's error is reported"""
+    screen_buffer = MagicMock(dropped=0)
+    screen_buffer.latest.return_value = (None, None)
+    screen_producer = MagicMock(error=OSError("Screen went away"))
+    try:
+        asyncio.run(
+            ui.watch_pair(
+                {"name": "first", "delay": 0},
+                {"name": "second"},
+                1,
+                screen_buffer=screen_buffer,
+                screen_producer=screen_producer,
+            )
+        )
+        assert False
+    except IOError as error:
+        assert "Screen went away" in str(error)
+
+
+@patch("goban_irl.ui.load_board_from_metadata")
+def test_watch_pair_paces_capture(load):
+    """Screenshots are taken at the rate the scheduler scans at"""
+    board = Board()
+    board.state = [["empty"] * 19 for _ in range(19)]
+    load.return_value = board
+    screen_buffer = MagicMock(dropped=0)
+    screen_buffer.latest.return_value = (0, np.zeros((4, 4, 3), np.uint8))
+    rates = []
+
+    class Producer:
+        error = None
+        fps = property(lambda self: rates[-1], lambda self, fps: rates.append(fps))
+
+    screen_producer = Producer()
+    scheduler = ScanScheduler(fps=20, boost_fps=40, idle_fps=2, idle_seconds=30)
+    scheduler.last_change = time.monotonic() - 1000
+
+    async def watch():
+        await asyncio.wait_for(
+            ui.watch_pair(
+                {"name": "first", "delay": 0, "click": False},
+                {"name": "second"},
+                1,
+                screen_source=MagicMock(),
+                screen_buffer=screen_buffer,
+                screen_producer=screen_producer,
+                scheduler=scheduler,
+            ),
+            timeout=0.7,
+        )
 
+    try:
+        asyncio.run(watch())
+    except asyncio.TimeoutError:
+        pass
+    assert rates[0] == 2
+    assert rates[-1] == 40
+
+
+@patch("goban_irl.ui.load_board_from_metadata")
+def test_watch_pair_rescan(load):
+    """A screenshot written over while it was read is read again before it is used"""
+    first_board = Board()
+    second_board = Board()
+    first_board.state = [["empty"] * 19 for _ in range(19)]
+    second_board.state = [["empty"] * 19 for _ in range(19)]
+    second_board.state[3][3] = "black"
+    screen_buffer = FrameBuffer((4, 4, 3), slots=2)
+    screen_buffer.write(np.zeros((4, 4, 3), np.uint8))
+    loads = []
+    rescans = []
+
+    def load_board(metadata, change_detector=None, **kwargs):
+        loads.append(change_detector.reference is None)
+        change_detector.changed(np.zeros((4, 4, 3), np.uint8))
+        if len(loads) == 1:
+            for _ in range(2):
+                screen_buffer.write(np.zeros((4, 4, 3), np.uint8))
+        return first_board if metadata["name"] == "first" else second_board
+
+    load.side_effect = load_board
+    timings.reset()
+
+    async def watch():
+        task = asyncio.ensure_future(
+            ui.watch_pair(
+                {"name": "first", "delay": 0, "click": False},
+                {"name": "second"},
+                1,
+                screen_source=MagicMock(),
+                screen_buffer=screen_buffer,
+                scheduler=ScanScheduler(fps=50, boost_fps=50),
+            )
+        )
+        await asyncio.sleep(0.1)
+        screen_buffer.write(np.zeros((4, 4, 3), np.uint8))
+        await asyncio.sleep(0.1)
+        rescans.append(timings.counters.get("rescans", 0))
+        task.cancel()
+        screen_buffer.write(np.zeros((4, 4, 3), np.uint8))
+
+    asyncio.run(watch())
+    screen_buffer.close()
+    assert rescans == [1]
+    assert loads[:4] == [True, True, True, True]
+    assert not any(loads[4:])
+
+
+@patch("goban_irl.ui.play_stones")
+@patch("goban_irl.ui.load_board_from_metadata")
+def test_watch_pair(load, play_stones, capsys):
+    """A stone missing from the first board is played once, after its delay,
+    and a stone that comes back before its delay is never played
+    """
+    first_board = Board()
+    second_board = Board()
+    first_board.state = [["empty"] * 19 for _ in range(19)]
+    second_board.state = [["empty"] * 19 for _ in range(19)]
+    second_board.state[3][3] = "black"
+    second_board.state[4][4] = "white"
+    scans = []
+
+    def load_board(metadata, **kwargs):
+        if metadata["name"] == "first":
+            scans.append(time.time())
+            return first_board
+        if len(scans) == 3:
+            second_board.state[4][4] = "empty"
+            kwargs["change_detector"].last_changed = True
+        return second_board
+
+    def play(board, stones_to_play, up_next, screen_scale):
+        for i, j, _, stone in stones_to_play:
+            board.state[i][j] = stone
+        return "white"
+
+    load.side_effect = load_board
+    play_stones.side_effect = play
+    first_board_metadata = {"name": "first", "delay": 0.2, "click": True}
+    second_board_metadata = {"name": "second"}
+
+    async def watch():
+        await asyncio.wait_for(
+            ui.watch_pair(
+                first_board_metadata,
+                second_board_metadata,
+                1,
+                scheduler=ScanScheduler(fps=50, boost_fps=50),
+            ),
+            timeout=0.5,
+        )
 
-def test_get_board_name():
-    pass
+    try:
+        asyncio.run(watch())
+    except asyncio.TimeoutError:
+        pass
+
+    assert 5 <= len(scans) <= 26
+    assert play_stones.call_count == 1
+    board, stones_to_play, up_next, screen_scale = play_stones.call_args[0]
+    assert board is first_board
+    assert stones_to_play == [(3, 3, "empty", "black")]
+    assert up_next == "black"
+    assert "D16" in capsys.readouterr().out
+
+
+@patch("goban_irl.ui.play_stones")
+@patch("goban_irl.ui.load_board_from_metadata")
+def test_watch_pair_catch_up(load, play_stones, capsys):
+    """Many stones missing at once are left for fast_forward instead of played"""
+    first_board = Board()
+    second_board = Board()
+    first_board.state = [["empty"] * 19 for _ in range(19)]
+    second_board.state = [["empty"] * 19 for _ in range(19)]
+    for index in range(20):
+        second_board.state[index % 19][index // 19 * 2] = (
+            "black" if index % 2 else "white"
+        )
+    load.side_effect = lambda metadata, **kwargs: (
+        first_board if metadata["name"] == "first" else second_board
+    )
+    first_board_metadata = {"name": "first", "delay": 0, "click": True}
+    second_board_metadata = {"name": "second", "loader_type": "physical"}
+
+    async def watch():
+        await asyncio.wait_for(
+            ui.watch_pair(
+                first_board_metadata,
+                second_board_metadata,
+                1,
+                scheduler=ScanScheduler(fps=50, boost_fps=50),
+            ),
+            timeout=0.3,
+        )
 
+    try:
+        asyncio.run(watch())
+    except asyncio.TimeoutError:
+        pass
+
+    assert not play_stones.called
+    assert "Not playing 20 new stones at once" in capsys.readouterr().out
+
+
+@patch("goban_irl.ui.play_stones")
+@patch("goban_irl.ui.load_board_from_metadata")
+def test_watch_pairs(load, play_stones):
+    """Several pairs are watched together and each plays on its own first board"""
+    boards = {}
+    for name, stone in [("first", (3, 3)), ("third", (15, 15))]:
+        follow = "follows_" + name
+        boards[name] = Board()
+        boards[follow] = Board()
+        boards[name].state = [["empty"] * 19 for _ in range(19)]
+        boards[follow].state = [["empty"] * 19 for _ in range(19)]
+        boards[follow].state[stone[0]][stone[1]] = "black"
+    load.side_effect = lambda metadata, **kwargs: boards[metadata["name"]]
+    play_stones.side_effect = lambda board, stones, up_next, scale: "white"
+
+    pairs = [
+        {
+            "first_board_metadata": {"name": name, "delay": 0, "click": True},
+            "second_board_metadata": {"name": "follows_" + name},
+            "scheduler": ScanScheduler(fps=50, boost_fps=50),
+        }
+        for name in ["first", "third"]
+    ]
 
-def test_watch_boards():
-    pass
+    async def watch():
+        await asyncio.wait_for(ui.watch_pairs(pairs, 1), timeout=0.3)
+
+    try:
+        asyncio.run(watch())
+    except asyncio.TimeoutError:
+        pass
+
+    played = {
+        (board is boards["first"], tuple(stones))
+        for (board, stones, _, _), _ in play_stones.call_args_list
+    }
+    assert played == {
+        (True, ((3, 3, "empty", "black"),)),
+        (False, ((15, 15, "empty", "black"),)),
+    }
 
 
 def test_run_app():